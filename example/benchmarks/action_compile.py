@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+
+from universe import spaces
+from universe.envs import vnc_env
+from universe.vncdriver import vnc_client
+
+logger = logging.getLogger()
+
+class LegacyActionCompiler(object):
+    """Compiles every event afresh, and leaves the driver to pack the
+    compiled tuples each step, as VNCEnv used to. Kept here as the
+    baseline."""
+
+    def compile(self, action):
+        compiled = []
+        peek = False
+        for event in action:
+            if event == spaces.PeekReward:
+                peek = True
+                continue
+            compiled.append(vnc_env.compile_action(event))
+        return compiled, peek
+
+    def encode(self, compiled):
+        return vnc_client.encode_events(compiled)
+
+def hardcoded_actions(count):
+    """Like spaces.Hardcoded or SafeActionSpace: a fixed set of
+    actions, each pressing or releasing a few keys."""
+    keys = ['left', 'right', 'up', 'down', 'space', 'x', 'z', 'a']
+    actions = []
+    for i in range(count):
+        action = []
+        for j, key in enumerate(keys):
+            action.append(spaces.KeyEvent.by_name(key, down=bool((i >> j) & 1)))
+        actions.append(action)
+    return actions
+
+def pointer_action(rng):
+    x, y = rng.randint(0, 800, size=2)
+    return [spaces.PointerEvent(int(x), int(y), 0), spaces.PointerEvent(int(x), int(y), 1), spaces.PointerEvent(int(x), int(y), 0)]
+
+def measure(compiler, action_n_list):
+    start = time.time()
+    total = 0
+    for action_n in action_n_list:
+        for action in action_n:
+            compiled, peek = compiler.compile(action)
+            total += len(compiler.encode(compiled))
+    return (time.time() - start) / len(action_n_list), total
+
+def measure_clicks(rng, steps, remotes, arrays):
+    """Time a clicking agent making its actions, and VNCEnv compiling
+    and encoding them, with PointerEvents or with event arrays."""
+    compiler = vnc_env.ActionCompiler()
+    points = [rng.randint(0, 800, size=(remotes, 2)) for _ in range(steps)]
+    buttonmask = np.array([0, 1, 0])
+    start = time.time()
+    for xy in points:
+        if arrays:
+            action_n = spaces.pointer_events(xy[:, :1], xy[:, 1:], buttonmask)
+        else:
+            action_n = [[spaces.PointerEvent(x, y, b) for b in buttonmask.tolist()] for x, y in xy.tolist()]
+        compiled_n = [compiler.compile(action)[0] for action in action_n]
+        compiler.encode_n(compiled_n)
+    return (time.time() - start) / steps
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compiling and encoding each step\'s actions in VNCEnv.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-n', '--steps', type=int, default=5000, help='Steps to run.')
+    parser.add_argument('-r', '--remotes', type=int, default=8, help='Environments per step.')
+    parser.add_argument('-d', '--distinct', type=int, default=16, help='Distinct hardcoded actions the agent picks from.')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    rng = np.random.RandomState(0)
+    hardcoded = hardcoded_actions(args.distinct)
+    tuples = [[('KeyEvent', event.key_name, event.down) for event in action] for action in hardcoded]
+    workloads = [
+        ('{} hardcoded actions'.format(args.distinct), [[hardcoded[rng.randint(args.distinct)] for _ in range(args.remotes)] for _ in range(args.steps)]),
+        ('{} hardcoded actions, as tuples'.format(args.distinct), [[tuples[rng.randint(args.distinct)] for _ in range(args.remotes)] for _ in range(args.steps)]),
+        # A clicking agent on an 800x800 screen, which rarely repeats a point
+        ('random clicks', [[pointer_action(rng) for _ in range(args.remotes)] for _ in range(args.steps)]),
+    ]
+    for label, action_n_list in workloads:
+        legacy, legacy_bytes = measure(LegacyActionCompiler(), action_n_list)
+        cached, cached_bytes = measure(vnc_env.ActionCompiler(), action_n_list)
+        assert legacy_bytes == cached_bytes
+        print('{}:'.format(label))
+        print('  legacy: {:.1f}us/step'.format(1e6 * legacy))
+        print('  cached: {:.1f}us/step'.format(1e6 * cached))
+
+    for remotes in [args.remotes, 64]:
+        print('random clicks for {} envs, including making the actions:'.format(remotes))
+        print('  PointerEvents: {:.1f}us/step'.format(1e6 * measure_clicks(rng, args.steps // 4, remotes, arrays=False)))
+        print('  event arrays:  {:.1f}us/step'.format(1e6 * measure_clicks(rng, args.steps // 4, remotes, arrays=True)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
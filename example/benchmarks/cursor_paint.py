@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+
+from universe.spaces import vnc_event
+from universe.vncdriver import server_messages
+from universe.vncdriver.screen import NumpyScreen
+
+logger = logging.getLogger()
+
+class LegacyNumpyScreen(NumpyScreen):
+    """NumpyScreen with the float blend over the cursor's whole box we
+    used to run, kept here as the baseline."""
+
+    def _paint_cursor(self, frame):
+        if self.cursor_position is None or self.cursor_shape is None or not self._has_initial_framebuffer_update:
+            return
+
+        screen = frame.pixels
+        hotx, hoty, width, height, image, mask = self.cursor_shape
+        x, y = self.cursor_position
+
+        frame.cursor_details = (x, y, width, height)
+        frame.cursor_behind = screen[y:y+height, x:x+width, :].copy()
+        # For NumpyScreen._sync, which copies back the pixels behind
+        # the newest frame's cursor
+        rows, columns = np.indices(frame.cursor_behind.shape[:2])
+        frame.cursor_index = ((rows + y) * self._width + columns + x).ravel()
+        frame.cursor_behind = frame.cursor_behind.reshape((-1, 3))
+
+        total_h, total_w, _ = screen.shape
+        cutoff_h = min(total_h - y, height)
+        cutoff_w = min(total_w - x, width)
+        image = image[:cutoff_h, :cutoff_w]
+        mask = mask[:cutoff_h, :cutoff_w, np.newaxis]
+
+        screen[y:y+height, x:x+width, self.color_cycle] = (1 - mask)*screen[y:y+height, x:x+width, self.color_cycle] + mask*image
+
+    def _unpaint_cursor(self, frame):
+        if frame.cursor_behind is not None:
+            x, y, width, height = frame.cursor_details
+            region = frame.pixels[y:y+height, x:x+width, :]
+            region[:] = frame.cursor_behind.reshape(region.shape)
+        frame.cursor_details = None
+        frame.cursor_index = None
+        frame.cursor_behind = None
+
+def cursor_update(size):
+    """An arrow-ish cursor: a filled triangle with a one pixel outline."""
+    rows, columns = np.indices((size, size))
+    mask = (columns <= rows).astype(np.uint8)
+    image = np.zeros((size, size, 3), dtype=np.uint8)
+    image[(columns < rows - 1) & (columns > 0)] = 255
+    rectangle = server_messages.Rectangle(0, 0, size, size, server_messages.PseudoCursorEncoding(image, mask))
+    return server_messages.FramebufferUpdate([rectangle])
+
+def measure(cls, paint_cursor, width, height, size, steps):
+    screen = cls(width, height)
+    screen.set_paint_cursor(paint_cursor)
+    rng = np.random.RandomState(0)
+    background = rng.randint(0, 256, size=(height, width, 3)).astype(np.uint8)
+    rectangle = server_messages.Rectangle(0, 0, width, height, server_messages.RAWEncoding(background))
+    screen.apply(server_messages.FramebufferUpdate([rectangle]))
+    screen.apply(cursor_update(size))
+
+    positions = rng.randint(0, min(width, height) - size, size=(steps, 2))
+    start = time.time()
+    for x, y in positions:
+        # What a mouse-driven agent does each step
+        screen.apply_action(vnc_event.PointerEvent(x, y, 0))
+        screen.flip()
+    return (time.time() - start) / steps
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the per-step cost of painting the cursor into NumpyScreen observations.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-n', '--steps', type=int, default=2000, help='Pointer events to apply.')
+    parser.add_argument('-s', '--cursor-size', type=int, default=32, help='Cursor edge length.')
+    parser.add_argument('--width', type=int, default=1024, help='Screen width.')
+    parser.add_argument('--height', type=int, default=768, help='Screen height.')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    off = measure(NumpyScreen, False, args.width, args.height, args.cursor_size, args.steps)
+    on = measure(NumpyScreen, True, args.width, args.height, args.cursor_size, args.steps)
+    legacy = measure(LegacyNumpyScreen, True, args.width, args.height, args.cursor_size, args.steps)
+
+    print('cursor off:    {:.1f}us/step'.format(1e6 * off))
+    print('cursor on:     {:.1f}us/step'.format(1e6 * on))
+    print('legacy cursor: {:.1f}us/step'.format(1e6 * legacy))
+    print('cursor cost:   {:.1f}us/step (legacy {:.1f}us/step)'.format(1e6 * (on - off), 1e6 * (legacy - off)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
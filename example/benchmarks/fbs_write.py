@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+import argparse
+import io
+import json
+import logging
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from universe.vncdriver import fbs_writer
+
+logger = logging.getLogger()
+
+class SlowFileIO(io.FileIO):
+    """A file whose writes take at least `latency` seconds, like a busy
+    disk or a network filesystem."""
+
+    latency = 0
+
+    def write(self, data):
+        time.sleep(self.latency)
+        return super(SlowFileIO, self).write(data)
+
+def open_file(path, mode='wb'):
+    raw = SlowFileIO(path, mode)
+    return io.BufferedWriter(raw)
+
+class LegacyFBSWriter(object):
+    """The FBSWriter we used to run, which writes each chunk from the
+    calling thread in three unbuffered writes, kept here as the
+    baseline."""
+
+    def __init__(self, path):
+        self.start = None
+        self.stop = None
+        self.file = open_file(path)
+        self.file.write(b'FBS 001.002\n')
+
+    def write(self, data):
+        if not data:
+            return
+
+        if self.start is not None:
+            delta = int(1000 * (time.time() - self.start))
+        else:
+            delta = 0
+            self.start = time.time()
+            self.file.write(json.dumps({'start': self.start}).encode('utf-8'))
+            self.file.write(b'\n')
+
+        self.file.write(struct.pack('!I', len(data)))
+        self.file.write(data)
+        self.file.write(struct.pack('!I', delta))
+
+    def close(self):
+        self.stop = time.time()
+        self.file.write(struct.pack('!I', 0))
+        self.file.write(json.dumps({'stop': self.stop}).encode('utf-8'))
+        self.file.write(b'\n')
+        self.file.close()
+
+def measure(create, path, chunks):
+    """Returns the time spent in write() calls (what the reactor pays),
+    and the total including close()."""
+    writer = create(path)
+    start = time.time()
+    for chunk in chunks:
+        writer.write(chunk)
+    written = time.time()
+    writer.close()
+    return written - start, time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark FBSWriter throughput against the unbuffered writer we used to run.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-n', '--chunks', type=int, default=100000, help='Chunks to write.')
+    parser.add_argument('-s', '--chunk-size', type=int, default=64, help='Mean chunk size in bytes (VNC client traffic is mostly small events).')
+    parser.add_argument('-l', '--write-latency', type=float, default=0, help='Milliseconds each write to the OS should take.')
+    parser.add_argument('-d', '--directory', help='Where to write (defaults to a temporary directory).')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    SlowFileIO.latency = args.write_latency / 1000.
+    # Have FBSWriter open its file the way we do
+    fbs_writer.open = open_file
+
+    rng = np.random.RandomState(0)
+    sizes = rng.randint(1, 2 * args.chunk_size, size=args.chunks)
+    payload = rng.randint(0, 256, size=2 * args.chunk_size).astype(np.uint8).tobytes()
+    chunks = [payload[:size] for size in sizes]
+    total = sum(len(chunk) for chunk in chunks)
+
+    directory = args.directory or tempfile.mkdtemp()
+    try:
+        for name, create in [('legacy', LegacyFBSWriter), ('buffered', fbs_writer.FBSWriter)]:
+            path = os.path.join(directory, name + '.fbs')
+            calls, overall = measure(create, path, chunks)
+            print('{:9} {:.2f}us/write in caller, {:.1f}MB/s overall ({:.3f}s)'.format(
+                name + ':', 1e6 * calls / len(chunks), total / overall / 1e6, overall))
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
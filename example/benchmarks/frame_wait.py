@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import sys
+import threading
+import time
+
+import numpy as np
+
+from universe.vncdriver import server_messages
+from universe.vncdriver.screen import NumpyScreen
+
+logger = logging.getLogger()
+
+def producer(screen, fps, frames, published):
+    """Apply a small update every 1/fps seconds, recording when each
+    was published."""
+    pixels = np.ones((8, 8, 3), dtype=np.uint8)
+    update = server_messages.FramebufferUpdate([server_messages.Rectangle(0, 0, 8, 8, server_messages.RAWEncoding(pixels))])
+    for _ in range(frames):
+        time.sleep(1. / fps)
+        published.append(time.time())
+        screen.apply(update)
+
+def measure(fps, frames, wait):
+    """Consume frames as an agent would, either polling flip() every
+    16ms (as Throttle does) or waiting for each frame. Returns the
+    mean latency from publish to flip, and flips per frame."""
+    screen = NumpyScreen(64, 64)
+    published = []
+    thread = threading.Thread(target=producer, args=(screen, fps, frames, published))
+    thread.start()
+
+    latencies = []
+    flips = 0
+    seen = 0
+    while thread.is_alive() or screen.has_new_frame():
+        if wait:
+            screen.wait_for_frame(timeout=0.1)
+        else:
+            time.sleep(0.016)
+        _, info = screen.flip()
+        flips += 1
+        version = info['vnc_session.frame_version']
+        if version > seen:
+            latencies.append(time.time() - published[version - 1])
+            seen = version
+    thread.join()
+    return np.mean(latencies), flips / float(frames)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark waiting for new frames against polling for them.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-f', '--fps', type=float, default=20, help='Rate the server sends frames at.')
+    parser.add_argument('-n', '--frames', type=int, default=100, help='Frames to send.')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    for label, wait in [('poll every 16ms', False), ('wait for frame', True)]:
+        latency, flips = measure(args.fps, args.frames, wait)
+        print('{:16} {:.2f}ms latency, {:.2f} flips/frame'.format(label + ':', 1e3 * latency, flips))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+
+from universe.vncdriver import server_messages
+from universe.vncdriver.screen import NumpyScreen, ObservationBuffer
+
+logger = logging.getLogger()
+
+def measure(n, width, height, patch, steps, buffers):
+    """Per-step cost of batching n screens' observations, with np.stack
+    (buffers=0) or an ObservationBuffer, when each screen changes by
+    one patch a step."""
+    rng = np.random.RandomState(0)
+    screens = [NumpyScreen(width, height) for _ in range(n)]
+    pixels = rng.randint(0, 256, size=(patch, patch, 3)).astype(np.uint8)
+    positions = rng.randint(0, min(width, height) - patch, size=(steps, n, 2))
+    buffer = ObservationBuffer(n, count=buffers) if buffers else None
+
+    elapsed = 0
+    for step in range(steps):
+        for screen, (x, y) in zip(screens, positions[step]):
+            rectangle = server_messages.Rectangle(x, y, patch, patch, server_messages.RAWEncoding(pixels))
+            screen.apply(server_messages.FramebufferUpdate([rectangle]))
+
+        start = time.time()
+        observation_n = []
+        damage_n = []
+        for screen in screens:
+            observation, info = screen.flip()
+            observation_n.append(observation)
+            damage_n.append(info['vnc_session.damage'])
+        if buffer is None:
+            batch = np.stack(observation_n)
+        else:
+            batch = buffer.update(observation_n, damage_n)
+        elapsed += time.time() - start
+    return elapsed / steps
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batching observations into one (n, height, width, 3) array.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-n', '--screens', type=int, default=32, help='Screens to batch.')
+    parser.add_argument('-s', '--steps', type=int, default=100, help='Steps to run.')
+    parser.add_argument('-p', '--patch', type=int, default=64, help='Edge length of the region which changes on each screen per step.')
+    parser.add_argument('--width', type=int, default=800, help='Screen width.')
+    parser.add_argument('--height', type=int, default=600, help='Screen height.')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    stacked = measure(args.screens, args.width, args.height, args.patch, args.steps, 0)
+    single = measure(args.screens, args.width, args.height, args.patch, args.steps, 1)
+    double = measure(args.screens, args.width, args.height, args.patch, args.steps, 2)
+    print('np.stack:         {:.2f}ms/step'.format(1e3 * stacked))
+    print('one buffer:       {:.2f}ms/step'.format(1e3 * single))
+    print('double-buffered:  {:.2f}ms/step'.format(1e3 * double))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
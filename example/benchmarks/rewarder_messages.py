@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import resource
+import sys
+import threading
+import time
+
+from autobahn.twisted import websocket
+
+from universe import twisty
+from universe.rewarder import framing, remote, reward_buffer, rewarder_client
+from universe.twisty import reactor
+
+logger = logging.getLogger()
+
+def cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+class BenchmarkRewarder(remote.RewarderProtocol):
+    """A rewarder which sends its factory's messages as soon as a
+    client connects, without the password and agent connection of
+    one inside an environment."""
+
+    def onConnect(self, request):
+        self._message_id = 0
+        self._request = request
+        self._binary = framing.BINARY_PROTOCOL in request.protocols
+        if self._binary:
+            return framing.BINARY_PROTOCOL
+
+    def onOpen(self):
+        for method, body, headers in self.factory.messages:
+            self.send_message(method, body, headers)
+
+    def onMessage(self, payload, isBinary):
+        pass
+
+    def onClose(self, wasClean, code, reason):
+        pass
+
+class CountingClient(rewarder_client.RewarderClient):
+    def onMessage(self, payload, isBinary):
+        super(CountingClient, self).onMessage(payload, isBinary)
+        self.factory.received += 1
+        if self.factory.received == self.factory.expected:
+            self.factory.done.set()
+
+class ClientFactory(object):
+    """What RewarderClient needs of its factory, for running it
+    without a connection."""
+    label = '0'
+
+    def __init__(self):
+        self.reward_buffer = reward_buffer.RewardBuffer('0')
+
+    def record_error(self, e):
+        raise e
+
+def make_messages(kind, count):
+    messages = []
+    for i in range(count):
+        if kind == 'reward':
+            messages.append(('v0.env.reward', {'reward': i % 3, 'done': False, 'info': {}}, {'episode_id': '1'}))
+        elif kind == 'reward+info':
+            messages.append(('v0.env.reward', {'reward': i % 3, 'done': False, 'info': {'rewarder.lag.observation': 0.002, 'rewarder.lag.observation.timestamp': time.time()}}, {'episode_id': '1'}))
+        else:
+            messages.append(('v0.env.observation', {'observation': {'text': [], 'score': i}}, {'episode_id': '1'}))
+    return messages
+
+def measure_ends(messages, binary):
+    """CPU per message to send (on the rewarder) and to receive (on
+    the agent), without the websocket in between."""
+    server = BenchmarkRewarder()
+    server._message_id = 0
+    server._binary = binary
+    frames = []
+    server.sendMessage = lambda payload, isBinary: frames.append((payload, isBinary))
+    start = cpu()
+    for method, body, headers in messages:
+        server.send_message(method, body, headers)
+    send = (cpu() - start) / len(messages)
+
+    client = rewarder_client.RewarderClient()
+    client.factory = ClientFactory()
+    client.reward_buffer = client.factory.reward_buffer
+    client._requests = {}
+    start = cpu()
+    for payload, isBinary in frames:
+        client.onMessage(payload, isBinary)
+    recv = (cpu() - start) / len(messages)
+    return send, recv, sum(len(payload) for payload, _ in frames) / len(frames)
+
+def measure_connection(messages, binary, port):
+    """Messages per second, and CPU per message for both ends
+    together, over a websocket on localhost."""
+    server_factory = websocket.WebSocketServerFactory()
+    server_factory.protocol = BenchmarkRewarder
+    server_factory.messages = messages
+
+    client_factory = websocket.WebSocketClientFactory('ws://127.0.0.1:{}'.format(port), protocols=[framing.BINARY_PROTOCOL] if binary else [])
+    client_factory.protocol = CountingClient
+    client_factory.label = '0'
+    client_factory.reward_buffer = reward_buffer.RewardBuffer('0')
+    client_factory.received = 0
+    client_factory.expected = len(messages)
+    client_factory.done = threading.Event()
+
+    listening = []
+    def listen():
+        listening.append(reactor.listenTCP(port, server_factory, interface='127.0.0.1'))
+        reactor.connectTCP('127.0.0.1', port, client_factory)
+    start = time.time()
+    start_cpu = cpu()
+    reactor.callFromThread(listen)
+    if not client_factory.done.wait(60):
+        raise Exception('Only received {} of {} messages'.format(client_factory.received, len(messages)))
+    elapsed = time.time() - start
+    used = cpu() - start_cpu
+    reactor.callFromThread(listening[0].stopListening)
+    return len(messages) / elapsed, used / len(messages)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sending rewarder messages as JSON and as binary frames.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-n', '--messages', type=int, default=50000, help='Messages to send.')
+    parser.add_argument('-p', '--port', type=int, default=25950, help='Port for the rewarder to listen on.')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+        reward_buffer.extra_logger.setLevel(logging.WARN)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    twisty.start_once()
+    port = args.port
+    print('{:12} {:7} {:>9} {:>12} {:>12} {:>12} {:>14}'.format('messages', 'frames', 'bytes', 'send us', 'recv us', 'msgs/s', 'cpu us/msg'))
+    for kind in ['reward', 'reward+info', 'observation']:
+        messages = make_messages(kind, args.messages)
+        for binary in [False, True]:
+            send, recv, size = measure_ends(messages, binary)
+            rate, used = measure_connection(messages, binary, port)
+            port += 1
+            print('{:12} {:7} {:>9.1f} {:>12.2f} {:>12.2f} {:>12.0f} {:>14.2f}'.format(kind, 'binary' if binary else 'json', size, 1e6 * send, 1e6 * recv, rate, 1e6 * used))
+            sys.stdout.flush()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+
+from universe import utils
+from universe.vncdriver import vnc_client, vnc_session
+
+logger = logging.getLogger()
+
+class LegacyVNCSession(vnc_session.VNCSession):
+    """VNCSession with the one-write-per-event _step we used to run,
+    kept here as the baseline."""
+
+    def _step(self, action_d):
+        for name, events in action_d.items():
+            client = self._factories[name].client
+            try:
+                for event in events:
+                    if event[0] == 'KeyEvent':
+                        key, down = event[1:]
+                        client.send_KeyEvent(key, down)
+                    elif event[0] == 'PointerEvent':
+                        x, y, buttomask = event[1:]
+                        client.send_PointerEvent(x, y, buttomask)
+            except Exception as e:
+                self._factories[name].error_buffer.record(e)
+
+class CountingTransport(object):
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+
+def session(cls, remotes):
+    # Skip connecting: we only drive _step
+    session = cls.__new__(cls)
+    session._encoded = utils.LRUCache(vnc_session.ENCODED_CACHE_SIZE)
+    session._names = [str(i) for i in range(remotes)]
+    session._factories = {}
+    for name in session._names:
+        client = vnc_client.VNCClient()
+        client.transport = CountingTransport()
+        session._factories[name] = vnc_client.client_factory(None, utils.ErrorBuffer())
+        session._factories[name].client = client
+    return session
+
+def actions(rng, steps, remotes, events, distinct):
+    """Each step, every remote gets one of `distinct` sequences of
+    `events` events (or a fresh random one, if distinct is 0)."""
+    def sequence():
+        sequence = []
+        for _ in range(events // 2):
+            x, y = rng.randint(0, 800, size=2)
+            sequence.append(('PointerEvent', int(x), int(y), 0))
+            sequence.append(('KeyEvent', int(rng.randint(0x20, 0x7f)), bool(rng.randint(2))))
+        return sequence
+
+    if distinct:
+        pool = [sequence() for _ in range(distinct)]
+        return [{str(i): pool[rng.randint(distinct)] for i in range(remotes)} for _ in range(steps)]
+    else:
+        return [{str(i): sequence() for i in range(remotes)} for _ in range(steps)]
+
+def measure(cls, action_d_list, remotes):
+    s = session(cls, remotes)
+    start = time.time()
+    for action_d in action_d_list:
+        s._step(action_d)
+    elapsed = time.time() - start
+    for factory in s._factories.values():
+        factory.error_buffer.check()
+    writes = sum(factory.client.transport.writes for factory in s._factories.values())
+    return elapsed / len(action_d_list), writes / float(len(action_d_list))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark encoding and writing each step\'s actions in the Python VNC driver.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-n', '--steps', type=int, default=2000, help='Steps to run.')
+    parser.add_argument('-r', '--remotes', type=int, default=8, help='Connections per session.')
+    parser.add_argument('-e', '--events', type=int, default=20, help='Events per connection per step.')
+    parser.add_argument('-d', '--distinct', type=int, default=16, help='Distinct event sequences the agent picks from (0 for all different).')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    rng = np.random.RandomState(0)
+    for distinct in [args.distinct, 0]:
+        action_d_list = actions(rng, args.steps, args.remotes, args.events, distinct)
+        legacy, legacy_writes = measure(LegacyVNCSession, action_d_list, args.remotes)
+        batched, batched_writes = measure(vnc_session.VNCSession, action_d_list, args.remotes)
+        label = '{} distinct sequences'.format(distinct) if distinct else 'all sequences different'
+        print('{}:'.format(label))
+        print('  legacy:  {:.1f}us/step, {:.1f} writes/step'.format(1e6 * legacy, legacy_writes))
+        print('  batched: {:.1f}us/step, {:.1f} writes/step'.format(1e6 * batched, batched_writes))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
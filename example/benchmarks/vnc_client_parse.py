@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import struct
+import sys
+import time
+
+import numpy as np
+
+from universe import utils
+from universe.vncdriver import constants, fbs_reader, vnc_client
+
+logger = logging.getLogger()
+
+class LegacyVNCClient(vnc_client.VNCClient):
+    """VNCClient with the join-then-slice flush we used to run, kept
+    here as the baseline."""
+
+    def __init__(self):
+        super(LegacyVNCClient, self).__init__()
+        self.chunks = []
+        self.chunks_len = 0
+
+    def dataReceived(self, data):
+        self.chunks.append(data)
+        self.chunks_len += len(data)
+        self.flush()
+
+    def flush(self):
+        if self.chunks_len < self.expected_len:
+            return
+
+        buffer = b''.join(self.chunks)
+        while len(buffer) >= self.expected_len:
+            block, buffer = buffer[:self.expected_len], buffer[self.expected_len:]
+            if not self.handle(self.expected, block):
+                buffer = block + buffer
+                break
+
+        self.chunks[:] = [buffer]
+        self.chunks_len = len(buffer)
+
+def synthetic_stream(width, height, updates, rectangles, size):
+    """An RFB 3.3 server stream with no authentication, followed by
+    framebuffer updates made of many small RAW rectangles."""
+    pixel_format = struct.pack('!BBBBHHHBBBxxx', 32, 24, 0, 1, 255, 255, 255, 0, 8, 16)
+    name = b'benchmark'
+    chunks = [b'RFB 003.003\n', struct.pack('!I', 1),
+              struct.pack('!HH16sI', width, height, pixel_format, len(name)) + name]
+
+    rng = np.random.RandomState(0)
+    for _ in range(updates):
+        update = [struct.pack('!BxH', 0, rectangles)]
+        for _ in range(rectangles):
+            x = rng.randint(0, width - size)
+            y = rng.randint(0, height - size)
+            update.append(struct.pack('!HHHHi', x, y, size, size, constants.RAW_ENCODING))
+            update.append(rng.randint(0, 256, size=size * size * 4).astype(np.uint8).tobytes())
+        chunks.append(b''.join(update))
+    return chunks
+
+def recorded_stream(path):
+    return [data for data, timestamp in fbs_reader.FBSReader(path)]
+
+def rechunk(chunks, chunk_size):
+    if chunk_size is None:
+        return chunks
+    data = b''.join(chunks)
+    return [data[i:i+chunk_size] for i in range(0, len(data), chunk_size)]
+
+def replay(cls, chunks):
+    error_buffer = utils.ErrorBuffer()
+    client = cls()
+    client.factory = vnc_client.client_factory(None, error_buffer)
+    client.factory.label = 'benchmark'
+    client.transport = None
+
+    start = time.time()
+    for chunk in chunks:
+        client.dataReceived(chunk)
+    delta = time.time() - start
+
+    error_buffer.check()
+    return delta
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark VNCClient parsing by replaying a server stream.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-f', '--fbs', default=None, help='Replay this server.fbs recording (as written by vnc_recorder) instead of a synthetic stream.')
+    parser.add_argument('-c', '--chunk-size', type=int, default=None, help='Re-chunk the stream into reads of this many bytes (default: as recorded).')
+    parser.add_argument('-u', '--updates', type=int, default=10, help='Synthetic framebuffer updates.')
+    parser.add_argument('-r', '--rectangles', type=int, default=2000, help='Synthetic rectangles per update.')
+    parser.add_argument('-s', '--size', type=int, default=16, help='Synthetic rectangle edge length.')
+    parser.add_argument('--skip-legacy', action='store_true', help='Only time the current parser.')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    if args.fbs:
+        chunks = recorded_stream(args.fbs)
+    else:
+        chunks = synthetic_stream(1024, 768, args.updates, args.rectangles, args.size)
+    chunks = rechunk(chunks, args.chunk_size)
+    total = sum(len(chunk) for chunk in chunks)
+    print('Replaying {} bytes in {} reads'.format(total, len(chunks)))
+
+    current = replay(vnc_client.VNCClient, chunks)
+    print('current: {:.3f}s ({:.1f} MB/s)'.format(current, total / current / 1e6))
+    if not args.skip_legacy:
+        legacy = replay(LegacyVNCClient, chunks)
+        print('legacy:  {:.3f}s ({:.1f} MB/s)'.format(legacy, total / legacy / 1e6))
+        print('speedup: {:.1f}x'.format(legacy / current))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
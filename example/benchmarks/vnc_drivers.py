@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+import argparse
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from universe import utils
+from universe.envs import vnc_env
+
+logger = logging.getLogger()
+
+DRIVERS = ['py', 'go', 'libvnc']
+
+def available(driver):
+    try:
+        if driver == 'libvnc':
+            import libvncdriver
+            return hasattr(libvncdriver, 'VNCSession')
+        vnc_env.vnc_session(driver)
+        return True
+    except ImportError:
+        return False
+
+def rss():
+    # Resident set size, in bytes
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+def cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+class LibVNCAdapter(object):
+    """Gives LibVNCSession (which connects to a fixed list of remotes)
+    the step() of the other drivers."""
+
+    def __init__(self, addresses, encoding):
+        from universe.vncdriver import libvnc_session
+        self.names = [str(i) for i in range(len(addresses))]
+        self.session = libvnc_session.LibVNCSession(addresses, utils.ErrorBuffer(), encoding=encoding)
+
+    def step(self, action_d):
+        observation_n, info_n = self.session.flip()
+        return dict(zip(self.names, observation_n)), dict(zip(self.names, info_n)), {}
+
+    def close(self):
+        self.session.close()
+
+def connect(driver, addresses, encoding, decode_threads):
+    if driver == 'libvnc':
+        return LibVNCAdapter(addresses, encoding)
+    cls = vnc_env.vnc_session(driver)
+    if driver == 'py':
+        session = cls(decode_threads=decode_threads)
+    else:
+        session = cls()
+    for i, address in enumerate(addresses):
+        session.connect(name=str(i), address=address, password='openai', encoding=encoding, start_timeout=10)
+    return session
+
+def measure(driver, addresses, seconds, encoding, decode_threads):
+    """Connect one session to every address, and step it as fast as
+    frames arrive (or every 5ms, for drivers which can't wait)."""
+    before = rss()
+    session = connect(driver, addresses, encoding, decode_threads)
+    try:
+        deadline = time.time() + 30
+        while True:
+            observation_d, info_d, err_d = session.step({})
+            if err_d:
+                raise Exception('Connection failed: {}'.format(err_d))
+            if len(observation_d) == len(addresses) and all(observation is not None for observation in observation_d.values()):
+                break
+            if time.time() > deadline:
+                raise Exception('Timed out connecting')
+            time.sleep(0.01)
+        memory = rss() - before
+
+        wait = getattr(session, 'wait_for_frame', None)
+        frames = 0
+        latencies = []
+        start_cpu = cpu()
+        start = time.time()
+        while time.time() - start < seconds:
+            if wait is not None:
+                wait(timeout=0.1)
+            else:
+                time.sleep(0.005)
+            step_start = time.time()
+            observation_d, info_d, err_d = session.step({})
+            latencies.append(time.time() - step_start)
+            frames += sum(info.get('stats.vnc.updates.n', 0) for info in info_d.values())
+        elapsed = time.time() - start
+        used = cpu() - start_cpu
+    finally:
+        session.close()
+
+    return {
+        'driver': driver,
+        'n': len(addresses),
+        'frames_per_s': frames / elapsed,
+        'cpu_ms_per_frame': 1e3 * used / max(frames, 1),
+        'flip_p50_ms': 1e3 * np.percentile(latencies, 50),
+        'flip_p99_ms': 1e3 * np.percentile(latencies, 99),
+        'memory_mb_per_connection': memory / len(addresses) / 2.**20,
+    }
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the VNC drivers against the same fake VNC servers.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-d', '--drivers', default=','.join(DRIVERS), help='Drivers to compare, where installed.')
+    parser.add_argument('-n', '--connections', default='1,2,4,8,16,32,64', help='Connection counts to measure.')
+    parser.add_argument('-s', '--seconds', type=float, default=5, help='How long to measure each run.')
+    parser.add_argument('-f', '--fps', type=float, default=30, help='Rate each server changes its screen at.')
+    parser.add_argument('-e', '--encoding', default='zrle', help='Encoding for the drivers to ask for.')
+    parser.add_argument('-t', '--decode-threads', type=int, default=None, help='Decode threads for the Python driver.')
+    parser.add_argument('-p', '--port', type=int, default=25900, help='Port of the first fake server.')
+    parser.add_argument('--servers-per-process', type=int, default=4, help='Fake servers to run in each server process.')
+    parser.add_argument('--width', type=int, default=320, help='Screen width.')
+    parser.add_argument('--height', type=int, default=240, help='Screen height.')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.WARN)
+        logging.getLogger('universe').setLevel(logging.WARN)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    if args.worker is not None:
+        # Measure one driver in a process of its own, so memory and
+        # CPU are just its own
+        driver, n = args.worker.split(':')
+        addresses = ['127.0.0.1:{}'.format(args.port + i) for i in range(int(n))]
+        print(json.dumps(measure(driver, addresses, args.seconds, args.encoding, args.decode_threads)))
+        return 0
+
+    drivers = [driver for driver in args.drivers.split(',') if driver]
+    for driver in drivers:
+        if not available(driver):
+            print('Skipping the {} driver, which is not installed'.format(driver))
+    drivers = [driver for driver in drivers if available(driver)]
+    counts = [int(n) for n in args.connections.split(',')]
+
+    # The servers get processes of their own, so they don't compete
+    # with the drivers (or, much, each other). They serve the same
+    # content to every driver.
+    servers = []
+    for first in range(0, max(counts), args.servers_per_process):
+        servers.append(subprocess.Popen([
+            sys.executable, '-m', 'universe.vncdriver.fake_server', '-p', str(args.port + first),
+            '-n', str(min(args.servers_per_process, max(counts) - first)),
+            '-f', str(args.fps), '--width', str(args.width), '--height', str(args.height), '-e', args.encoding,
+        ]))
+    try:
+        wait_for_port(args.port + max(counts) - 1)
+        print('{:8} {:>4} {:>10} {:>14} {:>9} {:>9} {:>12}'.format('driver', 'n', 'frames/s', 'cpu ms/frame', 'p50 ms', 'p99 ms', 'MB/conn'))
+        for n in counts:
+            for driver in drivers:
+                command = [sys.executable, __file__, '--worker', '{}:{}'.format(driver, n), '-p', str(args.port), '-s', str(args.seconds), '-e', args.encoding]
+                if args.decode_threads:
+                    command += ['-t', str(args.decode_threads)]
+                output = subprocess.check_output(command, env=dict(os.environ, UNIVERSE_VNCDRIVER=driver))
+                result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+                print('{driver:8} {n:>4} {frames_per_s:>10.1f} {cpu_ms_per_frame:>14.2f} {flip_p50_ms:>9.2f} {flip_p99_ms:>9.2f} {memory_mb_per_connection:>12.2f}'.format(**result))
+                sys.stdout.flush()
+    finally:
+        for process in servers:
+            process.terminate()
+            process.wait()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
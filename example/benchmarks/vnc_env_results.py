@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+
+from universe.envs import vnc_env
+from universe.vectorized import columns
+
+logger = logging.getLogger()
+
+class LegacyMask(object):
+    """Mask as it was, going through the environments one at a time
+    in Python. Kept here as the baseline (without its logging)."""
+
+    def __init__(self, n):
+        self.episode_ids = [None] * n
+        self.mask = [None] * n
+
+    def maintain_mask(self, done_n, info_n):
+        for i, ok in enumerate(self.mask):
+            if info_n[i].get('peek'):
+                env_state = info_n[i].get('env_status.peek.env_state', 'resetting')
+                episode_id = info_n[i].get('env_status.peek.episode_id')
+            else:
+                env_state = info_n[i].get('env_status.env_state', 'resetting')
+                episode_id = info_n[i].get('env_status.episode_id')
+
+            assert not ok or self.episode_ids[i] is not None or done_n[i] is None
+            if not ok and env_state == 'running':
+                self.mask[i] = True
+                self.episode_ids[i] = episode_id
+            elif ok and self.episode_ids[i] != episode_id and env_state == 'running':
+                self.episode_ids[i] = episode_id
+            elif ok and self.episode_ids[i] != episode_id:
+                self.mask[i] = False
+                self.episode_ids[i] = episode_id
+        return self.mask
+
+    def apply_to_actions(self, action_n, info_n, mask):
+        for i, ok in enumerate(mask):
+            if ok:
+                continue
+            action_n[i] = []
+            info_n[i]['mask.masked.action'] = True
+        return self.mask
+
+    def apply_to_return(self, observation_n, reward_n, done_n, info_n, observation_mask):
+        for i, ok in enumerate(observation_mask):
+            if ok:
+                continue
+            observation_n[i] = None
+            info_n[i]['mask.masked.observation'] = True
+
+def make_steps(rng, n, steps):
+    """What the rewarder and VNC session hand VNCEnv each step: every
+    environment running, with one in 100 steps resetting."""
+    episode_ids = np.zeros(n, dtype=int)
+    resetting = np.zeros(n, dtype=bool)
+    result = []
+    for _ in range(steps):
+        done = rng.rand(n) < 0.01
+        episode_ids[resetting] += 1
+        resetting = done
+        info_n = []
+        for i in range(n):
+            info_n.append({
+                'env_status.env_state': 'resetting' if resetting[i] else 'running',
+                'env_status.episode_id': str(episode_ids[i]),
+                'stats.reward.count': int(rng.randint(2)),
+                'stats.vnc.updates.n': 1,
+                'stats.vnc.updates.rectangles': 4,
+                'stats.vnc.updates.pixels': 1000,
+                'stats.vnc.updates.bytes': 500,
+            })
+        result.append((rng.rand(n).tolist(), done.tolist(), info_n))
+    return result
+
+def measure(steps, n, arrays):
+    """Time masking a step's results and getting them to a learner as
+    arrays: its rewards, dones, and VNC update and reward counts."""
+    mask = vnc_env.Mask([str(i) for i in range(n)]) if arrays else LegacyMask(n)
+    start = time.time()
+    for reward_n, done_n, info_n in steps:
+        info_n = [dict(info) for info in info_n]
+        if arrays:
+            reward_n = np.array(reward_n, dtype=np.float64)
+            done_n = np.array(done_n, dtype=bool)
+        observation_n = [{'text': []} for _ in range(n)]
+        action_n = [[] for _ in range(n)]
+
+        ok = mask.maintain_mask(done_n, info_n)
+        mask.apply_to_actions(action_n, info_n, ok)
+        mask.apply_to_return(observation_n, reward_n, done_n, info_n, ok)
+
+        if arrays:
+            stats = columns.pop(info_n, columns.ENV_STATS)
+        else:
+            # What a learner does with lists
+            reward_n = np.array(reward_n, dtype=np.float64)
+            done_n = np.array(done_n, dtype=bool)
+            stats = {key: np.array([info.get(key, np.nan) for info in info_n], dtype=np.float64) for key in columns.ENV_STATS}
+    return (time.time() - start) / len(steps)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the per-step bookkeeping VNCEnv does on its results, with and without result_arrays.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-s', '--steps', type=int, default=2000, help='Steps to run.')
+    parser.add_argument('-n', '--remotes', default='1,8,64,256', help='Environment counts to measure.')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+        vnc_env.extra_logger.setLevel(logging.WARN)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    rng = np.random.RandomState(0)
+    print('{:>5} {:>12} {:>12}'.format('n', 'lists us', 'arrays us'))
+    for n in [int(n) for n in args.remotes.split(',')]:
+        steps = make_steps(rng, n, args.steps)
+        legacy = measure(steps, n, arrays=False)
+        arrays = measure(steps, n, arrays=True)
+        print('{:>5} {:>12.1f} {:>12.1f}'.format(n, 1e6 * legacy, 1e6 * arrays))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
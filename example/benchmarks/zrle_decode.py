@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import struct
+import sys
+import timeit
+
+import numpy as np
+from six import BytesIO
+
+from universe.vncdriver import server_messages
+
+logger = logging.getLogger()
+
+def bits_for(palette_size):
+    if palette_size > 4:
+        return 4
+    elif palette_size > 2:
+        return 2
+    else:
+        return 1
+
+def encode_packed_palette_tile(idx, palette, palette_size):
+    bits = bits_for(palette_size)
+    packed = bytearray()
+    for row in idx:
+        b = 0
+        nbits = 0
+        for value in row:
+            b = (b << bits) | int(value)
+            nbits += bits
+            if nbits == 8:
+                packed.append(b)
+                b = 0
+                nbits = 0
+        if nbits > 0:
+            packed.append(b << (8 - nbits))
+    return struct.pack('!B', palette_size) + palette.tobytes() + bytes(packed)
+
+def legacy_read_packed_palette_tile(tile, buf, tile_width, tile_height):
+    """The per-pixel loop we used to run, kept here as the baseline."""
+    (subencoding,) = struct.unpack('!B', buf.read(1))
+    palette_size = subencoding & 127
+    palette = np.frombuffer(buf.read(palette_size * 3), dtype=np.uint8).reshape((-1, 3))
+    bits_per_packed_pixel = bits_for(palette_size)
+
+    for j in range(tile_height):
+        b = 0
+        nbits = 0
+        for i in range(tile_width):
+            if nbits == 0:
+                (b,) = struct.unpack('!B', buf.read(1))
+                nbits = 8
+            nbits -= bits_per_packed_pixel
+            idx = (b >> nbits) & ((1 << bits_per_packed_pixel) - 1) & 127
+            tile[j, i, :] = palette[idx]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ZRLE packed-palette tile decoder.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-n', '--number', type=int, default=200, help='Decodes per measurement.')
+    parser.add_argument('-s', '--sizes', default='8,16,32,64', help='Comma-separated square tile sizes.')
+    parser.add_argument('-p', '--palette-sizes', default='2,4,16', help='Comma-separated palette sizes.')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    rng = np.random.RandomState(0)
+    print('{:>6} {:>8} {:>12} {:>12} {:>8}'.format('tile', 'palette', 'legacy', 'numpy', 'speedup'))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        for palette_size in [int(p) for p in args.palette_sizes.split(',')]:
+            palette = rng.randint(0, 256, size=(palette_size, 3)).astype(np.uint8)
+            idx = rng.randint(0, palette_size, size=(size, size))
+            payload = encode_packed_palette_tile(idx, palette, palette_size)
+
+            legacy_tile = np.zeros((size, size, 3), dtype=np.uint8)
+            tile = np.zeros((size, size, 3), dtype=np.uint8)
+
+            def legacy():
+                legacy_read_packed_palette_tile(legacy_tile, BytesIO(payload), size, size)
+
+            def current():
+                server_messages.ZRLEEncoding._read_tile(tile, bytearray(payload), 0, size, size, 3)
+
+            legacy_time = min(timeit.repeat(legacy, number=args.number, repeat=3)) / args.number
+            current_time = min(timeit.repeat(current, number=args.number, repeat=3)) / args.number
+
+            if not np.array_equal(legacy_tile, tile):
+                logger.error('Decoders disagree for tile=%s palette=%s', size, palette_size)
+                return 1
+
+            print('{:>6} {:>8} {:>10.1f}us {:>10.1f}us {:>7.1f}x'.format(
+                '{0}x{0}'.format(size), palette_size,
+                1e6 * legacy_time, 1e6 * current_time, legacy_time / current_time))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import sys
+
+from universe.vncdriver import fbs_decoder
+
+logger = logging.getLogger()
+
+def main():
+    parser = argparse.ArgumentParser(description='Decode vnc_recorder recordings into arrays of screen frames, for training on. Only frames where the screen changed are stored; load them with universe.vncdriver.fbs_decoder.load_frames.')
+    parser.add_argument('-v', '--verbose', action='count', dest='verbosity', default=0, help='Set verbosity.')
+    parser.add_argument('-f', '--fps', type=float, default=15, help='Frames per second of recording to emit. Output grows with fps on busy screens (up to about 140MB per second of a 1024x768 recording at 60fps), so pick the lowest rate you\'ll train at.')
+    parser.add_argument('-o', '--output-dir', default=None, help='Write each recording\'s frames to a directory (named after the recording) here, rather than into the recording directory.')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='Recordings to decode at once (default: one per CPU).')
+    parser.add_argument('logfile_dirs', nargs='+', help='Recording directories, each containing a server.fbs (and a client.fbs).')
+    args = parser.parse_args()
+
+    if args.verbosity == 0:
+        logger.setLevel(logging.INFO)
+    elif args.verbosity >= 1:
+        logger.setLevel(logging.DEBUG)
+
+    failed = 0
+    for logfile_dir, frames, error in fbs_decoder.decode_recordings(args.logfile_dirs, args.fps, args.output_dir, args.processes):
+        if error is None:
+            logger.info('%s: %d frames', logfile_dir, frames)
+        else:
+            logger.error('%s: failed: %s', logfile_dir, error)
+            failed += 1
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
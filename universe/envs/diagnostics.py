@@ -244,12 +244,12 @@ class Diagnostics(object):
         if self.disable_action_probes or self.instance_n is None:
             return
 
-        for instance, action, mask in zip(self.instance_n, action_n, mask_n):
+        for i, (instance, mask) in enumerate(zip(self.instance_n, mask_n)):
             # Important that masking prevents us from adding probes. (This
             # avoids us e.g. filling in backticks into text boxes as the
             # environment boots.)
             if mask and instance:
-                instance.add_probe(action)
+                action_n[i] = instance.add_probe(action_n[i])
 
     def add_metadata(self, observation_n, info_n, available_at=None):
         """Mutates the info_n dictionary."""
@@ -317,6 +317,7 @@ class DiagnosticsInstance(object):
                 spaces.KeyEvent(probe_key, down=True).compile(),
                 spaces.KeyEvent(probe_key, down=False).compile(),
         ]
+        self.probe_array = spaces.event_array(self.probe)
 
         if metadata_encoding is not None:
             self.metadata_decoder = MetadataDecoder.build(metadata_encoding, pool=self.pool, qr_pool=self.qr_pool, label=self.label)
@@ -328,8 +329,10 @@ class DiagnosticsInstance(object):
         self.probe_received_at = None
 
     def add_probe(self, action):
+        """Return the action, with the probe added if it's time to send
+        one. Lists are added to in place."""
         if self.network is not None and not self.network.active():
-            return
+            return action
 
         if self.probe_sent_at is not None and self.probe_sent_at + 10 < time.time():
             extra_logger.warn('[%s] Probe to determine action latency timed out (was sent %s). (This is harmless, but worth knowing about.)', self.label, self.probe_sent_at)
@@ -337,8 +340,12 @@ class DiagnosticsInstance(object):
         if self.probe_sent_at is None:
             extra_logger.debug('[%s] Sending out new action probe: %s', self.label, self.probe)
             self.probe_sent_at = time.time()
-            action += self.probe
+            if isinstance(action, np.ndarray):
+                action = np.concatenate([action, self.probe_array])
+            else:
+                action += self.probe
         assert self.probe_sent_at is not None
+        return action
 
     def add_metadata(self, observation, info, available_at=None):
         """Extract metadata from a pixel observation and add it to the info
@@ -0,0 +1,150 @@
+import numpy as np
+
+from universe import error, spaces, utils
+from universe.envs import diagnostics, vnc_env
+from universe.spaces import vnc_event
+from universe.vncdriver import vnc_client
+
+def test_compile_matches_compile_action():
+    compiler = vnc_env.ActionCompiler()
+    action = [
+        spaces.KeyEvent.by_name('up', down=True),
+        ('KeyEvent', 'a', False),
+        spaces.PointerEvent(10, 20, 1),
+        ('PointerEvent', 30, 40, 0),
+    ]
+    expected = [vnc_env.compile_action(event) for event in action]
+    for _ in range(2):
+        compiled, peek = compiler.compile(action)
+        assert compiled == expected
+        assert not peek
+
+def test_compiled_actions_are_copies():
+    # Diagnostics appends probes to the compiled actions
+    compiler = vnc_env.ActionCompiler()
+    action = [spaces.KeyEvent.by_name('up', down=True)]
+    compiled, _ = compiler.compile(action)
+    compiled.append(spaces.KeyEvent(0xbeef1, down=True).compile())
+    assert compiler.compile(action)[0] == [('KeyEvent', spaces.KeyEvent.by_name('up').key, True)]
+
+def test_peek_reward():
+    compiler = vnc_env.ActionCompiler()
+    compiled, peek = compiler.compile([spaces.PeekReward, ('KeyEvent', 'a', True)])
+    assert peek
+    assert compiled == [vnc_env.compile_action(('KeyEvent', 'a', True))]
+
+class UnhashableEvent(vnc_event.VNCEvent):
+    __hash__ = None
+
+    def compile(self):
+        return 'KeyEvent', 0x61, True
+
+def test_unhashable_events():
+    compiler = vnc_env.ActionCompiler()
+    for _ in range(2):
+        compiled, _ = compiler.compile([UnhashableEvent(), ('KeyEvent', 'a', False)])
+        assert compiled == [('KeyEvent', 0x61, True), ('KeyEvent', 0x61, False)]
+
+def test_encode():
+    compiler = vnc_env.ActionCompiler()
+    compiled, _ = compiler.compile([('KeyEvent', 'a', True), ('PointerEvent', 1, 2, 0)])
+    encoded = compiler.encode(compiled)
+    assert encoded == vnc_client.encode_events(compiled)
+    assert compiler.encode(list(compiled)) is encoded
+    assert compiler.encode([]) == b''
+
+def test_pointer_events_are_bounded():
+    compiler = vnc_env.ActionCompiler()
+    for x in range(3 * vnc_env.POINTER_CACHE_SIZE):
+        compiler.compile([('PointerEvent', x, 0, 0)])
+    assert len(compiler._pointers) < 2 * vnc_env.POINTER_CACHE_SIZE
+    assert len(compiler._actions) < 2 * vnc_env.ACTION_CACHE_SIZE
+
+def test_lru_cache():
+    cache = utils.LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['c'] = 3
+    assert cache.get('a') == 1
+    cache['d'] = 4
+    cache['e'] = 5
+    # The two most recently used are always kept
+    assert cache.get('d') == 4
+    assert cache.get('e') == 5
+    assert 'b' not in cache
+    assert 'c' not in cache
+    assert cache.get('b', 'missing') == 'missing'
+    assert len(cache) < 4
+
+def test_event_arrays():
+    events = [spaces.KeyEvent.by_name('a', down=True), ('KeyEvent', 'b', False), spaces.PointerEvent(3, 4, 1), ('PointerEvent', 5, 6, 0)]
+    array = spaces.event_array(events, length=6)
+    assert array.dtype == spaces.event_dtype
+    assert array.shape == (6,)
+    compiled = [vnc_env.compile_action(event) for event in events]
+    assert vnc_event.compile_event_array(array) == compiled
+
+    assert np.array_equal(spaces.key_events([0x61, 0x62], [True, False]), spaces.event_array(compiled[:2]))
+    assert np.array_equal(spaces.pointer_events([3, 5], [4, 6], [1, 0]), spaces.event_array(compiled[2:]))
+
+    batch = spaces.event_batch([events[:1], events, []])
+    assert batch.shape == (3, 4)
+    assert vnc_event.compile_event_array(batch[0]) == compiled[:1]
+    assert vnc_event.compile_event_array(batch[2]) == []
+
+def test_encode_event_arrays():
+    compiler = vnc_env.ActionCompiler()
+    rng = np.random.RandomState(0)
+    for size in [0, 3, vnc_client.VECTORIZE_EVENTS + 1]:
+        events = []
+        for _ in range(size):
+            if rng.randint(2):
+                events.append(('KeyEvent', int(rng.randint(2**32)), bool(rng.randint(2))))
+            else:
+                events.append(('PointerEvent', int(rng.randint(2**16)), int(rng.randint(2**16)), int(rng.randint(256))))
+        array = spaces.event_array(events, length=size + 2)
+        assert vnc_client.encode_event_array(array) == vnc_client.encode_events(events)
+        assert compiler.encode(array) == vnc_client.encode_events(events)
+
+    # Enough between them to be encoded together
+    arrays = [spaces.pointer_events(np.arange(i), i) for i in range(20)]
+    expected = [vnc_client.encode_events(vnc_event.compile_event_array(events)) for events in arrays]
+    assert vnc_client.encode_event_arrays(arrays) == expected
+    assert compiler.encode_n(arrays + [[('KeyEvent', 0x61, True)]]) == expected + [vnc_client.pack_key_event(4, True, 0x61)]
+    # And cached
+    assert compiler.encode_n(arrays[:1]) == expected[:1]
+
+def test_compile_event_arrays():
+    compiler = vnc_env.ActionCompiler()
+    array = spaces.key_events([0x61], True)
+    compiled, peek = compiler.compile(array)
+    assert compiled is array
+    assert not peek
+    assert compiler.events(compiled) == [('KeyEvent', 0x61, True)]
+    try:
+        compiler.compile(np.zeros(2))
+    except error.Error:
+        pass
+    else:
+        assert False, 'Expected an array without event_dtype to be rejected'
+
+def test_probes_on_event_arrays():
+    diagnostics_n = diagnostics.Diagnostics(2, 0xbeef1, ignore_clock_skew=True)
+    try:
+        diagnostics_n.connect(0)
+        diagnostics_n.connect(1)
+        action_n = [spaces.key_events([0x61], True), [('KeyEvent', 0x61, True)]]
+        diagnostics_n.add_probe(action_n, [True, True])
+        probe = diagnostics_n.instance_n[0].probe
+        assert vnc_event.compile_event_array(action_n[0]) == [('KeyEvent', 0x61, True)] + probe
+        assert action_n[1] == [('KeyEvent', 0x61, True)] + probe
+    finally:
+        diagnostics_n.close()
+
+def test_action_space_contains_event_arrays():
+    space = spaces.VNCActionSpace(keys=['a'], buttonmasks=[0, 1], screen_shape=(100, 100))
+    assert space.contains(spaces.event_array([spaces.KeyEvent.by_name('a'), spaces.PointerEvent(10, 10, 1)], length=3))
+    assert not space.contains(spaces.key_events(0x62))
+    assert not space.contains(spaces.pointer_events(10, 101))
+    assert not space.contains(spaces.pointer_events(10, 10, 2))
+    assert not space.contains(np.zeros(2))
@@ -0,0 +1,48 @@
+import numpy as np
+
+from universe.envs import vnc_env
+
+def running(episode_id):
+    return {'env_status.env_state': 'running', 'env_status.episode_id': episode_id}
+
+def resetting(episode_id):
+    return {'env_status.env_state': 'resetting', 'env_status.episode_id': episode_id}
+
+def test_mask_transitions():
+    mask = vnc_env.Mask(['0', '1', '2'])
+    assert not mask.maintain_mask([False] * 3, [{}, {}, {}]).any()
+
+    # Episodes begin
+    ok = mask.maintain_mask([False] * 3, [running('1'), resetting('1'), running('1')])
+    assert list(ok) == [True, False, True]
+
+    # One ends and resets; another ends and straight away begins
+    ok = mask.maintain_mask([False] * 3, [resetting('2'), running('1'), running('2')])
+    assert list(ok) == [False, True, True]
+    assert list(mask.episode_ids) == ['2', '1', '2']
+
+    # Peeking goes by the peeked-at state
+    info = dict(running('2'), peek=True)
+    info['env_status.peek.env_state'] = 'running'
+    info['env_status.peek.episode_id'] = '3'
+    ok = mask.maintain_mask([False] * 3, [info, running('1'), running('2')])
+    assert list(ok) == [True, True, True]
+
+    mask.close(1)
+    assert list(mask.maintain_mask([False] * 3, [running('3'), resetting('1'), running('2')])) == [True, False, True]
+
+def test_mask_apply():
+    mask = vnc_env.Mask(['0', '1'])
+    ok = mask.maintain_mask([False, False], [running('1'), resetting('1')])
+    action_n = [['a'], ['b']]
+    observation_n = [{'text': []}, {'text': []}]
+    info_n = [{}, {}]
+    mask.apply_to_actions(action_n, info_n, ok)
+    mask.apply_to_return(observation_n, np.zeros(2), np.zeros(2, dtype=bool), info_n, ok)
+    assert action_n == [['a'], []]
+    assert observation_n == [{'text': []}, None]
+    assert info_n == [{}, {'mask.masked.action': True, 'mask.masked.observation': True}]
+
+def test_unmasked_without_rewarder():
+    mask = vnc_env.Mask(['0', '1'], initially_masked=False)
+    assert list(mask.maintain_mask(np.zeros(2, dtype=bool), [{}, {}])) == [True, True]
@@ -2,30 +2,33 @@ import getpass
 import logging
 import os
 import random
+import time
 import uuid
 
+import numpy as np
+
 import universe
 from gym.utils import reraise
-from universe import error, pyprofile, rewarder, spaces, twisty, vectorized, vncdriver
+from universe import error, pyprofile, rewarder, spaces, twisty, utils, vectorized, vncdriver
+from universe.vectorized import columns
 from universe import remotes as remotes_module
 from universe.envs import diagnostics
 from universe.runtimes import registration
-from universe.vncdriver import libvnc_session
-
-# The Go driver is the most supported one. So long as the Go driver
-# turns out to be easy to install, we'll continue forcing the Go
-# driver here.
-# noinspection PyUnresolvedReferences
-import go_vncdriver
+from universe.spaces import vnc_event
+from universe.vncdriver import libvnc_session, vnc_client
 
 logger = logging.getLogger(__name__)
 extra_logger = logging.getLogger('universe.extra.'+__name__)
 
-if os.environ.get('UNIVERSE_VNCDRIVER', None) == 'go':
+if os.environ.get('UNIVERSE_VNCDRIVER') in (None, '', 'go'):
     # Importing the Go driver early is desirable, so that people get
     # errors if it's not present. Also sometimes if go_vncdriver is
     # loaded after TensorFlow it will crash.
-    import go_vncdriver
+    try:
+        import go_vncdriver
+    except ImportError:
+        if os.environ.get('UNIVERSE_VNCDRIVER') == 'go':
+            raise
 
 def default_client_id():
     return '{}-{}'.format(uuid.uuid4(), getpass.getuser())
@@ -33,6 +36,9 @@ def default_client_id():
 def rewarder_session(which):
     if which is None:
         which = rewarder.RewarderSession
+    elif which == 'replay':
+        from universe.rewarder import replay_session
+        return replay_session.ReplayRewarderSession
 
     if isinstance(which, type):
         return which
@@ -49,21 +55,19 @@ def py_vncdriver():
 def libvnc_vncdriver():
     return libvnc_session.LibVNCSession
 
-def vnc_session(which=None):
-    # Short circuit so long as we're forcing the Go driver. Other code
-    # left behind for the future if we need to support the other
-    # drivers again.
-    if isinstance(which, type):
-        # Used in the tests to pass a custom VNC driver
-        return which
-
-    logger.info('Using the golang VNC implementation')
-    return go_vncdriver()
+def replay_vncdriver():
+    from universe.vncdriver import replay_session
+    return replay_session.ReplayVNCSession
 
+def vnc_session(which=None):
+    """Pick a VNC driver: a VNCSession class, or 'go', 'py', 'libvnc'
+    or 'replay'. Defaults to $UNIVERSE_VNCDRIVER, or else the Go
+    driver if it's installed and the Python one if not."""
     if which is None:
-        which = os.environ.get('UNIVERSE_VNCDRIVER')
+        which = os.environ.get('UNIVERSE_VNCDRIVER') or None
 
     if isinstance(which, type):
+        # Used in the tests to pass a custom VNC driver
         return which
     if which == 'go':
         logger.info('Using the golang VNC implementation')
@@ -74,17 +78,20 @@ def vnc_session(which=None):
     elif which == 'libvnc':
         logger.info('Using the libvnc VNC implementation')
         return libvnc_vncdriver()
+    elif which == 'replay':
+        logger.info('Using the replay VNC implementation')
+        return replay_vncdriver()
     elif which is None:
         try:
             go = go_vncdriver()
-            logger.debug('Using golang VNC implementation')
+            logger.info('Using the golang VNC implementation')
             return go
         except ImportError as e:
             logger.info("Go driver failed to import: {}".format(e))
             logger.info("Using pure Python vncdriver implementation. Run 'pip install go-vncdriver' to install the more performant Go implementation. Optionally set the environment variable UNIVERSE_VNCDRIVER='go' to force its use.")
             return py_vncdriver()
     else:
-        raise error.Error('Invalid VNCSession driver: {!r}'.format(which))
+        raise error.Error('Invalid VNCSession driver: {!r}. Must be one of go, py, libvnc or replay'.format(which))
 
 def build_observation_n(visual_observation_n, info_n):
     observation_n = []
@@ -123,12 +130,15 @@ class VNCEnv(vectorized.Env):
         self._remotes_manager = None
 
         self._probe_key = probe_key or 0xbeef1
+        self._action_compiler = ActionCompiler()
 
         self.vnc_session = None
         self.rewarder_session = None
 
         self._send_actions_over_websockets = False
         self._skip_network_calibration = False
+        self._result_arrays = False
+        self._vision_batch = None
 
 
     def _seed(self, seed):
@@ -145,6 +155,7 @@ class VNCEnv(vectorized.Env):
                   observer=False, api_key=None,
                   record=False,
                   sample_env_ids=None,
+                  result_arrays=False,
     ):
         """Universe method to configure the environment.
 
@@ -166,6 +177,11 @@ class VNCEnv(vectorized.Env):
             (such as an agent, or a demonstrator), and we will be
             sending probe keys and measuring network ping rountrip
             times to calculate clock skew.
+
+          result_arrays (bool): Have step() return reward_n and done_n as
+            NumPy arrays, and the common per-environment stats (see
+            vectorized.columns) as arrays in info['columns'] rather than
+            in each of info['n'].
         """
         if self._started:
             raise error.Error('{} has already been started; cannot change configuration now.'.format(self))
@@ -203,6 +219,17 @@ class VNCEnv(vectorized.Env):
         self.crashed = {}
 
         self.allow_reconnect = replace_on_crash and self.remote_manager.supports_reconnect
+        # Some remotes (like recordings) need their own drivers
+        if vnc_driver is None:
+            vnc_driver = getattr(self.remote_manager, 'vnc_driver', None)
+        if rewarder_driver is None:
+            rewarder_driver = getattr(self.remote_manager, 'rewarder_driver', None)
+        if isinstance(self.remote_manager, remotes_module.ReplayRecordings):
+            # A recording has no clock for us to measure, and can't
+            # answer our probes
+            ignore_clock_skew = True
+            disable_action_probes = True
+
         if self.remote_manager.connect_vnc:
             cls = vnc_session(vnc_driver)
             vnc_kwargs.setdefault('start_timeout', self.remote_manager.start_timeout)
@@ -212,11 +239,22 @@ class VNCEnv(vectorized.Env):
                 vnc_kwargs.setdefault('encoding', 'tight')
                 vnc_kwargs.setdefault('fine_quality_level', 50)
                 vnc_kwargs.setdefault('subsample_level', 2)
+            if vnc_kwargs.get('region') is not None and self.spec is not None and self.spec.tags.get('metadata_encoding') is not None:
+                # The diagnostics metadata can sit anywhere on the
+                # screen, and would stop updating outside the region
+                logger.info('Requesting updates for the whole screen rather than %s, since %s draws diagnostics metadata on the screen', vnc_kwargs['region'], self.spec.id)
+                vnc_kwargs['region'] = None
+            if vnc_kwargs.get('region') is not None and not getattr(cls, 'supports_region', False):
+                logger.info('The %s VNC driver does not support a region of interest, so requesting updates for the whole screen rather than %s', cls, vnc_kwargs['region'])
+                vnc_kwargs['region'] = None
             # Filter out None values, since some drivers may not handle them correctly
             vnc_kwargs = {k: v for k, v in vnc_kwargs.items() if v is not None}
             logger.info('Using VNCSession arguments: %s. (Customize by running "env.configure(vnc_kwargs={...})"', vnc_kwargs)
+            # Some settings are for the whole session rather than each
+            # connection
+            session_kwargs = {k: vnc_kwargs.pop(k) for k in getattr(cls, 'session_kwargs', ()) if k in vnc_kwargs}
             self.vnc_kwargs = vnc_kwargs
-            self.vnc_session = cls()
+            self.vnc_session = cls(**session_kwargs)
         else:
             self.vnc_session = None
 
@@ -241,6 +279,7 @@ class VNCEnv(vectorized.Env):
             self.diagnostics = None
 
         self._sample_env_ids = sample_env_ids
+        self._result_arrays = result_arrays
 
         self._reset_mask()
         self._started = True
@@ -363,18 +402,36 @@ class VNCEnv(vectorized.Env):
             done_n.append(done_d.get(name, False))
             info_n.append(info_d.get(name, {'env_status.disconnected': True}))
             err_n.append(err_d.get(name))
+        if self._result_arrays:
+            reward_n = np.array(reward_n, dtype=np.float64)
+            done_n = np.array(done_n, dtype=bool)
         return reward_n, done_n, info_n, err_n
 
     def _step_vnc_session(self, compiled_d):
+        compiler = self._action_compiler
         if self._send_actions_over_websockets:
-            self.rewarder_session.send_action(compiled_d, self.spec.id)
+            self.rewarder_session.send_action({name: compiler.events(compiled) for name, compiled in compiled_d.items()}, self.spec.id)
             vnc_action_d = {}
+        elif getattr(self.vnc_session, 'accepts_encoded_actions', False):
+            # Hand over the client messages themselves, so the driver
+            # doesn't pack the same events again each step
+            names = list(compiled_d)
+            vnc_action_d = dict(zip(names, compiler.encode_n([compiled_d[name] for name in names])))
         else:
-            vnc_action_d = compiled_d
+            vnc_action_d = {name: compiler.events(compiled) for name, compiled in compiled_d.items()}
 
         with pyprofile.push('vnc_env.VNCEnv.vnc_session.step'):
             observation_d, info_d, err_d = self.vnc_session.step(vnc_action_d)
 
+        # With observation_buffers, the py driver has already gathered
+        # the screens into one array; pass it on if it has a row for
+        # every environment, in order
+        batch = getattr(self.vnc_session, 'observation_batch', None)
+        if batch is not None and batch[0] == self.connection_names:
+            self._vision_batch = batch[1]
+        else:
+            self._vision_batch = None
+
         observation_n = []
         info_n = []
         err_n = []
@@ -385,22 +442,31 @@ class VNCEnv(vectorized.Env):
 
         return observation_n, info_n, err_n
 
+    def wait_for_frame(self, timeout=None, policy='any'):
+        """Block until any (or with policy='all', every) environment has a
+        new frame for the next step() to return, or `timeout` seconds
+        pass. Returns whether the frames arrived.
+
+        With VNC drivers which can't wait, this just sleeps out the
+        timeout and returns False.
+        """
+        wait = getattr(self.vnc_session, 'wait_for_frame', None)
+        if wait is not None:
+            return wait(timeout=timeout, policy=policy)
+        elif timeout is None:
+            raise error.Error('The {} VNC driver cannot wait for frames, so a timeout is required'.format(type(self.vnc_session)))
+        time.sleep(timeout)
+        return False
+
     def _compile_actions(self, action_n):
         compiled_n = []
         peek_d = {}
         try:
             for i, action in enumerate(action_n):
-                compiled = []
+                compiled, peek = self._action_compiler.compile(action)
                 compiled_n.append(compiled)
-                for event in action:
-                    # Handle any special control actions
-                    if event == spaces.PeekReward:
-                        name = self.connection_names[i]
-                        peek_d[name] = True
-                        continue
-
-                    # Do a generic compile
-                    compiled.append(compile_action(event))
+                if peek:
+                    peek_d[self.connection_names[i]] = True
         except Exception as e:
             raise error.Error('Could not compile actions. Original error: {} ({}). action_n={}'.format(e, type(e), action_n))
         else:
@@ -429,6 +495,11 @@ class VNCEnv(vectorized.Env):
         # that everything here is asynchronous!
         if self.rewarder_session:
             reward_n, done_n, info_n, err_n = self._pop_rewarder_session(peek_d)
+        elif self._result_arrays:
+            reward_n = np.zeros(self.n)
+            done_n = np.zeros(self.n, dtype=bool)
+            info_n = [{} for _ in range(self.n)]
+            err_n = [None] * self.n
         else:
             reward_n = done_n = [None] * self.n
             info_n = [{} for _ in range(self.n)]
@@ -455,6 +526,7 @@ class VNCEnv(vectorized.Env):
         else:
             visual_observation_n = [None] * self.n
             vnc_err_n = [None] * self.n
+            self._vision_batch = None
 
         observation_n = build_observation_n(visual_observation_n, info_n)
         self.mask.apply_to_return(observation_n, reward_n, done_n, info_n, observation_mask)
@@ -463,7 +535,14 @@ class VNCEnv(vectorized.Env):
         self._handle_err_n(err_n, vnc_err_n, info_n, observation_n, reward_n, done_n)
         self._handle_crashed_n(info_n)
 
-        return observation_n, reward_n, done_n, {'n': info_n}
+        info = {'n': info_n}
+        if self._vision_batch is not None:
+            # observation_n[i]['vision'] are rows of this; rows of
+            # masked environments should be ignored
+            info['vision.batch'] = self._vision_batch
+        if self._result_arrays:
+            info['columns'] = columns.pop(info_n, columns.ENV_STATS)
+        return observation_n, reward_n, done_n, info
 
     def _handle_initial_n(self, observation_n, reward_n):
         if self.rewarder_session is None:
@@ -581,56 +660,87 @@ class Mask(object):
     def __init__(self, connection_labels, initially_masked=True):
         self.connection_labels = connection_labels
         self.n = len(connection_labels)
+        # Without a rewarder there are no episodes, and nothing to mask
+        self.rewarder = initially_masked
 
         self.episode_ids = [None] * self.n
-        if initially_masked:
-            self.mask = [None] * self.n
-        else:
-            self.mask = [True] * self.n
+        # Whether each environment has been let through since it
+        # connected (so a masked one is between episodes, rather than
+        # yet to start its first)
+        self.started = np.full(self.n, not initially_masked)
+        self._set_mask(self.started.copy())
+
+    def _set_mask(self, mask):
+        # The mask is replaced rather than changed in place, so callers
+        # can hold onto the one they were given
+        self.mask = mask
+        self._masked = np.flatnonzero(~mask)
 
     def close(self, i):
-        self.mask[i] = None
+        mask = self.mask.copy()
+        mask[i] = False
+        self._set_mask(mask)
+        self.started[i] = False
         self.episode_ids[i] = None
 
     def maintain_mask(self, done_n, info_n):
-        for i, ok in enumerate(self.mask):
-            if info_n[i].get('peek'):
-                env_state = info_n[i].get('env_status.peek.env_state', 'resetting')
-                episode_id = info_n[i].get('env_status.peek.episode_id')
-
-                if info_n[i].get('env_status.episode_id') != episode_id:
-                    completed_episode_id = info_n[i].get('env_status.episode_id')
-                else:
-                    completed_episode_id = None
+        running_n = []
+        episode_ids = []
+        for info in info_n:
+            if info.get('peek'):
+                running_n.append(info.get('env_status.peek.env_state') == 'running')
+                episode_ids.append(info.get('env_status.peek.episode_id'))
             else:
-                env_state = info_n[i].get('env_status.env_state', 'resetting')
-                episode_id = info_n[i].get('env_status.episode_id')
-                completed_episode_id = info_n[i].get('env_status.complete.episode_id')
-
+                running_n.append(info.get('env_status.env_state') == 'running')
+                episode_ids.append(info.get('env_status.episode_id'))
+
+        # Usually every environment is mid-episode, and there's nothing
+        # to do
+        if episode_ids == self.episode_ids and len(self._masked) == 0:
+            return self.mask
+
+        # Otherwise only masked environments, and those whose episode
+        # changed, need looking at
+        began = [i for i in self._masked if running_n[i]]
+        changed = [i for i, (old, new) in enumerate(zip(self.episode_ids, episode_ids)) if old != new and self.mask[i]]
+        ended = [i for i in changed if not running_n[i]]
+        for i in began + changed:
             # Either:
-            # 1. The env is currently masked (not ok)
-            # 2. We have an active episode (self.episode_ids[i])
-            # 3. We didn't connect the rewarder (done_n[i] is None)
-            assert not ok or self.episode_ids[i] is not None or done_n[i] is None, "ok={} episode_id={} i={}".format(ok, episode_id, i)
-            if not ok and env_state == 'running':
-                extra_logger.info('[%s] Episode began: episode_id=%s env_state=%s', self.connection_labels[i], episode_id, env_state)
-                self.mask[i] = True
-                # this should change only for initial reset
-                self.episode_ids[i] = episode_id
-            elif ok and self.episode_ids[i] != episode_id and env_state == 'running':
-                extra_logger.info('[%s] Episode ended (and began, so not masking): episode_id=%s->%s env_state=%s', self.connection_labels[i], completed_episode_id, episode_id, env_state)
-                self.episode_ids[i] = episode_id
-            elif ok and self.episode_ids[i] != episode_id:
-                extra_logger.info('[%s] Episode ended: episode_id=%s->%s env_state=%s', self.connection_labels[i], completed_episode_id, episode_id, env_state)
-                self.mask[i] = False
-                self.episode_ids[i] = episode_id
+            # 1. The env is now masked
+            # 2. We have an active episode
+            # 3. We didn't connect the rewarder
+            assert not running_n[i] or episode_ids[i] is not None or not self.rewarder, "episode_id={} i={}".format(episode_ids[i], i)
+            self._log_transition(i, info_n[i], episode_ids[i], began=i in began, ended=i in ended)
+            self.episode_ids[i] = episode_ids[i]
+
+        if began or ended:
+            mask = self.mask.copy()
+            mask[began] = True
+            mask[ended] = False
+            self.started[began] = True
+            self._set_mask(mask)
         return self.mask
 
-    def apply_to_actions(self, action_n, info_n, mask):
-        for i, ok in enumerate(mask):
-            if ok:
-                continue
+    def _log_transition(self, i, info, episode_id, began, ended):
+        if info.get('peek'):
+            env_state = info.get('env_status.peek.env_state', 'resetting')
+            if info.get('env_status.episode_id') != episode_id:
+                completed_episode_id = info.get('env_status.episode_id')
+            else:
+                completed_episode_id = None
+        else:
+            env_state = info.get('env_status.env_state', 'resetting')
+            completed_episode_id = info.get('env_status.complete.episode_id')
 
+        if began:
+            extra_logger.info('[%s] Episode began: episode_id=%s env_state=%s', self.connection_labels[i], episode_id, env_state)
+        elif not ended:
+            extra_logger.info('[%s] Episode ended (and began, so not masking): episode_id=%s->%s env_state=%s', self.connection_labels[i], completed_episode_id, episode_id, env_state)
+        else:
+            extra_logger.info('[%s] Episode ended: episode_id=%s->%s env_state=%s', self.connection_labels[i], completed_episode_id, episode_id, env_state)
+
+    def apply_to_actions(self, action_n, info_n, mask):
+        for i in self._masked_indexes(mask):
             action_n[i] = []
             info_n[i]['mask.masked.action'] = True
         return self.mask
@@ -642,16 +752,18 @@ class Mask(object):
         # conservative route (block upon done=True, unblock upon
         # v0.env.describe with env_state=running) locks us out of the
         # maximum surface area of environment reset possible.
-        for i, ok in enumerate(observation_mask):
-            if ok:
-                continue
-
-            if len(observation_n[i]['text']) > 0 and ok is False:
+        for i in self._masked_indexes(observation_mask):
+            if len(observation_n[i]['text']) > 0 and self.started[i]:
                 logger.warn('[%s] WARNING: Masking text observation for environment %d: %r. This means we received text data before the environment finished resetting; the text observation has been lost. This is not expected and should be reported.', self.connection_labels[i], i, observation_n[i]['text'])
 
             observation_n[i] = None
             info_n[i]['mask.masked.observation'] = True
 
+    def _masked_indexes(self, mask):
+        if mask is self.mask:
+            return self._masked
+        return np.flatnonzero(~np.asarray(mask, dtype=bool))
+
 def compile_action(event):
     if isinstance(event, tuple):
         if event[0] == 'KeyEvent':
@@ -662,3 +774,130 @@ def compile_action(event):
             return spaces.PointerEvent(x, y, buttonmask).compile()
     else:
         return event.compile()
+
+# How many PointerEvents, whole actions and encoded actions
+# ActionCompiler keeps
+POINTER_CACHE_SIZE = 4096
+ACTION_CACHE_SIZE = 1024
+ENCODED_CACHE_SIZE = 1024
+
+class ActionCompiler(object):
+    """Compiles actions (lists of events) with compile_action, and
+    encodes compiled actions as VNC client messages, remembering the
+    results.
+
+    Agents mostly repeat a fixed set of actions (one per discrete
+    action, as with SafeActionSpace or spaces.Hardcoded), so the same
+    work would otherwise be redone every step. Events given as tuples
+    (e.g. ('KeyEvent', 'up', True)) are also kept: key events come from
+    a small set and are kept indefinitely, while pointer events, whole
+    actions and encodings can take any number of values, so only the
+    most recently used are kept (see utils.LRUCache). Unhashable
+    actions and events are compiled each time.
+
+    Actions may also be event arrays (see spaces.vnc_event), which are
+    passed through as they are. The encodings of those which aren't
+    cached are made together, with NumPy once there are enough events.
+    """
+
+    def __init__(self):
+        self._events = {}
+        self._pointers = utils.LRUCache(POINTER_CACHE_SIZE)
+        self._actions = utils.LRUCache(ACTION_CACHE_SIZE)
+        self._encoded = utils.LRUCache(ENCODED_CACHE_SIZE)
+
+    def compile(self, action):
+        """Return (compiled, peek): a new list of the compiled events,
+        which the caller may change, and whether the action included
+        spaces.PeekReward. Event arrays are returned as they are."""
+        if isinstance(action, np.ndarray):
+            if action.dtype != spaces.event_dtype or action.ndim != 1:
+                raise error.Error('Actions given as arrays must be 1-d, with dtype spaces.event_dtype: got {} {}'.format(action.shape, action.dtype))
+            return action, False
+
+        key = tuple(action)
+        try:
+            # Events' __hash__ is Python code, so hash the action once
+            # and key the cache by that, checking for collisions
+            # ourselves
+            hashed = hash(key)
+        except TypeError:
+            hashed = None
+        else:
+            cached = self._actions.get(hashed)
+            if cached is not None and cached[0] == key:
+                return list(cached[1]), cached[2]
+
+        compiled = []
+        peek = False
+        for event in action:
+            # Handle any special control actions
+            if event == spaces.PeekReward:
+                peek = True
+                continue
+            compiled.append(self.compile_event(event))
+        if hashed is not None:
+            self._actions[hashed] = (key, tuple(compiled), peek)
+        return compiled, peek
+
+    def compile_event(self, event):
+        if not isinstance(event, tuple):
+            # Event objects compile to a tuple of their fields, which
+            # is cheaper than looking them up
+            return event.compile()
+
+        if event[0] == 'PointerEvent':
+            cache = self._pointers
+        else:
+            cache = self._events
+        try:
+            compiled = cache.get(event)
+        except TypeError:
+            return compile_action(event)
+        if compiled is None:
+            compiled = cache[event] = compile_action(event)
+        return compiled
+
+    def encode(self, compiled):
+        """The client messages for a compiled action, as one string (see
+        vnc_client.encode_events)."""
+        if isinstance(compiled, np.ndarray):
+            key = compiled.tobytes()
+            encoded = self._encoded.get(key)
+            if encoded is None:
+                encoded = self._encoded[key] = vnc_client.encode_event_array(compiled)
+            return encoded
+
+        key = tuple(compiled)
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            encoded = self._encoded[key] = vnc_client.encode_events(compiled)
+        return encoded
+
+    def encode_n(self, compiled_n):
+        """encode() each of a list of compiled actions, encoding the
+        event arrays among them which aren't cached together."""
+        encoded_n = []
+        misses = []
+        for i, compiled in enumerate(compiled_n):
+            if isinstance(compiled, np.ndarray):
+                key = compiled.tobytes()
+                encoded = self._encoded.get(key)
+                if encoded is None:
+                    misses.append((i, key))
+            else:
+                encoded = self.encode(compiled)
+            encoded_n.append(encoded)
+
+        if misses:
+            arrays = [compiled_n[i] for i, _ in misses]
+            for (i, key), encoded in zip(misses, vnc_client.encode_event_arrays(arrays)):
+                encoded_n[i] = self._encoded[key] = encoded
+        return encoded_n
+
+    def events(self, compiled):
+        """A compiled action as a list of compiled events, for drivers
+        which take those."""
+        if isinstance(compiled, np.ndarray):
+            return vnc_event.compile_event_array(compiled)
+        return compiled
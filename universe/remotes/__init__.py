@@ -1,4 +1,5 @@
 from universe.remotes.hardcoded_addresses import HardcodedAddresses
 from universe.remotes.allocator_remote import AllocatorManager
 from universe.remotes.docker_remote import DockerManager
+from universe.remotes.replay import ReplayRecordings
 from universe.remotes.build import build
@@ -3,6 +3,7 @@ from universe import error
 from universe.remotes.allocator_remote import AllocatorManager
 from universe.remotes.docker_remote import DockerManager
 from universe.remotes.hardcoded_addresses import HardcodedAddresses
+from universe.remotes.replay import ReplayRecordings
 
 def build(client_id, remotes, runtime=None, start_timeout=None, **kwargs):
     if isinstance(remotes, int):
@@ -22,6 +23,10 @@ def build(client_id, remotes, runtime=None, start_timeout=None, **kwargs):
         return HardcodedAddresses.build(
             remotes,
             start_timeout=start_timeout)
+    elif remotes.startswith('replay://'):
+        return ReplayRecordings.build(
+            remotes,
+            start_timeout=start_timeout)
     elif remotes.startswith('http://') or remotes.startswith('https://'):
         if runtime is None:
             raise error.Error('Must provide a runtime. HINT: try creating your env instance via gym.make("flashgames.DuskDrive-v0")')
@@ -38,4 +43,4 @@ def build(client_id, remotes, runtime=None, start_timeout=None, **kwargs):
         manager.start()
         return manager, n
     else:
-        raise error.Error('Invalid remotes: {!r}. Must be an integer or must start with vnc:// or https://'.format(remotes))
+        raise error.Error('Invalid remotes: {!r}. Must be an integer or must start with vnc://, replay:// or https://'.format(remotes))
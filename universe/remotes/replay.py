@@ -0,0 +1,159 @@
+import logging
+import os
+import time
+import six.moves.urllib.parse as urlparse
+
+from universe import error, utils
+from universe.remotes import remote
+from universe.vncdriver import fbs_reader
+
+logger = logging.getLogger(__name__)
+
+class ReplayRecordings(object):
+    """Plays back recording directories (as made by LogManager) in place
+    of live remotes, through the 'replay' VNC and rewarder drivers.
+
+    Build from a string like
+    replay:///path/to/recording1,/path/to/recording2?speed=4. speed is
+    how many times realtime to play back at. speed=max instead moves
+    each recording on by one frame (1/fps seconds, with fps=60 unless
+    given) per step, however long the steps take.
+
+    Each directory needs a server.fbs. Rewards are replayed if every
+    directory has a rewards.demo.
+    """
+
+    vnc_driver = 'replay'
+    rewarder_driver = 'replay'
+
+    @classmethod
+    def build(cls, remotes, **kwargs):
+        parsed = urlparse.urlparse(remotes)
+        if parsed.scheme != 'replay':
+            raise error.Error('ReplayRecordings must be initialized with a string starting with replay://: {}'.format(remotes))
+
+        logfile_dirs = [logfile_dir for logfile_dir in (parsed.netloc + parsed.path).split(',') if logfile_dir]
+        query = urlparse.parse_qs(parsed.query)
+        speed = query.get('speed', ['1'])[0]
+        fps = query.get('fps', ['60'])[0]
+        res = cls(logfile_dirs, speed=speed, fps=fps, **kwargs)
+        return res, res.available_n
+
+    def __init__(self, logfile_dirs, speed=1, fps=60, start_timeout=None):
+        if not logfile_dirs:
+            raise error.Error('No recordings to replay')
+        for logfile_dir in logfile_dirs:
+            if not os.path.exists(os.path.join(logfile_dir, 'server.fbs')):
+                raise error.Error('No server.fbs to replay in {}'.format(logfile_dir))
+        # Check these now rather than on connect
+        parse_speed(speed)
+        fps = float(fps)
+
+        self.available_n = len(logfile_dirs)
+        self.supports_reconnect = False
+        self.connect_vnc = True
+        self.connect_rewarder = all(os.path.exists(os.path.join(logfile_dir, 'rewards.demo')) for logfile_dir in logfile_dirs)
+        if not self.connect_rewarder:
+            logger.info('Not every recording has a rewards.demo, so replaying without rewards')
+
+        self.addresses = [format_address(logfile_dir, speed, fps) for logfile_dir in logfile_dirs]
+        self.password = utils.default_password()
+        if start_timeout is None:
+            start_timeout = 2 * self.available_n + 5
+        self.start_timeout = start_timeout
+
+        self._popped = False
+
+    def pop(self, n=None):
+        if self._popped:
+            assert n is None
+            return []
+        self._popped = True
+
+        remotes = []
+        for i, handle in enumerate(self._handles):
+            remotes.append(remote.Remote(
+                handle=handle,
+                vnc_address=self.addresses[i],
+                vnc_password=self.password,
+                rewarder_address=self.addresses[i] if self.connect_rewarder else None,
+                rewarder_password=self.password,
+            ))
+        return remotes
+
+    def allocate(self, handles, initial=False, params={}):
+        if len(handles) > self.available_n:
+            raise error.Error('Requested {} handles, but only have {} recordings'.format(len(handles), self.available_n))
+        self.n = len(handles)
+        self._handles = handles
+
+    def close(self):
+        pass
+
+class ReplayClock(object):
+    """Tracks how far into a recording a replay has got.
+
+    Each tick() returns the recording time to play up to. With a speed,
+    that's `speed` times the wall-clock time since the first tick; with
+    speed None, it moves on by 1/fps per tick.
+    """
+
+    def __init__(self, start, speed, fps):
+        self.start = start
+        self.speed = speed
+        self.interval = 1. / fps
+
+        self._ticks = 0
+        self._began_at = None
+
+    def tick(self):
+        if self.speed is None:
+            timestamp = self.start + self._ticks * self.interval
+            self._ticks += 1
+            return timestamp
+
+        now = time.time()
+        if self._began_at is None:
+            self._began_at = now
+        return self.start + (now - self._began_at) * self.speed
+
+    def until(self, timestamp):
+        """Wall-clock seconds until tick() reaches `timestamp`."""
+        if self.speed is None or self._began_at is None:
+            # The next tick gets there (or is the first)
+            return 0
+        return max((timestamp - self.start) / self.speed - (time.time() - self._began_at), 0)
+
+def parse_speed(speed):
+    """Returns a replay speed as a multiple of realtime, or None for
+    'max'."""
+    if speed in ('max', None):
+        return None
+    try:
+        parsed = float(speed)
+    except ValueError:
+        parsed = 0
+    if not parsed > 0:
+        raise error.Error('Replay speed must be a positive number or "max", not {!r}'.format(speed))
+    return parsed
+
+def format_address(logfile_dir, speed, fps):
+    return '{}?{}'.format(logfile_dir, urlparse.urlencode([('speed', speed), ('fps', fps)]))
+
+def parse_address(address):
+    """Returns the recording directory, speed and fps from an address
+    made by ReplayRecordings."""
+    logfile_dir, _, query = address.partition('?')
+    query = urlparse.parse_qs(query)
+    speed = parse_speed(query.get('speed', ['1'])[0])
+    fps = float(query.get('fps', ['60'])[0])
+    return logfile_dir, speed, fps
+
+def recording_start(logfile_dir):
+    """When a recording's server.fbs starts, which is where replays of
+    it begin."""
+    reader = fbs_reader.FBSReader(os.path.join(logfile_dir, 'server.fbs'))
+    try:
+        return reader.start
+    finally:
+        reader.close()
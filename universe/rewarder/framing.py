@@ -0,0 +1,109 @@
+"""Binary frames for the rewarder's most frequent messages.
+
+Every rewarder message is normally a JSON text frame. A client can
+offer the BINARY_PROTOCOL websocket subprotocol when it connects; if
+the rewarder accepts it, the rewarder sends v0.env.reward and
+v0.env.observation as binary frames: a fixed struct header, the
+episode_id, and then whatever of the body isn't fixed-size as JSON.
+Everything else stays JSON, as does everything sent to or by peers
+which don't know about this.
+
+decode() returns the same {'method', 'body', 'headers'} dict as the
+JSON would have, except that rewards are always floats.
+"""
+import struct
+
+import six
+import ujson
+
+from universe import error
+
+BINARY_PROTOCOL = 'openai.rewarder.binary.v1'
+
+REWARD = 1
+OBSERVATION = 2
+
+METHODS = {
+    'v0.env.reward': REWARD,
+    'v0.env.observation': OBSERVATION,
+}
+
+# kind, message_id, sent_at
+_header = struct.Struct('<BQd')
+# reward, done, len(episode_id)
+_reward = struct.Struct('<d?H')
+# len(episode_id)
+_observation = struct.Struct('<H')
+
+# The body keys each kind of frame has room for
+_body_keys = {
+    REWARD: {'reward', 'done', 'info'},
+    OBSERVATION: {'observation'},
+}
+
+def encode(method, body, headers):
+    """The binary frame for a message, or None if it has to be sent as
+    JSON (because it's not one of METHODS, or has headers, body keys
+    or values the frame has no room for)."""
+    kind = METHODS.get(method)
+    if kind is None or len(headers) != 3 or set(body) != _body_keys[kind]:
+        return None
+    episode_id = headers.get('episode_id')
+    if not isinstance(episode_id, six.string_types):
+        return None
+    episode_id = episode_id.encode('utf-8')
+    header = _header.pack(kind, headers['message_id'], headers['sent_at'])
+
+    if kind == REWARD:
+        reward = body['reward']
+        done = body['done']
+        info = body['info']
+        if not isinstance(reward, (int, float)) or not isinstance(done, bool) or not isinstance(info, dict):
+            return None
+        return b''.join([
+            header,
+            _reward.pack(reward, done, len(episode_id)),
+            episode_id,
+            ujson.dumps(info).encode('utf-8') if info else b'',
+        ])
+    else:
+        return b''.join([
+            header,
+            _observation.pack(len(episode_id)),
+            episode_id,
+            ujson.dumps(body['observation']).encode('utf-8'),
+        ])
+
+def decode(payload):
+    kind, message_id, sent_at = _header.unpack_from(payload)
+    offset = _header.size
+    if kind == REWARD:
+        reward, done, length = _reward.unpack_from(payload, offset)
+        offset += _reward.size
+        rest = payload[offset+length:]
+        method = 'v0.env.reward'
+        body = {
+            'reward': reward,
+            'done': done,
+            'info': ujson.loads(rest) if rest else {},
+        }
+    elif kind == OBSERVATION:
+        length, = _observation.unpack_from(payload, offset)
+        offset += _observation.size
+        method = 'v0.env.observation'
+        body = {
+            'observation': ujson.loads(payload[offset+length:]),
+        }
+    else:
+        raise error.Error('Unrecognized binary rewarder message: kind={}'.format(kind))
+
+    episode_id = payload[offset:offset+length].decode('utf-8')
+    return {
+        'method': method,
+        'body': body,
+        'headers': {
+            'message_id': message_id,
+            'sent_at': sent_at,
+            'episode_id': episode_id,
+        },
+    }
@@ -1,6 +1,9 @@
-from universe import error
+import numpy as np
 import six
 
+from universe import error
+from universe.vectorized import columns
+
 def merge_infos(info1, info2):
     """We often need to aggregate together multiple infos. Most keys can
     just be clobbered by the new info, but e.g. any keys which contain
@@ -28,12 +31,18 @@ def merge_infos(info1, info2):
             info1[key] = value
 
 def merge_reward_n(accum_reward_n, reward_n):
+    if isinstance(accum_reward_n, np.ndarray):
+        accum_reward_n += reward_n
+        return
     for i in range(len(reward_n)):
         if reward_n[i] is not None:
             # Add rewards
             accum_reward_n[i] += reward_n[i]
 
 def merge_done_n(accum_done_n, done_n):
+    if isinstance(accum_done_n, np.ndarray):
+        accum_done_n |= done_n
+        return
     for i in range(len(done_n)):
         # Copy over done if the episode is indeed none
         if done_n[i]:
@@ -77,5 +86,11 @@ def merge_n(
     for accum_info_i, info_i in zip(accum_info_n, info['n']):
         merge_infos(accum_info_i, info_i)
 
+    # Stats returned as columns (see vectorized.columns) are merged
+    # the same way, column by column
+    accum_columns = accum_info.get('columns')
     merge_infos(accum_info, info)
+    if accum_columns is not None and 'columns' in info:
+        columns.merge(accum_columns, info['columns'])
+        accum_info['columns'] = accum_columns
     accum_info['n'] = accum_info_n
@@ -18,6 +18,7 @@ from autobahn.twisted import websocket
 from universe.twisty import reactor
 
 from universe import error, utils
+from universe.rewarder import framing
 
 logger = logging.getLogger(__name__)
 
@@ -36,9 +37,14 @@ class RewarderProtocol(websocket.WebSocketServerProtocol):
         self._message_id = 0
         self._request = request
         self._observer = request.headers.get('openai-observer') == 'true'
+        # Clients which know about binary frames offer them as a
+        # subprotocol; everyone else gets JSON
+        self._binary = framing.BINARY_PROTOCOL in request.protocols
         self.password = password
 
-        logger.info('Client connecting: peer=%s observer=%s', request.peer, self._observer)
+        logger.info('Client connecting: peer=%s observer=%s binary=%s', request.peer, self._observer, self._binary)
+        if self._binary:
+            return framing.BINARY_PROTOCOL
 
     def authenticate(self, request):
         # Ugly, but it'll have to do for now.
@@ -117,6 +123,13 @@ class RewarderProtocol(websocket.WebSocketServerProtocol):
         if headers:
             new_headers.update(headers)
 
+        if self._binary:
+            encoded = framing.encode(method, body, new_headers)
+            if encoded is not None:
+                logger.debug('Sending binary rewarder message: method=%s body=%s headers=%s', method, body, new_headers)
+                self.sendMessage(encoded, True)
+                return
+
         payload = {
             'method': method,
             'body': body,
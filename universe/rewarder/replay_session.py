@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+
+from universe import error
+from universe.remotes import replay
+from universe.rewarder import reward_buffer, rewarder_client
+
+logger = logging.getLogger(__name__)
+
+# Replies to requests the recording client made, which we never made
+# ourselves
+IGNORED_METHODS = ['v0.reply.error', 'v0.reply.control.ping', 'v0.reply.env.action', 'v0.connection.close']
+
+class ReplayRewarderSession(object):
+    """A RewarderSession driver which plays back recorded rewards.demo
+    files, for remotes from ReplayRecordings.
+
+    The rewarder's messages are fed through a RewarderClient into a
+    RewardBuffer, as if they'd arrived over the network, up to the
+    connection's ReplayClock on each pop(). Those which came before
+    the recording's server.fbs starts only set up the environment's
+    state: their rewards and text are dropped.
+    """
+
+    def __init__(self):
+        self._replays = {}
+
+    def connect(self, name, address, label, password, env_id=None, seed=None, fps=60,
+                start_timeout=None, observer=False, skip_network_calibration=False):
+        if name in self._replays:
+            self.close(name)
+
+        logfile_dir, speed, fps = replay.parse_address(address)
+        start = replay.recording_start(logfile_dir)
+        messages = load_messages(os.path.join(logfile_dir, 'rewards.demo'))
+        rewards_replay = RewardsReplay(label, messages)
+        rewards_replay.advance(start, rewards=False)
+        self._replays[name] = rewards_replay, replay.ReplayClock(start, speed, fps)
+        # There's no network to calibrate against
+        return None
+
+    def pop(self, warn=True, peek_d=None):
+        if peek_d is None:
+            peek_d = {}
+        reward_d = {}
+        done_d = {}
+        info_d = {}
+        for name, (rewards_replay, clock) in self._replays.items():
+            timestamp = clock.tick()
+            rewards_replay.advance(timestamp)
+            reward, done, info = rewards_replay.reward_buffer.pop(peek_d.get(name))
+            info['replay.timestamp'] = timestamp
+            reward_d[name] = reward
+            done_d[name] = done
+            info_d[name] = info
+        return reward_d, done_d, info_d, self.pop_errors()
+
+    def pop_errors(self):
+        errors = {}
+        for name, (rewards_replay, _) in self._replays.items():
+            if rewards_replay.errors:
+                errors[name] = rewards_replay.errors.pop(0)
+        return errors
+
+    def reset(self, seed=None, env_id=None):
+        logger.info('Recorded environments cannot be reset, so continuing the replay')
+
+    def send_action(self, action_n, env_id):
+        return self.pop_errors()
+
+    def close(self, name=None):
+        if name is None:
+            self._replays.clear()
+        else:
+            self._replays.pop(name, None)
+
+class RewardsReplay(object):
+    """Replays one recording's rewarder messages into a RewardBuffer."""
+
+    def __init__(self, label, messages):
+        self.label = label
+        self.messages = messages
+        self.position = 0
+        self.errors = []
+
+        self.reward_buffer = reward_buffer.RewardBuffer(label)
+        self.client = rewarder_client.RewarderClient()
+        self.client.factory = self
+        self.client.reward_buffer = self.reward_buffer
+        # Whether an episode is active. The recording may not include
+        # the reset which started it, so we start the first one we
+        # hear about, as a live session attaching to a running
+        # environment would.
+        self._attached = False
+
+    def record_error(self, e):
+        self.errors.append(e)
+
+    def advance(self, timestamp, rewards=True):
+        """Deliver every message up to and including `timestamp`."""
+        while self.position < len(self.messages) and self.messages[self.position][0] <= timestamp:
+            received_at, message = self.messages[self.position]
+            self.position += 1
+
+            method = message['method']
+            headers = message['headers']
+            if method in IGNORED_METHODS:
+                continue
+            if not rewards and method in ['v0.env.reward', 'v0.env.text', 'v0.env.observation']:
+                continue
+            if method == 'v0.reply.env.reset':
+                self._attached = True
+                headers = dict(headers)
+                headers.pop('parent_message_id', None)
+            elif not self._attached and headers.get('episode_id') is not None:
+                self._attached = True
+                self.reward_buffer.reset(headers['episode_id'])
+
+            self.client.recv({'start': received_at}, {'method': method, 'body': message['body'], 'headers': headers})
+
+def load_messages(path):
+    """Returns (timestamp, message) for each message the rewarder sent
+    in a rewards.demo, in the order they were recorded."""
+    messages = []
+    with open(path) as f:
+        header = f.readline()
+        try:
+            version = json.loads(header).get('version')
+        except ValueError:
+            version = None
+        if version != 1:
+            raise error.Error('Unrecognized rewards.demo version in {}: {!r}'.format(path, header[:100]))
+
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The recorder was killed partway through a line
+                logger.info('Ignoring unreadable line in %s: %r', path, line[:100])
+                continue
+            if record['from_rewarder']:
+                messages.append((record['timestamp'], record['message']))
+    return messages
@@ -7,6 +7,7 @@ from autobahn.twisted import websocket
 from twisted.internet import defer
 
 from universe import error
+from universe.rewarder import framing
 
 logger = logging.getLogger(__name__)
 extra_logger = logging.getLogger('universe.extra.'+__name__)
@@ -178,8 +179,11 @@ class RewarderClient(websocket.WebSocketClientProtocol):
 
     def onMessage(self, payload, isBinary):
         extra_logger.debug('[%s] Received payload: %s', self.factory.label, payload)
-        assert not isBinary
-        payload = ujson.loads(payload)
+        if isBinary:
+            # Only sent if we offered framing.BINARY_PROTOCOL
+            payload = framing.decode(payload)
+        else:
+            payload = ujson.loads(payload)
 
         context = self._make_context()
         latency = context['start'] - payload['headers']['sent_at']
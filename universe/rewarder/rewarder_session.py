@@ -10,7 +10,7 @@ import twisted.internet.error
 
 from universe import utils
 from universe.twisty import reactor
-from universe.rewarder import connection_timer, env_status, reward_buffer, rewarder_client
+from universe.rewarder import connection_timer, env_status, framing, reward_buffer, rewarder_client
 from universe.utils import display
 
 logger = logging.getLogger(__name__)
@@ -105,7 +105,9 @@ class RewarderSession(object):
                  attempt=0, elapsed_sleep_time=0,
     ):
         endpoint = endpoints.clientFromString(reactor, 'tcp:'+address)
-        factory = websocket.WebSocketClientFactory('ws://'+address)
+        # Rewarders which know about binary frames will use them for
+        # the frequent messages; older ones ignore the offer
+        factory = websocket.WebSocketClientFactory('ws://'+address, protocols=[framing.BINARY_PROTOCOL])
         factory.protocol = rewarder_client.RewarderClient
 
         assert password, "Missing password: {} for rewarder session".format(password)
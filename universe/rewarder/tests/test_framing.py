@@ -0,0 +1,61 @@
+import time
+
+import ujson
+
+from universe.rewarder import framing, reward_buffer, rewarder_client
+
+def headers(**kwargs):
+    headers = {'message_id': 7, 'sent_at': time.time(), 'episode_id': '3'}
+    headers.update(kwargs)
+    return headers
+
+def test_reward():
+    sent = headers()
+    for info in [{}, {'rewarder.lag.observation.timestamp': 1.5, 'key': 'value'}]:
+        encoded = framing.encode('v0.env.reward', {'reward': 2, 'done': True, 'info': info}, sent)
+        assert isinstance(encoded, bytes)
+        assert framing.decode(encoded) == {
+            'method': 'v0.env.reward',
+            'body': {'reward': 2.0, 'done': True, 'info': info},
+            'headers': sent,
+        }
+
+def test_observation():
+    sent = headers(episode_id=u'\xe9pisode')
+    body = {'observation': {'text': ['a', 'b'], 'score': [1, 2.5]}}
+    encoded = framing.encode('v0.env.observation', body, sent)
+    assert framing.decode(encoded) == {'method': 'v0.env.observation', 'body': body, 'headers': sent}
+
+def test_falls_back_to_json():
+    # Other methods, extra headers, and values the frame can't hold
+    assert framing.encode('v0.env.describe', {'env_id': 'a', 'env_state': 'running', 'fps': 60}, headers()) is None
+    assert framing.encode('v0.env.reward', {'reward': 1, 'done': False, 'info': {}}, headers(parent_message_id=1)) is None
+    assert framing.encode('v0.env.reward', {'reward': None, 'done': False, 'info': {}}, headers()) is None
+    assert framing.encode('v0.env.reward', {'reward': 1, 'done': False, 'info': {}}, headers(episode_id=None)) is None
+    assert framing.encode('v0.env.reward', {'reward': 1, 'done': False, 'info': None}, headers()) is None
+    # Body keys other than the ones the frame holds
+    assert framing.encode('v0.env.reward', {'reward': 1, 'done': False, 'info': {}, 'extra': 1}, headers()) is None
+    assert framing.encode('v0.env.reward', {'reward': 1, 'done': False}, headers()) is None
+    assert framing.encode('v0.env.observation', {'observation': {}, 'extra': 1}, headers()) is None
+    assert framing.encode('v0.env.observation', {}, headers()) is None
+
+class Factory(object):
+    label = 'test'
+
+    def __init__(self):
+        self.reward_buffer = reward_buffer.RewardBuffer('test')
+
+def test_client_receives_both():
+    client = rewarder_client.RewarderClient()
+    client.factory = Factory()
+    client.reward_buffer = client.factory.reward_buffer
+    client._requests = {}
+    client.reward_buffer.reset('3')
+
+    body = {'reward': 1, 'done': False, 'info': {'key': 'value'}}
+    client.onMessage(framing.encode('v0.env.reward', body, headers()), True)
+    client.onMessage(ujson.dumps({'method': 'v0.env.reward', 'body': body, 'headers': headers()}).encode('utf-8'), False)
+    reward, done, info = client.reward_buffer.pop()
+    assert reward == 2
+    assert not done
+    assert info['key'] == 'value'
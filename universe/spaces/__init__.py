@@ -1,6 +1,6 @@
 from universe.spaces.hardcoded import Hardcoded
 from universe.spaces.vnc_action_space import VNCActionSpace
-from universe.spaces.vnc_event import VNCEvent, KeyEvent, PointerEvent
+from universe.spaces.vnc_event import VNCEvent, KeyEvent, PointerEvent, event_dtype, event_array, event_batch, key_events, pointer_events
 from universe.spaces.vnc_observation_space import VNCObservationSpace
 
 from universe.spaces.diagnostics import PeekReward
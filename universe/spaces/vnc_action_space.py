@@ -1,4 +1,5 @@
 import gym
+import numpy as np
 import string
 
 from gym.spaces import prng
@@ -19,6 +20,8 @@ class VNCActionSpace(gym.Space):
     the mouse buttons is provided at each timestep, so you have to
     explicitly keep the mouse down.
 
+    Actions can also be event arrays (see vnc_event.event_dtype).
+
     Attributes:
         keys (list<KeyEvent>): The allowed key presses
         buttonmasks (list<int>): The allowed buttonmasks (i.e. mouse presses)
@@ -35,6 +38,7 @@ class VNCActionSpace(gym.Space):
             self.keys.append(down)
             self.keys.append(up)
         self._key_set = set(self.keys)
+        self._keysyms = np.array(sorted(set(key.key for key in self.keys)), dtype=np.uint32)
 
         self.screen_shape = screen_shape
         if self.screen_shape is not None:
@@ -46,6 +50,8 @@ class VNCActionSpace(gym.Space):
             self._buttonmask_set = set(self.buttonmasks)
 
     def contains(self, action):
+        if isinstance(action, np.ndarray):
+            return self._contains_array(action)
         if not isinstance(action, list):
             return False
 
@@ -66,6 +72,29 @@ class VNCActionSpace(gym.Space):
 
         return True
 
+    def _contains_array(self, action):
+        if action.dtype != vnc_event.event_dtype:
+            return False
+
+        types = action['type']
+        keys = action[types == vnc_event.KEY_EVENT]
+        pointers = action[types == vnc_event.POINTER_EVENT]
+        if len(keys) + len(pointers) + np.count_nonzero(types == vnc_event.NO_EVENT) != action.size:
+            return False
+
+        if not np.all(np.isin(keys['key_or_x'], self._keysyms)) or np.any(keys['down_or_buttonmask'] > 1):
+            return False
+
+        if len(pointers) > 0:
+            if self.screen_shape is None:
+                return False
+            if np.any(pointers['key_or_x'] > self.screen_shape[0]) or np.any(pointers['y'] > self.screen_shape[1]):
+                return False
+            if not np.all(np.isin(pointers['down_or_buttonmask'], self.buttonmasks)):
+                return False
+
+        return True
+
     def sample(self):
         # Both key and pointer allowed
         if self.screen_shape is not None:
@@ -1,3 +1,5 @@
+import numpy as np
+import six
 import string
 from universe import error
 from universe.vncdriver import constants
@@ -90,8 +92,99 @@ class PointerEvent(VNCEvent):
     def compile(self):
         return 'PointerEvent', self.x, self.y, self.buttonmask
 
+    def __hash__(self):
+        return (self.x, self.y, self.buttonmask).__hash__()
+
+    def __eq__(self, other):
+        return type(other) == type(self) and \
+            other.x == self.x and \
+            other.y == self.y and \
+            other.buttonmask == self.buttonmask
+
     def __repr__(self):
         return 'PointerEvent<x={} y={} buttonmask={}>'.format(self.x, self.y, self.buttonmask)
 
     def __str__(self):
         return repr(self)
+
+# Event arrays hold events as rows of event_dtype, rather than as
+# objects: one array per action, or an (n, k) batch of n actions,
+# padded with NO_EVENT rows. The types are the client message types
+# the events are sent as.
+NO_EVENT = 0
+KEY_EVENT = 4
+POINTER_EVENT = 5
+
+event_dtype = np.dtype([
+    ('type', np.uint8),
+    # keysym for a KeyEvent, x for a PointerEvent
+    ('key_or_x', np.uint32),
+    ('y', np.uint16),
+    # down for a KeyEvent, buttonmask for a PointerEvent
+    ('down_or_buttonmask', np.uint8),
+])
+
+def key_events(key, down=True):
+    """An event array of KeyEvents, one per element of `key` (keysyms,
+    as from keycode) and `down`, which are broadcast together."""
+    key, down = np.broadcast_arrays(key, down)
+    events = np.zeros(key.shape, dtype=event_dtype)
+    events['type'] = KEY_EVENT
+    events['key_or_x'] = key
+    events['down_or_buttonmask'] = down
+    return events
+
+def pointer_events(x, y, buttonmask=0):
+    """An event array of PointerEvents, one per element of `x`, `y` and
+    `buttonmask`, which are broadcast together."""
+    x, y, buttonmask = np.broadcast_arrays(x, y, buttonmask)
+    events = np.zeros(x.shape, dtype=event_dtype)
+    events['type'] = POINTER_EVENT
+    events['key_or_x'] = x
+    events['y'] = y
+    events['down_or_buttonmask'] = buttonmask
+    return events
+
+def event_array(events, length=None):
+    """Convert a list of events (VNCEvents, or their compiled tuples) to
+    an event array, padded with NO_EVENT rows to `length` if given."""
+    array = np.zeros(max(len(events), length or 0), dtype=event_dtype)
+    for i, event in enumerate(events):
+        if isinstance(event, VNCEvent):
+            event = event.compile()
+        if event[0] == 'KeyEvent':
+            _, key, down = event
+            if isinstance(key, six.string_types):
+                key = keycode(key)
+            array[i] = (KEY_EVENT, key, 0, down)
+        elif event[0] == 'PointerEvent':
+            _, x, y, buttonmask = event
+            array[i] = (POINTER_EVENT, x, y, buttonmask)
+        else:
+            raise error.Error('Unsupported event: {!r}'.format(event))
+    return array
+
+def event_batch(action_n):
+    """Convert a list of n actions to an (n, k) event array, where k is
+    the length of the longest."""
+    length = max([len(action) for action in action_n] or [0])
+    batch = np.zeros((len(action_n), length), dtype=event_dtype)
+    for i, action in enumerate(action_n):
+        if isinstance(action, np.ndarray):
+            batch[i, :len(action)] = action
+        else:
+            batch[i] = event_array(action, length)
+    return batch
+
+def compile_event_array(events):
+    """The compiled tuples for an event array's events, skipping
+    NO_EVENT rows."""
+    compiled = []
+    for type, key_or_x, y, down_or_buttonmask in events.tolist():
+        if type == KEY_EVENT:
+            compiled.append(('KeyEvent', key_or_x, bool(down_or_buttonmask)))
+        elif type == POINTER_EVENT:
+            compiled.append(('PointerEvent', key_or_x, y, down_or_buttonmask))
+        elif type != NO_EVENT:
+            raise error.Error('Bad event type in event array: {}'.format(type))
+    return compiled
@@ -207,3 +207,49 @@ def exit_on_signal():
     signal.signal(signal.SIGHUP, shutdown)
     signal.signal(signal.SIGINT, shutdown)
     signal.signal(signal.SIGTERM, shutdown)
+
+class LRUCache(object):
+    """A mapping which keeps at least the `size` most recently used
+    items, and at most 2*size.
+
+    Items live in two generations: lookups move items up from the old
+    generation to the new, and once the new one holds `size` items it
+    becomes the old one, dropping whatever was left there. Unlike
+    keeping a strict recency order, a hit costs one dict lookup, which
+    matters when hashing the keys is most of the work.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._new = {}
+        self._old = {}
+
+    def get(self, key, default=None):
+        value = self._new.get(key, _missing)
+        if value is not _missing:
+            return value
+        if not self._old:
+            return default
+        value = self._old.pop(key, _missing)
+        if value is _missing:
+            return default
+        self[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._new[key] = value
+        if len(self._new) >= self.size:
+            self._old = self._new
+            self._new = {}
+
+    def __contains__(self, key):
+        return key in self._new or key in self._old
+
+    def __len__(self):
+        return len(self._new) + len(self._old)
+
+    def clear(self):
+        self._new.clear()
+        self._old.clear()
+
+_missing = object()
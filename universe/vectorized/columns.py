@@ -0,0 +1,76 @@
+"""Per-environment stats as columns.
+
+With VNCEnv.configure(result_arrays=True), step() returns the common
+per-environment stats in info['columns'], as arrays with a row per
+environment, rather than as keys of each info['n'][i]. Missing values
+are NaN.
+"""
+import numpy as np
+
+# Stats which are kept as columns, with the shape of their values
+STATS = {
+    'stats.reward.count': (),
+    'stats.vnc.updates.n': (),
+    'stats.vnc.updates.rectangles': (),
+    'stats.vnc.updates.pixels': (),
+    'stats.vnc.updates.bytes': (),
+    # (min, max), over the possible clock skew
+    'stats.gauges.diagnostics.clock_skew': (2,),
+    'stats.gauges.diagnostics.lag.observation': (2,),
+    'stats.gauges.diagnostics.lag.action': (2,),
+    'stats.gauges.diagnostics.lag.reward': (2,),
+    'stats.gauges.diagnostics.lag.rewarder_message': (2,),
+}
+
+# Those which VNCEnv produces, and those which diagnostics add later
+ENV_STATS = [key for key in STATS if not key.startswith('stats.gauges.diagnostics.')]
+DIAGNOSTICS_STATS = [key for key in STATS if key.startswith('stats.gauges.diagnostics.')]
+
+def pop(info_n, keys, columns=None):
+    """Move `keys` out of each of info_n into columns, a dict of arrays,
+    which is returned (and made if None)."""
+    if columns is None:
+        columns = {}
+    nan = float('nan')
+    for key in keys:
+        shape = STATS[key]
+        if not shape:
+            # NumPy turns None into NaN for us
+            columns[key] = np.array([info.pop(key, nan) for info in info_n], dtype=np.float64)
+            continue
+
+        column = columns[key] = np.full((len(info_n),) + shape, np.nan)
+        values = [info.pop(key, None) for info in info_n]
+        present = [i for i, value in enumerate(values) if value is not None]
+        if present:
+            column[present] = [values[i] for i in present]
+    return columns
+
+def merge(accum_columns, columns):
+    """Merge a later step's columns into accum_columns, as
+    rewarder.merge_infos does for infos: gauges take the latest value,
+    and other stats are added up."""
+    for key, column in columns.items():
+        accum = accum_columns.get(key)
+        if accum is None:
+            accum_columns[key] = column.copy()
+        elif key.startswith('stats.gauges'):
+            present = ~np.isnan(column)
+            accum[present] = column[present]
+        else:
+            accum[...] = np.where(np.isnan(accum), column, np.where(np.isnan(column), accum, accum + column))
+
+def row(info, i):
+    """info['n'][i], with its stats from info['columns'] filled back
+    in, for code which wants one environment's stats together."""
+    info_i = info['n'][i]
+    columns = info.get('columns')
+    if not columns:
+        return info_i
+
+    info_i = dict(info_i)
+    for key, column in columns.items():
+        value = column[i]
+        if not np.all(np.isnan(value)):
+            info_i[key] = value
+    return info_i
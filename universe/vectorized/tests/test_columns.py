@@ -0,0 +1,52 @@
+import numpy as np
+
+from universe import rewarder
+from universe.vectorized import columns
+
+def test_pop():
+    info_n = [
+        {'stats.reward.count': 2, 'stats.vnc.updates.n': 1, 'env_status.env_state': 'running'},
+        {'stats.gauges.diagnostics.lag.observation': np.array([0.1, 0.2]), 'stats.vnc.updates.n': None},
+        {},
+    ]
+    cols = columns.pop(info_n, columns.ENV_STATS)
+    assert info_n[0] == {'env_status.env_state': 'running'}
+    assert cols['stats.reward.count'][0] == 2
+    assert np.isnan(cols['stats.reward.count'][1:]).all()
+    assert set(cols) == set(columns.ENV_STATS)
+
+    columns.pop(info_n, columns.DIAGNOSTICS_STATS, cols)
+    assert info_n[1] == {}
+    lag = cols['stats.gauges.diagnostics.lag.observation']
+    assert lag.shape == (3, 2)
+    assert np.array_equal(lag[1], [0.1, 0.2])
+    assert np.isnan(lag[0]).all()
+
+def test_row():
+    info = {'n': [{'a': 1}, {}]}
+    info['columns'] = columns.pop([{'stats.reward.count': 3}, {}], ['stats.reward.count'])
+    assert columns.row(info, 0) == {'a': 1, 'stats.reward.count': 3}
+    assert columns.row(info, 1) == {}
+    # The infos themselves are left alone
+    assert info['n'][0] == {'a': 1}
+
+def test_merge():
+    accum = columns.pop([{'stats.reward.count': 1, 'stats.gauges.diagnostics.clock_skew': np.array([1., 2.])}, {}], ['stats.reward.count', 'stats.gauges.diagnostics.clock_skew'])
+    later = columns.pop([{'stats.reward.count': 2}, {'stats.reward.count': 5, 'stats.gauges.diagnostics.clock_skew': np.array([3., 4.])}], ['stats.reward.count', 'stats.gauges.diagnostics.clock_skew'])
+    columns.merge(accum, later)
+    assert np.array_equal(accum['stats.reward.count'], [3, 5])
+    assert np.array_equal(accum['stats.gauges.diagnostics.clock_skew'], [[1., 2.], [3., 4.]])
+
+def test_merge_n_arrays():
+    accum_observation_n = [None, None]
+    accum_reward_n = np.array([1., 0.])
+    accum_done_n = np.array([False, True])
+    accum_info = {'n': [{}, {}], 'columns': columns.pop([{'stats.reward.count': 1}, {}], ['stats.reward.count'])}
+    rewarder.merge_n(
+        accum_observation_n, accum_reward_n, accum_done_n, accum_info,
+        [None, None], np.array([2., 3.]), np.array([True, False]),
+        {'n': [{}, {}], 'columns': columns.pop([{'stats.reward.count': 2}, {'stats.reward.count': 1}], ['stats.reward.count'])},
+    )
+    assert np.array_equal(accum_reward_n, [3., 3.])
+    assert np.array_equal(accum_done_n, [True, True])
+    assert np.array_equal(accum_info['columns']['stats.reward.count'], [3, 1])
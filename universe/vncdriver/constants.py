@@ -10,6 +10,12 @@ ZLIBHEX_ENCODING =              8
 ZRLE_ENCODING =                 16
 #0xffffff00 to 0xffffffff tight options
 PSEUDO_CURSOR_ENCODING =        -239
+# Tight tuning: each of these starts a range of levels
+COMPRESS_LEVEL_0_ENCODING =     -256  # to -247
+QUALITY_LEVEL_0_ENCODING =      -32   # to -23
+# TurboVNC extensions
+FINE_QUALITY_LEVEL_0_ENCODING = -512  # to -412
+SUBSAMPLE_LEVEL_0_ENCODING =    -768  # 1x, 4x, 2x, gray
 
 # Keycodes
 KEY_BackSpace = 0xff08
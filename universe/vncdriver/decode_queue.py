@@ -0,0 +1,62 @@
+import collections
+import logging
+import threading
+import time
+
+from universe import pyprofile
+
+logger = logging.getLogger(__name__)
+
+class DecodeQueue(object):
+    """Runs one connection's decode jobs on a shared thread pool, one
+    at a time and in the order they were submitted.
+
+    Ordering matters both for the connection's zlib stream state and
+    for applying framebuffer updates. Each job runs as its own pool
+    call, so a busy connection takes turns with the others rather than
+    hogging a thread.
+
+    Queue depth and per-job latency (from submission to completion)
+    are reported to pyprofile under vncdriver.decode_queue.<label>.
+    """
+
+    def __init__(self, pool, label, errback):
+        self.pool = pool
+        self.errback = errback
+        self._depth_key = 'vncdriver.decode_queue.{}.depth'.format(label)
+        self._latency_key = 'vncdriver.decode_queue.{}.latency'.format(label)
+
+        self._lock = threading.Lock()
+        self._jobs = collections.deque()
+        self._running = False
+
+    def depth(self):
+        """Jobs queued or running."""
+        with self._lock:
+            return len(self._jobs) + self._running
+
+    def submit(self, fn, *args):
+        with self._lock:
+            self._jobs.append((fn, args, time.time()))
+            depth = len(self._jobs) + self._running
+            start = not self._running
+            self._running = True
+        pyprofile.gauge(self._depth_key, depth)
+        if start:
+            self.pool.callInThread(self._run_one)
+
+    def _run_one(self):
+        with self._lock:
+            fn, args, submitted = self._jobs.popleft()
+
+        try:
+            fn(*args)
+        except Exception as e:
+            self.errback(e)
+        pyprofile.timing(self._latency_key, time.time() - submitted)
+
+        with self._lock:
+            more = len(self._jobs) > 0
+            self._running = more
+        if more:
+            self.pool.callInThread(self._run_one)
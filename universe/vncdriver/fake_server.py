@@ -0,0 +1,503 @@
+import collections
+import itertools
+import logging
+import struct
+import zlib
+
+import numpy as np
+import six
+from twisted.internet import protocol, task
+
+from universe import error, twisty, utils
+from universe.twisty import reactor
+from universe.vncdriver import auth, constants, framing, vnc_client
+from universe.vncdriver.screen import damage
+
+logger = logging.getLogger(__name__)
+
+CONTENT = ['noise', 'scroll', 'solid', 'sprite']
+ENCODINGS = [
+    constants.COPY_RECTANGLE_ENCODING,
+    constants.ZRLE_ENCODING,
+    constants.ZLIB_ENCODING,
+    constants.RAW_ENCODING,
+    constants.PSEUDO_CURSOR_ENCODING,
+]
+
+class FakeScene(object):
+    """Synthetic screen content which changes a little each tick.
+
+    content picks from:
+
+    - noise: a patch of random pixels
+    - scroll: the screen scrolls up a few rows, with new rows below
+    - solid: a rectangle of one color
+    - sprite: a small image moving across the screen
+
+    tick() returns the tick's changes, in an order which reproduces
+    the new frame when applied to the old one: ('copy', src_x, src_y,
+    x, y, width, height) for scrolling, and ('rect', x, y, width,
+    height) for regions to send from the new frame.
+    """
+
+    def __init__(self, width, height, content=None, seed=0):
+        if content is None:
+            content = CONTENT
+        for kind in content:
+            if kind not in CONTENT:
+                raise error.Error('Unknown fake screen content: {!r}. Must be one of {}'.format(kind, CONTENT))
+        self.width = width
+        self.height = height
+        self.content = content
+
+        self.rng = np.random.RandomState(seed)
+        self.frame = self.rng.randint(0, 256, size=(height, width, 3)).astype(np.uint8)
+        self.frame[height//2:] //= 4
+
+        self.patch = max(min(width, height) // 8, 1)
+        self.sprite = self.rng.randint(0, 256, size=(self.patch, self.patch, 3)).astype(np.uint8)
+        self.sprite_position = (0, 0)
+        self.sprite_background = self.frame[:self.patch, :self.patch].copy()
+
+    def tick(self):
+        changes = []
+        if 'scroll' in self.content and self.height > 4:
+            rows = 2
+            self._unpaint_sprite(changes)
+            self.frame[:-rows] = self.frame[rows:]
+            self.frame[-rows:] = self.rng.randint(0, 256, size=(rows, self.width, 3))
+            changes.append(('copy', 0, rows, 0, 0, self.width, self.height - rows))
+            changes.append(('rect', 0, self.height - rows, self.width, rows))
+        if 'noise' in self.content:
+            x, y, w, h = self._random_rectangle()
+            self._unpaint_sprite(changes)
+            self.frame[y:y+h, x:x+w] = self.rng.randint(0, 256, size=(h, w, 3))
+            changes.append(('rect', x, y, w, h))
+        if 'solid' in self.content:
+            x, y, w, h = self._random_rectangle()
+            self._unpaint_sprite(changes)
+            self.frame[y:y+h, x:x+w] = self.rng.randint(0, 256, size=3)
+            changes.append(('rect', x, y, w, h))
+        if 'sprite' in self.content:
+            self._unpaint_sprite(changes)
+            x, y = self.sprite_position
+            x = (x + 3) % max(self.width - self.patch, 1)
+            y = (y + 1) % max(self.height - self.patch, 1)
+            self.sprite_position = (x, y)
+            self.sprite_background = self.frame[y:y+self.patch, x:x+self.patch].copy()
+            self.frame[y:y+self.patch, x:x+self.patch] = self.sprite
+            changes.append(('rect', x, y, self.patch, self.patch))
+        return changes
+
+    def _random_rectangle(self):
+        w, h = self.rng.randint(1, self.patch + 1, size=2)
+        x = self.rng.randint(0, self.width - w + 1)
+        y = self.rng.randint(0, self.height - h + 1)
+        return x, y, w, h
+
+    def _unpaint_sprite(self, changes):
+        # So other content goes under the sprite, which is repainted
+        # at the end of the tick
+        if self.sprite_background is None or 'sprite' not in self.content:
+            return
+        x, y = self.sprite_position
+        self.frame[y:y+self.patch, x:x+self.patch] = self.sprite_background
+        self.sprite_background = None
+        changes.append(('rect', x, y, self.patch, self.patch))
+
+class FakeVNCServer(protocol.Protocol, framing.FramedProtocol):
+    """An RFB 3.3 server for synthetic content from a FakeScene, for
+    testing and load-testing VNC clients without a real environment.
+
+    Each connection gets its own scene, which ticks at the factory's
+    fps. Changes go out as soon as the client has asked for an update,
+    encoded with the factory's encodings (rotating between those the
+    client also accepts). Scrolling goes out as CopyRect if the client
+    takes it, and changes made while the client is busy are merged and
+    sent from the latest frame. Like a real server, it only sends the
+    part of the screen the client last asked for.
+    """
+
+    def __init__(self):
+        self.init_framing()
+        self.challenge = auth.challenge()
+        self.update_requested = False
+        self.client_encodings = []
+        self.key_events = 0
+        self.pointer_events = 0
+        self.updates_sent = 0
+        # Rectangles sent, by encoding
+        self.rectangles_sent = collections.Counter()
+
+        self._scene = None
+        self._ticker = None
+        # What the client has yet to see: rows scrolled, then regions
+        # to send from the latest frame
+        self._scroll = 0
+        self._backlog = []
+        # (x, y, width, height) from the last update request
+        self._region = None
+        self._cursor_sent = False
+        self._rotation = 0
+        # Fastest compression, so the server isn't what load tests
+        # measure
+        self._zlib = zlib.compressobj(1)
+        self._zrle = zlib.compressobj(1)
+        self._byte_order = None
+
+    def connectionMade(self):
+        self.factory.connections.append(self)
+        if hasattr(self.transport, 'setTcpNoDelay'):
+            # Updates are small and latency-sensitive, as with real
+            # VNC servers
+            self.transport.setTcpNoDelay(True)
+        self.transport.write(b'RFB 003.003\n')
+        self.expect(self.recv_ProtocolVersion, 12)
+
+    def connectionLost(self, reason):
+        if self in self.factory.connections:
+            self.factory.connections.remove(self)
+        if self._ticker is not None and self._ticker.running:
+            self._ticker.stop()
+
+    def dataReceived(self, data):
+        self.buf.append(data)
+        self.parse_buffer()
+
+    def handle(self, type, block):
+        try:
+            self.expected(block, *self.expected_args, **self.expected_kwargs)
+            return True
+        except Exception as e:
+            logger.error('[FakeVNCServer] Closing connection: %s', e)
+            self.expect(None, 1)
+            self.transport.loseConnection()
+            return False
+
+    def recv_ProtocolVersion(self, block):
+        block = block.tobytes()
+        if not block.startswith(b'RFB 003.'):
+            raise error.Error('Unsupported RFB version: {!r}'.format(block))
+        # VNC authentication
+        self.transport.write(struct.pack('!I', 2) + self.challenge)
+        self.expect(self.recv_VNC_Authentication_response, 16)
+
+    def recv_VNC_Authentication_response(self, block):
+        password = self.factory.password
+        if password is not None and block.tobytes() != auth.challenge_response(self.challenge, password):
+            reason = b'Your password was incorrect'
+            self.transport.write(struct.pack('!II', 1, len(reason)) + reason)
+            self.transport.loseConnection()
+            return
+        self.transport.write(struct.pack('!I', 0))
+        self.expect(self.recv_ClientInit, 1)
+
+    def recv_ClientInit(self, block):
+        factory = self.factory
+        self._scene = FakeScene(factory.width, factory.height, factory.content, seed=factory.next_seed())
+        self._set_pixel_format(SERVER_PIXEL_FORMAT)
+        name = b'fake'
+        self.transport.write(struct.pack('!HH16sI', factory.width, factory.height, SERVER_PIXEL_FORMAT, len(name)) + name)
+        # The client's screen starts out blank
+        self._backlog = [(0, 0, factory.width, factory.height)]
+
+        self._ticker = task.LoopingCall(self.tick)
+        self._ticker.clock = factory.clock or reactor
+        self._ticker.start(1. / factory.fps, now=False)
+        self.expect(self.recv_ClientToServer, 1)
+
+    def recv_ClientToServer(self, block):
+        (message_type,) = struct.unpack('!B', block)
+        if message_type == 0:
+            self.expect(self.recv_SetPixelFormat, 19)
+        elif message_type == 2:
+            self.expect(self.recv_SetEncodings, 3)
+        elif message_type == 3:
+            self.expect(self.recv_FramebufferUpdateRequest, 9)
+        elif message_type == 4:
+            self.expect(self.recv_KeyEvent, 7)
+        elif message_type == 5:
+            self.expect(self.recv_PointerEvent, 5)
+        elif message_type == 6:
+            self.expect(self.recv_ClientCutText, 7)
+        else:
+            raise error.Error('Unknown client to server message type: {}'.format(message_type))
+
+    def recv_SetPixelFormat(self, block):
+        (pixel_format,) = struct.unpack('!xxx16s', block)
+        self._set_pixel_format(pixel_format)
+        self.expect(self.recv_ClientToServer, 1)
+
+    def recv_SetEncodings(self, block):
+        (count,) = struct.unpack('!xH', block)
+        if count:
+            self.expect(self.recv_SetEncodings_list, 4 * count, count)
+        else:
+            self.client_encodings = []
+            self.expect(self.recv_ClientToServer, 1)
+
+    def recv_SetEncodings_list(self, block, count):
+        self.client_encodings = list(struct.unpack('!{}i'.format(count), block))
+        self.expect(self.recv_ClientToServer, 1)
+
+    def recv_FramebufferUpdateRequest(self, block):
+        (incremental, x, y, width, height) = struct.unpack('!BHHHH', block)
+        self._region = (x, y, width, height)
+        if not incremental:
+            self._backlog.append((x, y, width, height))
+        self.update_requested = True
+        if self._scroll or self._backlog:
+            self._send_backlog()
+        self.expect(self.recv_ClientToServer, 1)
+
+    def recv_KeyEvent(self, block):
+        self.key_events += 1
+        self.expect(self.recv_ClientToServer, 1)
+
+    def recv_PointerEvent(self, block):
+        self.pointer_events += 1
+        self.expect(self.recv_ClientToServer, 1)
+
+    def recv_ClientCutText(self, block):
+        (length,) = struct.unpack('!xxxI', block)
+        if length:
+            self.expect(self.recv_ClientCutText_value, length)
+        else:
+            self.expect(self.recv_ClientToServer, 1)
+
+    def recv_ClientCutText_value(self, block):
+        self.expect(self.recv_ClientToServer, 1)
+
+    def tick(self):
+        for change in self._scene.tick():
+            if change[0] == 'copy' and self._accepts(constants.COPY_RECTANGLE_ENCODING):
+                self._add_scroll(change)
+            else:
+                self._backlog.append(change[-4:])
+        if self.update_requested:
+            self._send_backlog()
+
+    def _accepts(self, encoding):
+        return encoding in self.client_encodings and encoding in self.factory.encodings
+
+    def _add_scroll(self, change):
+        # FakeScene only copies to scroll the whole screen up, so
+        # however many ticks the client is behind, one CopyRect
+        # catches it up. Regions already waiting to go out move up
+        # with the rest of the screen.
+        _, src_x, src_y, x, y, width, height = change
+        rows = src_y - y
+        self._scroll += rows
+        backlog = []
+        for x, y, width, height in self._backlog:
+            if y + height > rows:
+                backlog.append((x, max(y - rows, 0), width, y + height - max(y, rows)))
+        self._backlog = backlog
+
+    def _send_backlog(self):
+        width, height = self.factory.width, self.factory.height
+        region = self._region or (0, 0, width, height)
+        changes = []
+        if self._scroll >= height or (self._scroll and region != (0, 0, width, height)):
+            # A CopyRect could bring rows from outside the region,
+            # which the client never got, into it
+            self._backlog = [(0, 0, width, height)]
+        elif self._scroll:
+            changes.append(('copy', 0, self._scroll, 0, 0, width, height - self._scroll))
+        for rectangle in damage.merge_rectangles(self._backlog, width, height):
+            rectangle = _intersect(rectangle, region)
+            if rectangle is not None:
+                changes.append(('rect',) + rectangle)
+        self._scroll = 0
+        self._backlog = []
+        self._send_update(changes)
+
+    def _send_update(self, changes):
+        accepted = set(self.client_encodings) & set(self.factory.encodings)
+        encodings = [encoding for encoding in self.factory.encodings if encoding in accepted and encoding in PIXEL_ENCODERS]
+        if not encodings:
+            encodings = [constants.RAW_ENCODING]
+
+        rectangles = []
+        if constants.PSEUDO_CURSOR_ENCODING in accepted and not self._cursor_sent:
+            rectangles.append(self._encode_cursor())
+            self.rectangles_sent[constants.PSEUDO_CURSOR_ENCODING] += 1
+            self._cursor_sent = True
+        frame = self._scene.frame
+        for change in changes:
+            if change[0] == 'copy':
+                _, src_x, src_y, x, y, w, h = change
+                rectangles.append(struct.pack('!HHHHiHH', x, y, w, h, constants.COPY_RECTANGLE_ENCODING, src_x, src_y))
+                self.rectangles_sent[constants.COPY_RECTANGLE_ENCODING] += 1
+                continue
+            x, y, w, h = change[-4:]
+            if w == 0 or h == 0:
+                continue
+            encoding = encodings[self._rotation % len(encodings)]
+            self._rotation += 1
+            pixels = self._wire_pixels(frame[y:y+h, x:x+w])
+            rectangles.append(struct.pack('!HHHHi', x, y, w, h, encoding) + PIXEL_ENCODERS[encoding](self, pixels))
+            self.rectangles_sent[encoding] += 1
+
+        self.transport.write(struct.pack('!BxH', 0, len(rectangles)) + b''.join(rectangles))
+        self.update_requested = False
+        self.updates_sent += 1
+
+    def _set_pixel_format(self, pixel_format):
+        bpp, depth, bigendian, truecolor, redmax, greenmax, bluemax, redshift, greenshift, blueshift = \
+            struct.unpack('!BBBBHHHBBBxxx', pixel_format)
+        shifts = (redshift, greenshift, blueshift)
+        if bpp != 32 or not truecolor or (redmax, greenmax, bluemax) != (255, 255, 255) or any(shift % 8 for shift in shifts):
+            raise error.Error('Only 32-bit true colour pixel formats with whole-byte channels are supported: {!r}'.format(pixel_format))
+        # Which byte of each wire pixel holds red, green and blue
+        if bigendian:
+            self._byte_order = [3 - shift // 8 for shift in shifts]
+        else:
+            self._byte_order = [shift // 8 for shift in shifts]
+        self._bigendian = bool(bigendian)
+
+    def _wire_pixels(self, pixels):
+        h, w, _ = pixels.shape
+        wire = np.zeros((h, w, 4), dtype=np.uint8)
+        wire[:, :, self._byte_order] = pixels
+        return wire
+
+    def _encode_raw(self, wire):
+        return wire.tobytes()
+
+    def _encode_zlib(self, wire):
+        data = self._zlib.compress(wire.tobytes()) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+        return struct.pack('!I', len(data)) + data
+
+    def _encode_zrle(self, wire):
+        # Compact pixels are the three bytes holding the colours
+        if self._bigendian:
+            cpixels = wire[:, :, 1:]
+        else:
+            cpixels = wire[:, :, :3]
+        h, w, _ = wire.shape
+        tiles = []
+        for tile_y in range(0, h, 64):
+            for tile_x in range(0, w, 64):
+                tile = cpixels[tile_y:tile_y+64, tile_x:tile_x+64]
+                if (tile == tile[0, 0]).all():
+                    tiles.append(b'\x01' + tile[0, 0].tobytes())
+                else:
+                    tiles.append(b'\x00' + tile.tobytes())
+        data = self._zrle.compress(b''.join(tiles)) + self._zrle.flush(zlib.Z_SYNC_FLUSH)
+        return struct.pack('!I', len(data)) + data
+
+    def _encode_cursor(self):
+        size = 12
+        rows, columns = np.indices((size, size))
+        mask = columns <= rows
+        image = np.zeros((size, size, 3), dtype=np.uint8)
+        image[mask] = 255
+        data = self._wire_pixels(image).tobytes() + np.packbits(mask, axis=1).tobytes()
+        return struct.pack('!HHHHi', 0, 0, size, size, constants.PSEUDO_CURSOR_ENCODING) + data
+
+# Little-endian R, G, B, X, which is what VNCClient asks for anyway
+SERVER_PIXEL_FORMAT = struct.pack('!BBBBHHHBBBxxx', 32, 24, 0, 1, 255, 255, 255, 0, 8, 16)
+
+PIXEL_ENCODERS = {
+    constants.RAW_ENCODING: FakeVNCServer._encode_raw,
+    constants.ZLIB_ENCODING: FakeVNCServer._encode_zlib,
+    constants.ZRLE_ENCODING: FakeVNCServer._encode_zrle,
+}
+
+def _intersect(a, b):
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+def server_factory(width=640, height=480, fps=60, content=None, encodings=None, password=None, seed=0, clock=None):
+    """content: which kinds of FakeScene content to show, as a list or
+    a comma-separated string. Defaults to all of them.
+
+    encodings: which encodings to use (when the client accepts them),
+    in the forms vnc_client.parse_encodings takes. Defaults to
+    CopyRect, ZRLE, Zlib and RAW, plus the cursor.
+
+    password: if given, clients must authenticate with it. Otherwise
+    any password is accepted.
+
+    clock: what to schedule ticks on (e.g. a task.Clock in tests).
+    Defaults to the reactor.
+    """
+    if isinstance(content, six.string_types):
+        content = [kind.strip() for kind in content.split(',') if kind.strip()]
+    if encodings is None:
+        encodings = ENCODINGS
+    else:
+        encodings = vnc_client.parse_encodings(encodings)
+
+    factory = protocol.ServerFactory()
+    factory.protocol = FakeVNCServer
+    factory.width = width
+    factory.height = height
+    factory.fps = fps
+    factory.content = content
+    factory.encodings = encodings
+    factory.password = password
+    factory.clock = clock
+    # Open connections, for inspecting what they've sent
+    factory.connections = []
+
+    seeds = itertools.count(seed)
+    factory.next_seed = lambda: next(seeds)
+    return factory
+
+class FakeVNCServers(object):
+    """Runs n FakeVNCServers on the reactor thread, listening on free
+    local ports. `remotes` is a string for HardcodedAddresses (e.g.
+    env.configure(remotes=servers.remotes)).
+
+    Takes the same keyword arguments as server_factory.
+    """
+
+    def __init__(self, n=1, interface='127.0.0.1', **kwargs):
+        twisty.start_once()
+        self.interface = interface
+        self.factories = [server_factory(seed=i, **kwargs) for i in range(n)]
+        self.ports = [utils.blockingCallFromThread(reactor.listenTCP, 0, factory, interface=interface)
+                      for factory in self.factories]
+
+    @property
+    def addresses(self):
+        return ['{}:{}'.format(self.interface, port.getHost().port) for port in self.ports]
+
+    @property
+    def remotes(self):
+        return 'vnc://' + ','.join(self.addresses)
+
+    def close(self):
+        for port in self.ports:
+            utils.blockingCallFromThread(port.stopListening)
+        self.ports = []
+
+if __name__ == '__main__':
+    # Serve from a process of its own, so the servers don't compete
+    # with the client under test for the GIL:
+    #
+    # python -m universe.vncdriver.fake_server -n 16
+    import argparse
+    parser = argparse.ArgumentParser(description='Run fake VNC servers.')
+    parser.add_argument('-n', '--servers', type=int, default=1, help='Servers to run.')
+    parser.add_argument('-p', '--port', type=int, default=5900, help='Port of the first server.')
+    parser.add_argument('-f', '--fps', type=float, default=60, help='Rate each server changes its screen at.')
+    parser.add_argument('-c', '--content', default=None, help='Screen content (see FakeScene).')
+    parser.add_argument('-e', '--encodings', default=None, help='Encodings to send.')
+    parser.add_argument('--width', type=int, default=640, help='Screen width.')
+    parser.add_argument('--height', type=int, default=480, help='Screen height.')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+
+    addresses = []
+    for i in range(args.servers):
+        factory = server_factory(width=args.width, height=args.height, fps=args.fps, content=args.content, encodings=args.encodings, seed=i)
+        reactor.listenTCP(args.port + i, factory, interface='127.0.0.1')
+        addresses.append('127.0.0.1:{}'.format(args.port + i))
+    logger.info('Serving on vnc://%s', ','.join(addresses))
+    reactor.run()
@@ -0,0 +1,306 @@
+import logging
+import multiprocessing
+import numpy as np
+import os
+import shutil
+import six
+import struct
+
+from universe import error, utils
+from universe.vncdriver import fbs_reader, vnc_client
+
+logger = logging.getLogger(__name__)
+
+# Client to server message types, and how long each is before any
+# variable-length part
+CLIENT_MESSAGES = {
+    0: 20, # SetPixelFormat
+    2: 4,  # SetEncodings
+    3: 10, # FramebufferUpdateRequest
+    4: 8,  # KeyEvent
+    5: 6,  # PointerEvent
+    6: 8,  # ClientCutText
+}
+
+class HeadlessVNCClient(vnc_client.VNCClient):
+    """A VNCClient fed from a recording rather than a connection.
+
+    It has no transport, so nothing it sends goes anywhere. It also
+    keeps the server's pixel format rather than asking for ours: the
+    recorded stream is in whatever format the recording client asked
+    for, which FBSDecoder applies as it goes.
+    """
+
+    def send_PixelFormat(self, *args, **kwargs):
+        pass
+
+class FBSDecoder(object):
+    """Runs a recorded server stream (a server.fbs, as written by
+    VNCProxyServer) through the RFB parser and a NumpyScreen, without
+    a reactor.
+
+    Either sample the screen at a fixed rate with frames(), or step
+    through the recording with first_frame() and advance().
+
+    The recording client's pixel format changes are read from the
+    matching client.fbs, if there is one.
+    """
+
+    def __init__(self, server_path, client_path=None):
+        self.server_path = server_path
+        self.client_path = client_path
+        self.reader = fbs_reader.FBSReader(server_path)
+        if client_path is not None:
+            self.pixel_formats = recorded_pixel_formats(client_path)
+        else:
+            self.pixel_formats = []
+        # Not yet applied
+        self._pixel_formats = list(self.pixel_formats)
+
+        self.error_buffer = utils.ErrorBuffer()
+        self.client = HeadlessVNCClient()
+        self.client.factory = vnc_client.client_factory(None, self.error_buffer)
+        self.client.factory.label = os.path.basename(os.path.dirname(os.path.abspath(server_path)))
+        self.client.transport = None
+
+    @property
+    def screen(self):
+        return self.client.numpy_screen
+
+    @property
+    def done(self):
+        """Whether every record has been decoded."""
+        return self.reader.tell() >= len(self.reader)
+
+    def close(self):
+        self.reader.close()
+
+    def next_timestamp(self):
+        """The timestamp of the next record to decode, or None if
+        there are none left."""
+        if self.done:
+            return None
+        return self.reader.timestamps[self.reader.tell()]
+
+    def first_frame(self):
+        """Decode up to the first complete framebuffer update, and
+        return its timestamp (or None if there isn't one)."""
+        while self.screen is None or not self.screen._has_initial_framebuffer_update:
+            if self.done:
+                return None
+            self._decode_next()
+        return self.reader.timestamps[self.reader.tell() - 1]
+
+    def advance(self, timestamp):
+        """Decode every record up to and including `timestamp`."""
+        timestamps = self.reader.timestamps
+        while not self.done and timestamps[self.reader.tell()] <= timestamp:
+            self._decode_next()
+
+    def _decode_next(self):
+        data, timestamp = next(self.reader)
+        while self._pixel_formats and self._pixel_formats[0][0] <= timestamp and self.client.initialized:
+            _, pixel_format = self._pixel_formats.pop(0)
+            self.client.framebuffer.apply_format(pixel_format)
+
+        self.client.dataReceived(data.tobytes())
+        self.error_buffer.check()
+
+    def frames(self, fps):
+        """Yields (timestamp, pixels) once per 1/fps seconds of the
+        recording, from the first complete framebuffer update until
+        the last record. pixels is the screen's own buffer, so copy
+        it if you need it past the next frame."""
+        for timestamp, pixels, info in self._flips(fps):
+            yield timestamp, pixels
+
+    def _flips(self, fps):
+        """frames(), plus each flip's info."""
+        start = self.first_frame()
+        if start is None:
+            return
+        interval = 1. / fps
+        for count in range(self.frame_count(start, fps)):
+            timestamp = start + count * interval
+            self.advance(timestamp)
+            pixels, info = self.screen.flip()
+            yield timestamp, pixels, info
+
+    def frame_count(self, start, fps):
+        """How many frames frames(fps) yields, if the first is at
+        `start`."""
+        interval = 1. / fps
+        end = self.reader.timestamps[-1]
+        count = int(np.floor((end - start) * fps)) + 1
+        # Count frames at or before the end exactly as frames() will
+        # compute their timestamps, however the rounding falls
+        while start + count * interval <= end:
+            count += 1
+        while count > 0 and start + (count - 1) * interval > end:
+            count -= 1
+        return count
+
+    def write(self, output_dir, fps):
+        """Write frames(fps) to output_dir, returning how many there were
+        (n). Load them back with load_frames().
+
+        A raw frame is width * height * 3 bytes: about 140MB for each
+        second of a 1024x768 recording at 60fps. Most frames repeat
+        the one before, though, so only frames where the screen
+        changed are stored, in frames.npy as a (k, height, width, 3)
+        uint8 array. frame_index.npy says which of them to show for
+        each of the n frames, and frame_timestamps.npy when. Busy
+        screens change every frame, so for them size still grows with
+        fps: pick the lowest one you'll train at.
+        """
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        frames_path = os.path.join(output_dir, 'frames.npy')
+        index_path = os.path.join(output_dir, 'frame_index.npy')
+        timestamps_path = os.path.join(output_dir, 'frame_timestamps.npy')
+
+        # The number of changed frames isn't known until the end, so
+        # they're streamed to a temporary file, and copied in behind
+        # the .npy header once it is
+        timestamps = None
+        index = None
+        shape = None
+        n = 0
+        k = 0
+        with open(frames_path + '.tmp', 'wb') as f:
+            for timestamp, pixels, info in self._flips(fps):
+                if timestamps is None:
+                    count = self.frame_count(timestamp, fps)
+                    timestamps = np.zeros(count)
+                    index = np.zeros(count, dtype=np.int64)
+                    shape = pixels.shape
+                if k == 0 or info['vnc_session.damage']:
+                    f.write(pixels.tobytes())
+                    k += 1
+                timestamps[n] = timestamp
+                index[n] = k - 1
+                n += 1
+
+        if timestamps is None:
+            logger.info('No frames in %s', self.server_path)
+            os.remove(frames_path + '.tmp')
+            return 0
+        assert n == len(timestamps), 'Expected {} frames, but got {}'.format(len(timestamps), n)
+        with open(frames_path + '.tmp', 'rb') as src, open(frames_path + '.part', 'wb') as dst:
+            np.lib.format.write_array_header_1_0(dst, {'descr': np.lib.format.dtype_to_descr(np.dtype(np.uint8)), 'fortran_order': False, 'shape': (k,) + shape})
+            shutil.copyfileobj(src, dst)
+        os.remove(frames_path + '.tmp')
+        os.rename(frames_path + '.part', frames_path)
+        np.save(index_path, index)
+        np.save(timestamps_path, timestamps)
+        logger.info('Stored %d changed frames out of %d from %s', k, n, self.server_path)
+        return n
+
+def load_frames(output_dir, mmap_mode='r'):
+    """Read back what FBSDecoder.write() wrote to output_dir, as
+    (timestamps, frames, index): frame i is frames[index[i]], shown at
+    timestamps[i]. frames is memory-mapped unless mmap_mode is None."""
+    timestamps = np.load(os.path.join(output_dir, 'frame_timestamps.npy'))
+    frames = np.load(os.path.join(output_dir, 'frames.npy'), mmap_mode=mmap_mode)
+    index = np.load(os.path.join(output_dir, 'frame_index.npy'))
+    return timestamps, frames, index
+
+def recorded_pixel_formats(client_path):
+    """Returns (timestamp, pixel_format) for each SetPixelFormat in a
+    recorded client stream (a client.fbs)."""
+    reader = fbs_reader.FBSReader(client_path)
+    try:
+        data = b''.join(record.tobytes() for record, _ in reader)
+        # Which record each byte arrived in
+        ends = np.cumsum([len(record) for record, _ in reader[:]])
+        timestamps = reader.timestamps
+    finally:
+        reader.close()
+
+    if data[:4] != b'RFB ':
+        raise error.Error('Client stream in {} does not start with an RFB version: {!r}'.format(client_path, data[:12]))
+    # After the version comes either the ClientInit flag, or a VNC
+    # authentication response and then the flag, depending on what
+    # the server asked for. Try both.
+    for start in [12 + 1, 12 + 16 + 1]:
+        messages = _client_messages(data, start)
+        if messages is not None:
+            break
+    else:
+        raise error.Error('Could not parse client stream in {}'.format(client_path))
+
+    formats = []
+    for position, type in messages:
+        if type == 0:
+            (pixel_format,) = struct.unpack_from('!xxxx16s', data, position)
+            index = min(np.searchsorted(ends, position + 20), len(timestamps) - 1)
+            formats.append((timestamps[index], pixel_format))
+    return formats
+
+def _client_messages(data, position):
+    """Returns (position, type) for each message from `position` on, or
+    None if they don't parse."""
+    messages = []
+    while position < len(data):
+        type = six.indexbytes(data, position)
+        length = CLIENT_MESSAGES.get(type)
+        if length is None or position + length > len(data):
+            return None
+        if type == 2:
+            (count,) = struct.unpack_from('!xxH', data, position)
+            length += 4 * count
+        elif type == 6:
+            (count,) = struct.unpack_from('!xxxxI', data, position)
+            length += count
+        messages.append((position, type))
+        position += length
+    if position != len(data):
+        return None
+    return messages
+
+def decode_recording(logfile_dir, fps, output_dir=None):
+    """Decode one recording directory (as made by LogManager) into
+    frames. Output goes alongside the recording unless output_dir is
+    given. Returns the number of frames."""
+    if output_dir is None:
+        output_dir = logfile_dir
+    client_path = os.path.join(logfile_dir, 'client.fbs')
+    if not os.path.exists(client_path):
+        client_path = None
+
+    decoder = FBSDecoder(os.path.join(logfile_dir, 'server.fbs'), client_path)
+    try:
+        return decoder.write(output_dir, fps)
+    finally:
+        decoder.close()
+
+def _decode_recording(args):
+    logfile_dir, fps, output_dir = args
+    try:
+        return logfile_dir, decode_recording(logfile_dir, fps, output_dir), None
+    except Exception as e:
+        logger.error('Could not decode %s: %s', logfile_dir, e)
+        return logfile_dir, 0, utils.format_error(e)
+
+def decode_recordings(logfile_dirs, fps, output_root=None, processes=None):
+    """Decode many recording directories in parallel, one per worker
+    process. With output_root, each recording's frames go in
+    output_root/<recording directory name>.
+
+    Yields (logfile_dir, frames, error) as each finishes. A recording
+    which fails doesn't stop the others; its error is a string."""
+    jobs = []
+    for logfile_dir in logfile_dirs:
+        if output_root is None:
+            output_dir = None
+        else:
+            output_dir = os.path.join(output_root, os.path.basename(os.path.normpath(logfile_dir)))
+        jobs.append((logfile_dir, fps, output_dir))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(_decode_recording, jobs):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
@@ -1,68 +1,232 @@
 import json
+import logging
+import mmap
+import numpy as np
 import os
+import six
 import struct
 
+from gym.utils import atomic_write
+
 from universe import error
+from universe.vncdriver import fbs_writer
+
+logger = logging.getLogger(__name__)
 
 class InvalidFBSFileError(error.Error):
     pass
 
 class FBSReader(object):
-    def __init__(self, path):
+    """Reads FBS files (as written by FBSWriter) through a memory map.
+
+    Iterating yields (data, timestamp) pairs, where data is a
+    memoryview onto the file (so it's only valid until the reader is
+    closed) and timestamp is in seconds since the epoch.
+
+    Records can also be accessed by position (reader[i], reader[i:j]),
+    and seek(timestamp) moves iteration to the first record at or
+    after a timestamp.
+
+    Files which FBSWriter closed end with an index block saying where
+    the records are. For other files, record positions are found with
+    one pass over the file, and saved to a sidecar index (path +
+    '.index') so the next reader can skip it. If the file has grown
+    since, only the new part is scanned.
+
+    Files which were killed before they were closed (with no trailer,
+    and maybe a partial last record) are read up to their last
+    complete record.
+    """
+
+    INDEX_VERSION = b'FBS-INDEX 001\n'
+
+    def __init__(self, path, index_path=None, write_index=True):
+        self.path = path
+        if index_path is None:
+            index_path = path + '.index'
+        self.index_path = index_path
+
         self.file = open(path, 'rb')
-        version = self.file.read(12)
+        size = os.fstat(self.file.fileno()).st_size
+        if size < 12:
+            raise InvalidFBSFileError('FBS file is too short to be valid: {} bytes'.format(size))
+        self._mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Python 2's mmap has no memoryview support, but NumPy can wrap
+        # it and hand out one of its own
+        self._view = memoryview(np.frombuffer(self._mmap, dtype=np.uint8))
+
+        version = self._mmap[:12]
         if version != b'FBS 001.002\n':
             raise InvalidFBSFileError('Unrecognized FBS version: {}'.format(version))
 
-        header = self.file.readline()
-        pos = self.file.tell()
-        self.file.seek(pos, os.SEEK_SET)
-
-        header = json.loads(header.decode('utf-8'))
+        header_end = self._mmap.find(b'\n', 12)
+        if header_end == -1:
+            raise InvalidFBSFileError('FBS file has no header')
+        header = json.loads(self._mmap[12:header_end].decode('utf-8'))
         self.start = header['start']
+        self.stop = None
 
-    def __iter__(self):
-        return self
+        # A closed file carries its own index; otherwise use the saved
+        # one, if any
+        embedded = self._load_embedded_index(header_end)
+        loaded = embedded or self._load_index()
+        if loaded is None:
+            offsets, lengths, deltas, scanned = [], [], [], header_end + 1
+        else:
+            offsets, lengths, deltas, scanned = loaded
+        indexed = len(offsets)
+
+        self._end = self._scan(scanned, offsets, lengths, deltas)
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._lengths = np.array(lengths, dtype=np.int64)
+        self._deltas = np.array(deltas, dtype=np.int64)
+        self.timestamps = self.start + self._deltas / 1000.
+
+        if write_index and embedded is None and (loaded is None or len(offsets) > indexed):
+            self._save_index()
 
-    def read_safe(self, size=None):
-        """
-        We currently close our fbs files by killing them, so sometimes they end
-        up with bad data at the end. Close our reader if we expect `size` bytes
-        and get fewer.
+        self._position = 0
 
-        This is a hack and should be removed when we cleanly close our
-        connections in fbs_writer.
+    def __len__(self):
+        return len(self._offsets)
 
-        https://github.com/openai/universe-envs/issues/41
-        """
-        bytes = self.file.read(size)
-        if len(bytes) != size:
-            # We unexpectedly got to the end of the file
-            self.close()
-            raise StopIteration
-        return bytes
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._record(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('Record {} out of range for {} records'.format(i, len(self)))
+        return self._record(i)
+
+    def __iter__(self):
+        return self
 
     def next(self):
         return self.__next__()
 
     def __next__(self):
-        length_str = self.read_safe(4)
-        if length_str == '':
-            # Indicates a file with no trailer
-            self.close()
-            raise StopIteration
-        (length,) = struct.unpack('!I', length_str)
-
-        if length == 0:
-            # Reached the end
-            self.close()
+        if self._position >= len(self):
             raise StopIteration()
+        record = self._record(self._position)
+        self._position += 1
+        return record
 
-        data = self.read_safe(length)
-        timestamp_str = self.read_safe(4)
-        (timestamp,) = struct.unpack('!I', timestamp_str)
+    def seek(self, timestamp):
+        """Continue iteration from the first record at or after
+        `timestamp` (in seconds since the epoch, like the timestamps we
+        yield). Returns that record's position."""
+        timestamps = self.timestamps
+        if (timestamps[1:] < timestamps[:-1]).any():
+            # The clock went backwards while recording
+            later = np.flatnonzero(timestamps >= timestamp)
+            position = later[0] if len(later) else len(timestamps)
+        else:
+            position = np.searchsorted(timestamps, timestamp, side='left')
+        self._position = int(position)
+        return self._position
 
-        return data, self.start + timestamp/1000.
+    def tell(self):
+        """Position of the next record iteration will yield."""
+        return self._position
 
     def close(self):
+        if six.PY2:
+            # We can't tell whether anyone still holds records, so
+            # leave unmapping to the garbage collector
+            self._view = self._mmap = None
+        else:
+            self._view.release()
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Someone still holds records. The map will be unmapped
+                # once they let go.
+                pass
         self.file.close()
+
+    def _record(self, i):
+        offset = self._offsets[i]
+        data = self._view[offset:offset+self._lengths[i]]
+        return data, self.timestamps[i]
+
+    def _scan(self, pos, offsets, lengths, deltas):
+        """Index the records from `pos` to the end of the file. Returns
+        the position of the trailer, or of the first incomplete record."""
+        size = len(self._mmap)
+        while pos + 4 <= size:
+            (length,) = struct.unpack_from('!I', self._mmap, pos)
+            if length == 0:
+                self._read_trailer(pos + 4)
+                break
+
+            end = pos + 4 + length + 4
+            if end > size:
+                # The writer was killed partway through this record
+                break
+            (delta,) = struct.unpack_from('!I', self._mmap, end - 4)
+
+            offsets.append(pos + 4)
+            lengths.append(length)
+            deltas.append(delta)
+            pos = end
+        return pos
+
+    def _read_trailer(self, pos):
+        trailer_end = self._mmap.find(b'\n', pos)
+        if trailer_end == -1:
+            return
+        try:
+            self.stop = json.loads(self._mmap[pos:trailer_end].decode('utf-8'))['stop']
+        except (ValueError, KeyError):
+            logger.info('Ignoring unreadable trailer in %s', self.path)
+
+    def _load_embedded_index(self, header_end):
+        """Returns the record positions from the index block FBSWriter
+        appends on close, or None if there isn't one."""
+        size = len(self._mmap)
+        footer = struct.calcsize(fbs_writer.INDEX_FOOTER_FORMAT) + len(fbs_writer.INDEX_FOOTER)
+        if size < header_end + footer or self._mmap[size-len(fbs_writer.INDEX_FOOTER):] != fbs_writer.INDEX_FOOTER:
+            return None
+        end, count = struct.unpack_from(fbs_writer.INDEX_FOOTER_FORMAT, self._mmap, size - footer)
+
+        index_start = size - footer - 3 * 8 * count
+        if not header_end < end < index_start:
+            logger.info('Ignoring corrupt index block in %s', self.path)
+            return None
+        arrays = np.frombuffer(self._mmap[index_start:size-footer], dtype='>u8')
+        offsets, lengths, deltas = arrays.reshape((3, count))
+        return offsets.tolist(), lengths.tolist(), deltas.tolist(), end
+
+    def _load_index(self):
+        """Returns the saved record positions, and where to resume
+        scanning from, or None if there's no usable index."""
+        try:
+            with open(self.index_path, 'rb') as f:
+                index = f.read()
+        except (IOError, OSError):
+            return None
+
+        prefix = len(self.INDEX_VERSION)
+        fields = struct.calcsize('!dQQ')
+        if index[:prefix] != self.INDEX_VERSION or len(index) < prefix + fields:
+            logger.info('Ignoring unrecognized FBS index: %s', self.index_path)
+            return None
+        start, scanned, count = struct.unpack_from('!dQQ', index, prefix)
+
+        arrays = np.frombuffer(index, dtype='>u8', offset=prefix + fields)
+        if start != self.start or scanned > len(self._mmap) or len(arrays) != 3 * count:
+            logger.info('Ignoring FBS index which does not match its recording: %s', self.index_path)
+            return None
+        offsets, lengths, deltas = arrays.reshape((3, count))
+        return offsets.tolist(), lengths.tolist(), deltas.tolist(), scanned
+
+    def _save_index(self):
+        header = self.INDEX_VERSION + struct.pack('!dQQ', self.start, self._end, len(self))
+        arrays = np.concatenate([self._offsets, self._lengths, self._deltas]).astype('>u8')
+        try:
+            with atomic_write.atomic_write(self.index_path, binary=True) as f:
+                f.write(header)
+                f.write(arrays.tobytes())
+        except (IOError, OSError) as e:
+            logger.info('Could not save FBS index to %s: %s', self.index_path, e)
@@ -1,13 +1,46 @@
 import json
+import logging
+import numpy as np
 import struct
+import threading
 import time
 
-from gym.utils import atomic_write, closer
+from gym.utils import closer
+
+from universe import error
+
+logger = logging.getLogger(__name__)
 
 fbs_closer = closer.Closer()
 
+# Closes the file's index block: the position of the trailer and the
+# number of records, then this marker.
+INDEX_FOOTER = b'FBS-INDEX-BLOCK 001\n'
+INDEX_FOOTER_FORMAT = '!QQ'
+
+pack_u32 = struct.Struct('!I').pack
+# offset, length, delta of a record, as native uint64s
+index_entry = struct.Struct('=QQQ')
+
 class FBSWriter(object):
-    def __init__(self, path):
+    """Writes FBS files, which FBSReader reads.
+
+    write() packs the chunk into an in-memory buffer, and a background
+    thread writes the buffer out in batches of around `buffer_size`
+    bytes, so the caller (normally the reactor thread) never waits on
+    the disk unless `max_buffered` bytes are already waiting.
+
+    Every `flush_interval` seconds (and whenever a batch is ready),
+    the thread writes out what it has followed by a trailer, and
+    flushes. The next batch overwrites that trailer, so a process
+    which dies without closing the writer still leaves a complete
+    file, missing only the chunks since the last flush.
+
+    On close, an index of the records' positions follows the trailer,
+    so FBSReader can open the file without scanning it.
+    """
+
+    def __init__(self, path, buffer_size=1<<20, max_buffered=16<<20, flush_interval=1.):
         self._closed = False
 
         self.start = None
@@ -15,6 +48,10 @@ class FBSWriter(object):
 
         self._id = fbs_closer.register(self)
 
+        self.buffer_size = buffer_size
+        self.max_buffered = max_buffered
+        self.flush_interval = flush_interval
+
         self.file = open(path, 'wb')
         # custom format: exactly the same as FBS 001.000 except:
         #
@@ -22,7 +59,25 @@ class FBSWriter(object):
         # {line-of-json}
         # [length-byte, data, timestamp]...
         # \0\0\0\0 {line-of-json}
+        # [index block]
         self.file.write(b'FBS 001.002\n')
+        self._error = None
+
+        # Guards everything below, which is shared with the thread
+        self._cond = threading.Condition(threading.Lock())
+        self._pending = bytearray()
+        # Where the records written so far end (and so the trailer
+        # goes), including those still pending
+        self._size = self.file.tell()
+        # index_entry for each record, for the index block
+        self._index = bytearray()
+        self._closing = False
+        self._flush_requested = 0
+        self._flushed = 0
+
+        self._thread = threading.Thread(target=self._run, name='FBSWriter')
+        self._thread.daemon = True
+        self._thread.start()
 
     def write(self, data):
         # Format:
@@ -33,30 +88,109 @@ class FBSWriter(object):
 
         if not data:
             return
+        if self._error is not None:
+            raise error.Error('Could not write to {}: {}'.format(self.file.name, self._error))
 
         if self.start is not None:
             delta = int(1000 * (time.time() - self.start))
+            header = None
         else:
             delta = 0
             self.start = time.time()
-
             # Write metadata header
-            self.file.write(json.dumps({'start': self.start}).encode('utf-8'))
-            self.file.write(b'\n')
-
-        length = struct.pack('!I', len(data))
-        self.file.write(length)
-        self.file.write(data)
-
-        delta = struct.pack('!I', delta)
-        self.file.write(delta)
-
-    def _write_metadata(self):
+            header = json.dumps({'start': self.start}).encode('utf-8') + b'\n'
+
+        length = len(data)
+        with self._cond:
+            pending = self._pending
+            while len(pending) >= self.max_buffered and self._thread.is_alive():
+                self._cond.wait()
+                pending = self._pending
+
+            if header is not None:
+                pending += header
+                self._size += len(header)
+            self._index += index_entry.pack(self._size + 4, length, delta)
+            pending += pack_u32(length)
+            pending += data
+            pending += pack_u32(delta)
+            self._size += length + 8
+
+            # Wake the thread once there's a batch worth writing
+            if len(pending) >= self.buffer_size and len(pending) - length - 8 < self.buffer_size:
+                self._cond.notify_all()
+
+    def flush(self):
+        """Block until everything written so far is on disk, followed
+        by a trailer."""
+        with self._cond:
+            self._flush_requested += 1
+            ticket = self._flush_requested
+            self._cond.notify_all()
+            while self._flushed < ticket and self._thread.is_alive():
+                self._cond.wait()
+
+    def _run(self):
+        last_flush = time.time()
+        # Where the records on disk end, and so where the next batch
+        # (overwriting the trailer) goes
+        written = self.file.tell()
+        while True:
+            with self._cond:
+                deadline = last_flush + self.flush_interval
+                while not self._closing and self._flushed == self._flush_requested and \
+                      len(self._pending) < self.buffer_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, bytearray()
+                end = self._size
+                closing = self._closing
+                flush_requested = self._flush_requested
+                index = self._index if closing else None
+                # There's room in the buffer again
+                self._cond.notify_all()
+
+            if (batch or closing) and end > written:
+                # end > written means we have the metadata header
+                self._checkpoint(written, batch, self._trailer(end, index))
+                written = end
+            last_flush = time.time()
+
+            with self._cond:
+                self._flushed = flush_requested
+                self._cond.notify_all()
+            if closing:
+                return
+
+    def _checkpoint(self, written, batch, trailer):
+        """Write out a batch of records over the previous trailer, and
+        follow them with a new one."""
+        if self._error is not None:
+            return
+        try:
+            self.file.seek(written)
+            self.file.write(batch)
+            self.file.write(trailer)
+            self.file.truncate()
+            self.file.flush()
+        except (IOError, OSError) as e:
+            logger.error('Could not write to %s: %s', self.file.name, e)
+            self._error = e
+
+    def _trailer(self, end, index):
         # Write metadata trailer
-        null = struct.pack('!I', 0)
-        self.file.write(null)
-        self.file.write(json.dumps({'stop': self.stop}).encode('utf-8'))
-        self.file.write(b'\n')
+        stop = time.time() if index is None else self.stop
+        trailer = struct.pack('!I', 0) + json.dumps({'stop': stop}).encode('utf-8') + b'\n'
+        if index is None:
+            return trailer
+
+        # The index block: where each record's data starts, its length,
+        # and its timestamp
+        block = np.frombuffer(index, dtype=np.uint64).reshape((-1, 3)).T.astype('>u8')
+        footer = struct.pack(INDEX_FOOTER_FORMAT, end, len(index) // index_entry.size) + INDEX_FOOTER
+        return trailer + block.tobytes() + footer
 
     def close(self):
         if self._closed:
@@ -65,8 +199,13 @@ class FBSWriter(object):
 
         fbs_closer.unregister(self._id)
         self.stop = time.time()
-        self._write_metadata()
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
         self.file.close()
+        if self._error is not None:
+            raise error.Error('Could not write to {}: {}'.format(self.file.name, self._error))
 
     def __del__(self):
         self.close()
@@ -0,0 +1,71 @@
+import logging
+import time
+
+from universe import pyprofile
+from universe.vncdriver import receive_buffer
+
+logger = logging.getLogger(__name__)
+
+class FramedProtocol(object):
+    """Mixin for our RFB protocol implementations, which parse their
+    input a fixed-length block at a time.
+
+    Call expect(handler, length, *args, **kwargs), and once `length`
+    bytes are available, handler(block, *args, **kwargs) is called
+    with a memoryview of them. Blocks are only valid until the next
+    dataReceived, so handlers which keep data around (e.g. to forward
+    it) must copy it.
+
+    Subclasses set self.buf to a ReceiveBuffer, implement
+    handle(type, block) (returning False to stop parsing), and may
+    override can_parse().
+    """
+
+    # If set, bytes parsed and parse time per message type are
+    # reported to pyprofile under this prefix.
+    profile_prefix = None
+
+    def init_framing(self):
+        self.buf = receive_buffer.ReceiveBuffer()
+        self._profile_keys = {}
+
+    def expect(self, type, length, *args, **kwargs):
+        if type is not None:
+            logger.debug('Expecting: %s (length=%s)', type.__name__, length)
+            assert isinstance(length, int), "Bad length (not an int): {}".format(length)
+
+        self.expected = type
+        self.expected_len = length
+        self.expected_args = args
+        self.expected_kwargs = kwargs
+
+    def can_parse(self):
+        return True
+
+    def parse_buffer(self):
+        """Handle as many complete blocks as are buffered."""
+        while self.expected is not None and len(self.buf) >= self.expected_len and self.can_parse():
+            block = self.buf.peek(self.expected_len)
+            if self.profile_prefix is None:
+                success = self.handle(self.expected, block)
+            else:
+                success = self._profiled_handle(block)
+            if not success:
+                logger.debug('Stopping due to error in handle()')
+                break
+            self.buf.consume(len(block))
+
+    def _profiled_handle(self, block):
+        type = self.expected
+        try:
+            timer, counter = self._profile_keys[type.__name__]
+        except KeyError:
+            timer = '{}.parse.{}'.format(self.profile_prefix, type.__name__)
+            counter = timer + '.bytes'
+            self._profile_keys[type.__name__] = timer, counter
+
+        start = time.time()
+        success = self.handle(type, block)
+        pyprofile.timing(timer, time.time() - start)
+        pyprofile.incr(counter, len(block), unit=pyprofile.BYTES)
+        return success
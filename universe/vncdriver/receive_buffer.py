@@ -0,0 +1,62 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ReceiveBuffer(object):
+    """Accumulates bytes off the wire and hands out zero-copy views of
+    them, so that parsing a stream costs time linear in its size.
+
+    Bytes live in a single growable bytearray with a read offset.
+    Consumed bytes are compacted away lazily, once they make up at
+    least half of the buffer.
+
+    Views returned by peek() are only valid until the next append():
+    handlers which want to hold on to data must copy it.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._offset = 0
+
+    def __len__(self):
+        return len(self._buf) - self._offset
+
+    def append(self, data):
+        if self._offset and 2 * self._offset >= len(self._buf):
+            self._compact()
+
+        try:
+            self._buf += data
+        except BufferError:
+            # Someone is still holding a view into our buffer, so we
+            # can't resize it in place. Leave them the old buffer.
+            self._buf = self._buf[self._offset:]
+            self._offset = 0
+            self._buf += data
+
+    def peek(self, length):
+        """Return a memoryview of the next `length` bytes, without
+        consuming them."""
+        assert length <= len(self), "Asked for {} bytes but only {} are buffered".format(length, len(self))
+        return memoryview(self._buf)[self._offset:self._offset+length]
+
+    def consume(self, length):
+        assert length <= len(self), "Asked to consume {} bytes but only {} are buffered".format(length, len(self))
+        self._offset += length
+
+    def read_all(self):
+        """Return a copy of everything buffered, and consume it."""
+        data = bytes(self._buf[self._offset:])
+        self.clear()
+        return data
+
+    def clear(self):
+        self._offset = len(self._buf)
+        self._compact()
+
+    def _compact(self):
+        try:
+            del self._buf[:self._offset]
+        except BufferError:
+            self._buf = self._buf[self._offset:]
+        self._offset = 0
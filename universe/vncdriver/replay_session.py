@@ -0,0 +1,114 @@
+import logging
+import os
+import time
+
+from universe import error, utils
+from universe.remotes import replay
+from universe.vncdriver import fbs_decoder, screen
+
+logger = logging.getLogger(__name__)
+
+class ReplayVNCSession(object):
+    """A VNCSession driver which plays back recorded server.fbs files,
+    for remotes from ReplayRecordings.
+
+    Each step decodes the recording up to the connection's
+    ReplayClock and returns the screen as of then. Actions are
+    dropped: a recording can't respond to them. Once a recording runs
+    out, its last frame keeps being returned, with
+    info['replay.finished'] set.
+    """
+
+    def __init__(self):
+        self._replays = {}
+        self._pyglet_screen = None
+        self._pyglet_name = None
+
+    def connect(self, name, address, password=None, start_timeout=None, **kwargs):
+        # kwargs are the live drivers' encoding settings, which the
+        # recording has already fixed
+        if name in self._replays:
+            self.close(name)
+
+        logfile_dir, speed, fps = replay.parse_address(address)
+        client_path = os.path.join(logfile_dir, 'client.fbs')
+        if not os.path.exists(client_path):
+            client_path = None
+        decoder = fbs_decoder.FBSDecoder(os.path.join(logfile_dir, 'server.fbs'), client_path)
+        clock = replay.ReplayClock(decoder.reader.start, speed, fps)
+        logger.info('[%s] Replaying %s (speed=%s)', name, logfile_dir, 'max' if speed is None else speed)
+        self._replays[name] = decoder, clock
+
+    def step(self, action_d):
+        obs_d = {}
+        info_d = {}
+        err_d = {}
+        for name, (decoder, clock) in self._replays.items():
+            timestamp = clock.tick()
+            try:
+                decoder.advance(timestamp)
+            except Exception as e:
+                logger.error('[%s] Could not decode recording %s: %s', name, decoder.server_path, e)
+                err_d[name] = utils.format_error(e)
+                continue
+
+            info = {'replay.timestamp': timestamp, 'replay.finished': decoder.done}
+            numpy_screen = decoder.screen
+            if numpy_screen is not None and numpy_screen._has_initial_framebuffer_update:
+                observation, screen_info = numpy_screen.flip()
+                info['stats.vnc.updates.n'] = len(screen_info['vnc_session.framebuffer_updates'])
+                info['vnc.damage'] = screen_info['vnc_session.damage']
+                obs_d[name] = observation
+            else:
+                # The recording hasn't reached its first full frame
+                obs_d[name] = None
+            info_d[name] = info
+        return obs_d, info_d, err_d
+
+    def wait_for_frame(self, timeout=None, policy='any'):
+        """Sleep until the next recorded update is due on any (or with
+        policy='all', every) unfinished connection, or `timeout`
+        seconds pass. Returns whether the updates are due."""
+        waits = []
+        for decoder, clock in self._replays.values():
+            timestamp = decoder.next_timestamp()
+            if timestamp is not None:
+                waits.append(clock.until(timestamp))
+        if not waits:
+            # Nothing more is coming
+            return False
+        elif policy == 'any':
+            wait = min(waits)
+        elif policy == 'all':
+            wait = max(waits)
+        else:
+            raise error.Error('Invalid wait policy: {!r}. Must be "any" or "all"'.format(policy))
+
+        if timeout is not None and timeout < wait:
+            time.sleep(timeout)
+            return False
+        time.sleep(wait)
+        return True
+
+    def render(self, name):
+        decoder, _ = self._replays[name]
+        if decoder.screen is None or not decoder.screen._has_initial_framebuffer_update:
+            return
+        pixels = decoder.screen.peek()
+        if self._pyglet_screen is None or self._pyglet_name != name:
+            self._pyglet_screen = screen.PygletScreen(pixels)
+            self._pyglet_name = name
+        else:
+            height, width, _ = pixels.shape
+            self._pyglet_screen.update_rectangle(0, 0, width, height, pixels)
+        self._pyglet_screen.flip()
+
+    def close(self, name=None):
+        if name is None:
+            names = list(self._replays.keys())
+        else:
+            names = [name]
+        for name in names:
+            replay_state = self._replays.pop(name, None)
+            if replay_state is not None:
+                replay_state[0].close()
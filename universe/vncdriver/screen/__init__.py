@@ -1,4 +1,5 @@
 from universe.vncdriver.screen.base import Screen
-from universe.vncdriver.screen.numpy_screen import NumpyScreen
+from universe.vncdriver.screen.numpy_screen import NumpyScreen, wait_for_frames
+from universe.vncdriver.screen.observation_buffer import ObservationBuffer
 from universe.vncdriver.screen.pyglet_screen import PygletScreen
 from universe.vncdriver.screen.screen_buffer import ScreenBuffer
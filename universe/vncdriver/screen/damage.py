@@ -0,0 +1,64 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Below this many rectangles, NumPy's per-call overhead outweighs
+# what it saves
+SMALL = 16
+
+def merge_rectangles(rectangles, width=None, height=None):
+    """Coalesce a list of (x, y, width, height) rectangles into bounding
+    boxes, merging any which overlap or touch until none do.
+
+    The boxes cover every input pixel, though they may also cover some
+    pixels which didn't change. If width and height are given, boxes
+    are clipped to the screen, and empty ones dropped.
+    """
+    if len(rectangles) <= SMALL:
+        return _merge_small(rectangles, width, height)
+
+    # Boxes as rows of [x0, y0, x1, y1], exclusive at the far edges
+    boxes = np.zeros((0, 4), dtype=np.int64)
+    for x0, y0, x1, y1 in _corners(rectangles, width, height):
+        # Absorb everything the new box touches. Growing the box may
+        # make it touch others, so keep going until it doesn't.
+        while True:
+            touching = (boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0)
+            if not touching.any():
+                break
+            absorbed = boxes[touching]
+            x0 = min(x0, absorbed[:, 0].min())
+            y0 = min(y0, absorbed[:, 1].min())
+            x1 = max(x1, absorbed[:, 2].max())
+            y1 = max(y1, absorbed[:, 3].max())
+            boxes = boxes[~touching]
+        boxes = np.concatenate([boxes, [[x0, y0, x1, y1]]])
+
+    return [(int(x0), int(y0), int(x1-x0), int(y1-y0)) for x0, y0, x1, y1 in boxes]
+
+def _corners(rectangles, width, height):
+    for x, y, w, h in rectangles:
+        x0, y0, x1, y1 = x, y, x+w, y+h
+        if width is not None:
+            x0, x1 = max(x0, 0), min(x1, width)
+        if height is not None:
+            y0, y1 = max(y0, 0), min(y1, height)
+        if x1 > x0 and y1 > y0:
+            yield x0, y0, x1, y1
+
+def _merge_small(rectangles, width, height):
+    """merge_rectangles in plain Python."""
+    boxes = []
+    for x0, y0, x1, y1 in _corners(rectangles, width, height):
+        merged = True
+        while merged:
+            merged = False
+            for i, (bx0, by0, bx1, by1) in enumerate(boxes):
+                if bx0 <= x1 and bx1 >= x0 and by0 <= y1 and by1 >= y0:
+                    x0, y0, x1, y1 = min(x0, bx0), min(y0, by0), max(x1, bx1), max(y1, by1)
+                    del boxes[i]
+                    merged = True
+                    break
+        boxes.append((x0, y0, x1, y1))
+    return [(x0, y0, x1-x0, y1-y0) for x0, y0, x1, y1 in boxes]
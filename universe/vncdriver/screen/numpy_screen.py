@@ -7,140 +7,303 @@ import time
 from universe import error
 from universe.twisty import reactor
 from universe.vncdriver import server_messages
+from universe.vncdriver.screen import damage
 from universe.spaces import vnc_event
 
 logger = logging.getLogger(__name__)
 
+class Frame(object):
+    """One of NumpyScreen's buffers, along with what it knows about
+    itself."""
+
+    def __init__(self, shape):
+        self.pixels = np.zeros(shape, dtype=np.uint8)
+        # Number of framebuffer updates reflected in the pixels
+        self.version = 0
+        # Regions which changed in newer frames, and need to be copied
+        # in before we can write to this one again
+        self.stale = []
+        # Where the cursor is painted: its bounding box, the flat
+        # indexes of the pixels it covers, and what they held before
+        self.cursor_details = None
+        self.cursor_index = None
+        self.cursor_behind = None
+
+    def cursor_extent(self):
+        if self.cursor_behind is None:
+            return None
+        return self.cursor_details
+
+def wait_for_frames(screens, frame_ready, timeout=None, policy='any'):
+    """Block until any (or with policy='all', every) screen has a new
+    frame to flip to, or `timeout` seconds pass. frame_ready is the
+    Condition the screens notify. Returns whether the frames arrived."""
+    if policy == 'any':
+        ready = any
+    elif policy == 'all':
+        ready = all
+    else:
+        raise error.Error('Invalid wait policy: {!r}. Must be "any" or "all"'.format(policy))
+
+    if timeout is not None:
+        deadline = time.time() + timeout
+    with frame_ready:
+        while not ready(screen.has_new_frame() for screen in screens):
+            if timeout is None:
+                frame_ready.wait()
+            else:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                frame_ready.wait(remaining)
+    return True
+
 class NumpyScreen(object):
-    def __init__(self, width, height):
+    """Triple-buffered screen.
+
+    The reactor applies framebuffer updates to the write frame, then
+    publishes it by swapping it with the ready frame. flip() swaps the
+    ready frame to the front if it is newer. Both swaps are pointer
+    swaps under self.lock, so neither thread waits on the other's
+    pixel work.
+
+    A frame that comes back around for writing is stale. Before
+    writing to it, we copy in just the regions which changed since,
+    from the newest frame.
+
+    The observation returned by flip() is only valid until the next
+    flip().
+
+    Each publish notifies `frame_ready`, a threading.Condition, so
+    wait_for_frames can block until there's a new frame to flip to.
+    Sessions pass one shared between all their screens.
+    """
+
+    # Collapse a frame's stale regions once this many pile up, which
+    # happens when the agent doesn't flip for a while
+    MAX_STALE_RECTANGLES = 256
+
+    def __init__(self, width, height, frame_ready=None):
         self.lock = threading.RLock()
+        if frame_ready is None:
+            frame_ready = threading.Condition()
+        self.frame_ready = frame_ready
+        # Serializes writers (the reactor, and apply_action)
+        self._write_lock = threading.RLock()
 
         shape = (height, width, 3)
-        self._screens = (np.zeros(shape, dtype=np.uint8), np.zeros(shape, dtype=np.uint8))
+        self._frames = [Frame(shape), Frame(shape), Frame(shape)]
+        self._front, self._ready, self._write = self._frames
+        self._newest = self._ready
+        self._version = 0
 
-        self.color_cycle = [0, 1, 2]
-        self._width = None
-        self._height = None
+        self._width = width
+        self._height = height
 
-        self._defer = []
+        # Published since the last flip
+        self._pending_updates = []
+        self._pending_damage = []
 
         self.paint_cursor = False
-        self._cursor = {
-            id(self._screens[0]): {
-                'behind': None,
-                'details': None,
-                'painted': False,
-            },
-            id(self._screens[1]): {
-                'behind': None,
-                'details': None,
-                'painted': False,
-            },
-        }
-
-        self._back_updated = True
-        self._back_cursor_updated = True
-
         self.cursor_shape = None
         self.cursor_position = None
+        # The cursor's opaque pixels, as offsets into a flattened
+        # screen relative to its corner, and their colors
+        self._cursor_offsets = None
+        self._cursor_rows = None
+        self._cursor_columns = None
+        self._cursor_colors = None
+        self.color_cycle = [0, 1, 2]
 
         self._has_initial_framebuffer_update = False
 
+    @property
+    def color_cycle(self):
+        return self._color_cycle
+
+    @color_cycle.setter
+    def color_cycle(self, color_cycle):
+        self._color_cycle = color_cycle
+        # With the pixel format we ask for, wire pixels are already RGB
+        self._rgb = list(color_cycle) == [0, 1, 2]
+        if self.cursor_shape is not None:
+            self._update_cursor_shape(*self.cursor_shape)
+
     def set_paint_cursor(self, paint_cursor):
         self.paint_cursor = paint_cursor
 
     def peek(self):
-        front_screen, _ = self._screens
-        return front_screen
+        return self._front.pixels
 
-    def flip(self):
-        pyprofile.push('vncdriver.numpy_screen.flip_bitmap')
+    def has_new_frame(self):
+        """Whether flip() would move to a newer frame."""
         with self.lock:
-            if self._back_updated:
-                updates = self._defer
-
-                # Flip screens
-                front_screen, back_screen = self._screens
-                self._screens = back_screen, front_screen
+            return self._ready.version > self._front.version
 
-                # Mark ourselves as pending application of updates
-                self._back_updated = False
+    def wait_for_frame(self, timeout=None):
+        return wait_for_frames([self], self.frame_ready, timeout=timeout)
 
-                # This can be called asynchronously if desired, but it means
-                # less reliably smooth playback.
-                #
-                # reactor.callFromThread(self.update_back)
-                self.update_back()
+    def flip(self):
+        pyprofile.push('vncdriver.numpy_screen.flip_bitmap')
+        start = time.time()
+        with self.lock:
+            acquired = time.time()
+            if self._ready.version > self._front.version:
+                self._front, self._ready = self._ready, self._front
+                updates = self._pending_updates
+                damaged = self._pending_damage
+                self._pending_updates = []
+                self._pending_damage = []
             else:
                 updates = []
-            result = self.peek(), {'vnc_session.framebuffer_updates': updates}
+                damaged = []
+            front = self._front
+        self._profile_lock('flip', start, acquired)
+
+        damaged = damage.merge_rectangles(damaged, self._width, self._height)
+        result = front.pixels, {
+            'vnc_session.framebuffer_updates': updates,
+            'vnc_session.damage': damaged,
+            'vnc_session.frame_version': front.version,
+        }
         pyprofile.pop()
         return result
 
     def apply_action(self, action):
         if isinstance(action, vnc_event.PointerEvent):
-            with self.lock:
+            with self._write_lock:
                 self.cursor_position = (action.x, action.y)
-
-                # If not self._back_updated, we're not actually up to
-                # date, so any pixels we cached would be wrong. When
-                # back updates, it'll automatically render the cursor.
-                if self._back_updated and self.paint_cursor:
-                    self._unpaint_cursor()
-                    self._paint_cursor()
+                if self._has_initial_framebuffer_update and self.paint_cursor:
+                    frame = self._write
+                    self._sync(frame)
+                    damaged = self._repaint_cursor(frame, False)
+                    if damaged:
+                        self._publish(frame, None, damaged)
 
     def apply(self, framebuffer_update):
-        with self.lock:
+        with self._write_lock:
             self._has_initial_framebuffer_update = True
 
-            # Pop any pending updates
-            self._update_back()
-            self._apply(framebuffer_update)
-            self._defer.append(framebuffer_update)
-
+            frame = self._write
+            self._sync(frame)
+            damaged, cursor_shape_changed = self._apply(frame, framebuffer_update)
+            damaged += self._repaint_cursor(frame, cursor_shape_changed)
+            self._publish(frame, framebuffer_update, damaged)
 
-    def _apply(self, framebuffer_update):
-        if self.paint_cursor:
-            self._unpaint_cursor()
+    def _apply(self, frame, framebuffer_update):
+        damaged = []
+        cursor_shape_changed = False
         for rect in framebuffer_update.rectangles:
             if isinstance(rect.encoding,
-                          (server_messages.RAWEncoding, server_messages.ZRLEEncoding, server_messages.ZlibEncoding)):
-                self._update_rectangle(rect.x, rect.y, rect.width, rect.height, rect.encoding.data)
+                          (server_messages.RAWEncoding, server_messages.ZRLEEncoding, server_messages.ZlibEncoding, server_messages.HextileEncoding, server_messages.TightEncoding)):
+                self._update_rectangle(frame.pixels, rect.x, rect.y, rect.width, rect.height, rect.encoding.data)
+                damaged.append((rect.x, rect.y, rect.width, rect.height))
+            elif isinstance(rect.encoding, server_messages.CopyRectEncoding):
+                self._copy_rectangle(frame.pixels, rect.encoding.src_x, rect.encoding.src_y, rect.x, rect.y, rect.width, rect.height)
+                damaged.append((rect.x, rect.y, rect.width, rect.height))
             elif isinstance(rect.encoding, server_messages.PseudoCursorEncoding):
                 self._update_cursor_shape(rect.x, rect.y, rect.width, rect.height, rect.encoding.image, rect.encoding.mask)
+                cursor_shape_changed = True
             else:
                 raise error.Error('Unrecognized encoding: {}'.format(rect.encoding))
-        if self.paint_cursor:
-            self._paint_cursor()
+        return damaged, cursor_shape_changed
 
-    def update_back(self):
+    def _publish(self, frame, framebuffer_update, damaged):
+        start = time.time()
         with self.lock:
-            self._update_back()
-
-    def _update_back(self):
-        if self._back_updated:
+            acquired = time.time()
+            self._version += 1
+            frame.version = self._version
+            self._write, self._ready = self._ready, frame
+            if framebuffer_update is not None:
+                self._pending_updates.append(framebuffer_update)
+            self._pending_damage.extend(damaged)
+        self._profile_lock('publish', start, acquired)
+        # Not under self.lock, which waiters take while holding this
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+
+        # Only writers look at these, so no need for the lock
+        self._newest = frame
+        for other in self._frames:
+            if other is not frame:
+                other.stale.extend(damaged)
+                if len(other.stale) > self.MAX_STALE_RECTANGLES:
+                    other.stale = damage.merge_rectangles(other.stale, self._width, self._height)
+
+    def _profile_lock(self, name, start, acquired):
+        pyprofile.timing('vncdriver.numpy_screen.lock.{}.wait'.format(name), acquired - start)
+        pyprofile.timing('vncdriver.numpy_screen.lock.{}.hold'.format(name), time.time() - acquired)
+
+    def _sync(self, frame):
+        """Bring a frame up to date with the newest one, copying only the
+        regions which have changed since it was last written."""
+        newest = self._newest
+        if newest is frame:
             return
-        self._back_updated = True
-
-        for framebuffer_update in self._defer:
-            self._apply(framebuffer_update)
 
-        if len(self._defer) == 0 and self.paint_cursor:
-            self._unpaint_cursor()
-            self._paint_cursor()
-
-        self._defer = []
-
-    def _update_rectangle(self, x, y, width, height, data):
-        _, back_screen = self._screens
-        back_screen[y:y+height, x:x+width, self.color_cycle] = data
+        self._unpaint_cursor(frame)
+
+        regions = frame.stale
+        cursor = newest.cursor_extent()
+        if cursor is not None:
+            # We want what's under the newest frame's cursor, not the
+            # cursor itself
+            regions = regions + [cursor]
+        for x, y, width, height in damage.merge_rectangles(regions, self._width, self._height):
+            frame.pixels[y:y+height, x:x+width] = newest.pixels[y:y+height, x:x+width]
+        if cursor is not None:
+            frame.pixels.reshape((-1, 3))[newest.cursor_index] = newest.cursor_behind
+
+        frame.stale = []
+
+    def _update_rectangle(self, screen, x, y, width, height, data):
+        region = screen[y:y+height, x:x+width]
+        if self._rgb and data.strides[1:] == (3, 1):
+            # Whole rows of packed pixels, as the tile decoders produce
+            region[:] = data
+        else:
+            # Wire pixels viewed with their padding byte dropped (or
+            # in another channel order). NumPy copies these far
+            # faster a channel at a time than a pixel at a time.
+            for channel, target in enumerate(self.color_cycle):
+                region[:, :, target] = data[:, :, channel]
+
+    def _copy_rectangle(self, screen, src_x, src_y, x, y, width, height):
+        # Source and destination may overlap (e.g. when scrolling),
+        # which NumPy handles by buffering the source.
+        screen[y:y+height, x:x+width] = screen[src_y:src_y+height, src_x:src_x+width]
 
     def _update_cursor_shape(self, hotx, hoty, width, height, image, mask):
         # hotx, hoty are the hotspot within the cursor
         self.cursor_shape = (hotx, hoty, width, height, image, mask)
 
-    def _paint_cursor(self):
+        # The mask is one bit per pixel, so painting is just replacing
+        # the opaque pixels. Work out which they are once, rather than
+        # blending the whole box on every paint.
+        rows, columns = np.nonzero(mask)
+        colors = np.empty((len(rows), 3), dtype=np.uint8)
+        colors[:, self.color_cycle] = image[rows, columns]
+        self._cursor_rows = rows
+        self._cursor_columns = columns
+        self._cursor_offsets = rows * self._width + columns
+        self._cursor_colors = colors
+
+    def _repaint_cursor(self, frame, cursor_shape_changed):
+        """Paint the cursor onto a freshly synced frame. Returns the
+        regions which differ from the newest frame because the cursor
+        moved, appeared or disappeared."""
+        if self.paint_cursor:
+            self._paint_cursor(frame)
 
+        previous = self._newest.cursor_extent()
+        current = frame.cursor_extent()
+        if current != previous or (cursor_shape_changed and current is not None):
+            return [extent for extent in (previous, current) if extent is not None]
+        else:
+            return []
+
+    def _paint_cursor(self, frame):
         # use our knowledge of the x, y cursor position plus the
         # cursor shape to paint the cursor
         if self.cursor_position is None:
@@ -150,50 +313,35 @@ class NumpyScreen(object):
         elif self.cursor_shape is None:
             return
 
-        self._back_cursor_updated = True
-
-        _, back_screen = self._screens
-        cursor = self._cursor[id(back_screen)]
-
-        assert not cursor['painted']
-        cursor['painted'] = True
+        assert frame.cursor_behind is None
 
         hotx, hoty, width, height, image, mask = self.cursor_shape
         x, y = self.cursor_position
+        colors = self._cursor_colors
+
+        if 0 <= x and x + width <= self._width and 0 <= y and y + height <= self._height:
+            index = self._cursor_offsets + (y * self._width + x)
+        else:
+            # Partly off the screen
+            rows = self._cursor_rows + y
+            columns = self._cursor_columns + x
+            visible = (rows >= 0) & (rows < self._height) & (columns >= 0) & (columns < self._width)
+            index = rows[visible] * self._width + columns[visible]
+            colors = colors[visible]
+
+        pixels = frame.pixels.reshape((-1, 3))
+        frame.cursor_details = (x, y, width, height)
+        frame.cursor_index = index
+        frame.cursor_behind = pixels[index]
+        pixels[index] = colors
+
+    def _unpaint_cursor(self, frame):
+        if frame.cursor_behind is not None:
+            frame.pixels.reshape((-1, 3))[frame.cursor_index] = frame.cursor_behind
+        frame.cursor_details = None
+        frame.cursor_index = None
+        frame.cursor_behind = None
 
-        # Save old data
-        cursor['details'] = (x, y, width, height)
-        cursor['behind'] = back_screen[y:y+height, x:x+width, :].copy()
-
-        # Paint the cursor
-        total_h, total_w, _ = back_screen.shape
-
-        cutoff_h = min(total_h - y, height)
-        cutoff_w = min(total_w - x, width)
-        image = image[:cutoff_h, :cutoff_w]
-        mask = mask[:cutoff_h, :cutoff_w, np.newaxis]
-
-        back_screen[y:y+height, x:x+width, self.color_cycle] = (1 - mask)*back_screen[y:y+height, x:x+width, self.color_cycle] + mask*image
-
-    def _unpaint_cursor(self):
-
-        _, back_screen = self._screens
-        cursor = self._cursor[id(back_screen)]
-
-        if cursor['behind'] is not None:
-            assert cursor['painted']
-            x, y, width, height = cursor['details']
-            back_screen[y:y+height, x:x+width, :] = cursor['behind']
-        cursor['painted'] = False
-
-
-    # def _copy_rectangle(self, screen, src_x, src_y, x, y, width, height):
-    #     update = np.frombuffer(data, dtype=np.uint8)
-    #     update = update.reshape([height, width, 4])
-    #     update = update[:, :, self._color_cycle]  # Ignore X channel
-
-
-    #     screen[y:y+height, x:x+width] = screen[src_y:src_y+height, src_x:src_x+width]
 
     # def _fill_rectangle(self, screen, x, y, width, height, color):
     #     update = np.frombuffer(color, dtype=np.uint8)
@@ -0,0 +1,64 @@
+import numpy as np
+
+from universe import error
+from universe.vncdriver.screen import damage
+
+class ObservationBuffer(object):
+    """Gathers n screens' observations into one preallocated (n, height,
+    width, 3) array, so batched learners don't have to np.stack them
+    every step.
+
+    With count=2, update() alternates between two arrays, so the one it
+    returned last time stays intact while the next is written. Either
+    way, only the regions which changed since an array was last
+    written are copied into it.
+    """
+
+    def __init__(self, n, count=2):
+        assert count >= 1, 'Need at least one buffer: {}'.format(count)
+        self.n = n
+        self.count = count
+
+        self._arrays = None
+        # For each array and screen, the regions to copy in before it's
+        # current, or None for all of it
+        self._stale = None
+        self._next = 0
+
+    def update(self, observation_n, damage_n):
+        """Write the screens' latest observations, given the regions
+        which changed since the last update, into the next array and
+        return it."""
+        if self._arrays is None:
+            self._allocate(observation_n)
+
+        array = self._arrays[self._next]
+        for stale in self._stale:
+            for i, damaged in enumerate(damage_n):
+                if stale[i] is not None:
+                    stale[i].extend(damaged)
+
+        stale = self._stale[self._next]
+        height, width = array.shape[1:3]
+        for i, observation in enumerate(observation_n):
+            if observation.shape != array.shape[1:]:
+                raise error.Error('Screen {} is {}, but the observation buffer is for {}'.format(i, observation.shape, array.shape[1:]))
+            if stale[i] is None:
+                array[i] = observation
+            else:
+                for x, y, w, h in damage.merge_rectangles(stale[i], width, height):
+                    array[i, y:y+h, x:x+w] = observation[y:y+h, x:x+w]
+            stale[i] = []
+
+        self._next = (self._next + 1) % self.count
+        return array
+
+    def _allocate(self, observation_n):
+        if len(observation_n) != self.n:
+            raise error.Error('Expected {} observations, but got {}'.format(self.n, len(observation_n)))
+        shapes = set(observation.shape for observation in observation_n)
+        if len(shapes) != 1:
+            raise error.Error('Screens must all be the same size to share an observation buffer: {}'.format(sorted(shapes)))
+        shape = shapes.pop()
+        self._arrays = [np.zeros((self.n,) + shape, dtype=np.uint8) for _ in range(self.count)]
+        self._stale = [[None] * self.n for _ in range(self.count)]
@@ -46,12 +46,19 @@ class PygletScreen(object):
         self.texture.blit_into(image, x, self._height-height-y, 0)
         self._is_updated = True
 
+    def copy_rectangle(self, src_x, src_y, x, y, width, height):
+        region = self.texture.get_region(src_x, self._height-height-src_y, width, height)
+        self.texture.blit_into(region.get_image_data(), x, self._height-height-y, 0)
+        self._is_updated = True
+
     def apply(self, framebuffer_update):
         pyprofile.push('vncdriver.pyglet_screen.apply')
         for rect in framebuffer_update.rectangles:
             if isinstance(rect.encoding,
-                          (server_messages.RAWEncoding, server_messages.ZRLEEncoding, server_messages.ZlibEncoding)):
+                          (server_messages.RAWEncoding, server_messages.ZRLEEncoding, server_messages.ZlibEncoding, server_messages.HextileEncoding, server_messages.TightEncoding)):
                 self.update_rectangle(rect.x, rect.y, rect.width, rect.height, rect.encoding.data)
+            elif isinstance(rect.encoding, server_messages.CopyRectEncoding):
+                self.copy_rectangle(rect.encoding.src_x, rect.encoding.src_y, rect.x, rect.y, rect.width, rect.height)
             else:
                 raise error.Error('Unrecognized encoding: {}'.format(rect.encoding))
         pyprofile.pop()
@@ -64,11 +71,6 @@ class PygletScreen(object):
     #     self._update_rgbarray(x, y, width, height, update)
 
 
-    # def copy_rectangle(self, src_x, src_y, x, y, width, height):
-    #     assert self._window
-    #     rectangle = self.texture.get_region(src_x, self._height-height-src_y, width, height)
-    #     self.texture.blit_into(rectangle.get_image_data(), x, self._height-height-y, 0)
-
     # def fill_rectangle(self, x, y, width, height, color):
     #     import pyglet
     #     # While this technically works, it's super slow
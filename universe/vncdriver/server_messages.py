@@ -1,18 +1,21 @@
-try:
-    # In Py2, use the more efficient cStringIO implementation if it's
-    # available
-    from cStringIO import StringIO as BytesIO
-except ImportError:
-    # Fall back to using normal BytesIO, six handles python 2 vs 3 compat
-    from six import BytesIO
-
 import logging
 import numpy as np
+import six
 from universe import pyprofile
+from six import BytesIO
 import struct
+import zlib
 
 logger = logging.getLogger(__name__)
 
+def uint8(data):
+    """data (bytes, or a memoryview block from the receive buffer) as a
+    uint8 array, without copying. Python 2's np.frombuffer can't take
+    a memoryview, but np.asarray can."""
+    if isinstance(data, memoryview):
+        return np.asarray(data)
+    return np.frombuffer(data, np.uint8)
+
 class FramebufferUpdate(object):
     def __init__(self, rectangles):
         self.rectangles = rectangles
@@ -33,10 +36,11 @@ class PseudoCursorEncoding(object):
     @classmethod
     def parse_rectangle(cls, client, x, y, width, height, data):
         split = width * height * client.framebuffer.bypp
-        image = np.frombuffer(data[:split], np.uint8).reshape((height, width, 4))[:, :, [0, 1, 2]]
+        data = uint8(data)
+        image = data[:split].reshape((height, width, 4))[:, :, :3]
 
         # Turn raw bytes into uint8 array
-        mask = np.frombuffer(data[split:], np.uint8)
+        mask = data[split:]
         # Turn uint8 array into bit array, and go over the scanlines
         mask = np.unpackbits(mask).reshape((height, -1 if mask.size else 0))[:, :width]
 
@@ -50,10 +54,164 @@ class RAWEncoding(object):
     @classmethod
     def parse_rectangle(cls, client, x, y, width, height, data):
         assert client.framebuffer.bpp == 32
-        data = np.frombuffer(data, np.uint8).reshape((height, width, 4))[:, :, [0, 1, 2]]
+        # A strided view straight onto the wire pixels, dropping the
+        # padding byte. The screen copies it in one go. (The receive
+        # buffer is never modified in place, so the view stays valid.)
+        data = uint8(data).reshape((height, width, 4))[:, :, :3]
         encoding = cls(data)
         return Rectangle(x, y, width, height, encoding)
 
+class CopyRectEncoding(object):
+    def __init__(self, src_x, src_y):
+        self.src_x = src_x
+        self.src_y = src_y
+
+    @classmethod
+    def parse_rectangle(cls, client, x, y, width, height, data):
+        (src_x, src_y) = struct.unpack('!HH', data)
+        encoding = cls(src_x, src_y)
+        return Rectangle(x, y, width, height, encoding)
+
+class HextileEncoding(object):
+    # Tile subencoding mask bits
+    RAW = 1
+    BACKGROUND_SPECIFIED = 2
+    FOREGROUND_SPECIFIED = 4
+    ANY_SUBRECTS = 8
+    SUBRECTS_COLOURED = 16
+
+    def __init__(self, data):
+        self.data = data
+
+class HextileDecoder(object):
+    """Hextile rectangles are a sequence of variable-length 16x16
+    tiles, so unlike the other encodings we can't know a rectangle's
+    length upfront. Instead, the client feeds us one block at a time,
+    and we say how many bytes we want next.
+
+    Background and foreground colors carry over from tile to tile.
+    """
+
+    def __init__(self, x, y, width, height, bytes_per_pixel):
+        assert bytes_per_pixel == 4
+
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.bytes_per_pixel = bytes_per_pixel
+        self.bytes = 0
+
+        self.data = np.zeros([height, width, 3], dtype=np.uint8)
+        self._tiles = [(tile_x, tile_y, min(16, width-tile_x), min(16, height-tile_y))
+                       for tile_y in range(0, height, 16)
+                       for tile_x in range(0, width, 16)]
+        self._index = 0
+        self._state = 'subencoding'
+        self._subencoding = None
+
+        self._background = np.zeros(3, dtype=np.uint8)
+        self._foreground = np.zeros(3, dtype=np.uint8)
+
+    def next_length(self):
+        """Bytes needed to make progress, or 0 once the rectangle is
+        complete."""
+        if self._index >= len(self._tiles):
+            return 0
+        elif self._state == 'subencoding':
+            return 1
+        elif self._state == 'raw':
+            _, _, tile_width, tile_height = self._tiles[self._index]
+            return tile_width * tile_height * self.bytes_per_pixel
+        elif self._state == 'header':
+            length = 0
+            if self._subencoding & HextileEncoding.BACKGROUND_SPECIFIED:
+                length += self.bytes_per_pixel
+            if self._subencoding & HextileEncoding.FOREGROUND_SPECIFIED:
+                length += self.bytes_per_pixel
+            if self._subencoding & HextileEncoding.ANY_SUBRECTS:
+                length += 1
+            return length
+        else:
+            assert self._state == 'subrects'
+            if self._subencoding & HextileEncoding.SUBRECTS_COLOURED:
+                return self._subrects * (self.bytes_per_pixel + 2)
+            else:
+                return self._subrects * 2
+
+    def feed(self, block):
+        """Consume a block of next_length() bytes. Returns the number of
+        bytes needed next."""
+        self.bytes += len(block)
+        tile_x, tile_y, tile_width, tile_height = self._tiles[self._index]
+        tile = self.data[tile_y:tile_y+tile_height, tile_x:tile_x+tile_width]
+
+        if self._state == 'subencoding':
+            self._subencoding = six.indexbytes(block, 0)
+            if self._subencoding & HextileEncoding.RAW:
+                self._state = 'raw'
+            else:
+                self._state = 'header'
+        elif self._state == 'raw':
+            tile[:, :, :] = uint8(block).reshape((tile_height, tile_width, self.bytes_per_pixel))[:, :, :3]
+            self._next_tile()
+        elif self._state == 'header':
+            offset = 0
+            if self._subencoding & HextileEncoding.BACKGROUND_SPECIFIED:
+                self._background = self._pixel(block, offset)
+                offset += self.bytes_per_pixel
+            if self._subencoding & HextileEncoding.FOREGROUND_SPECIFIED:
+                self._foreground = self._pixel(block, offset)
+                offset += self.bytes_per_pixel
+            tile[:, :, :] = self._background
+
+            if self._subencoding & HextileEncoding.ANY_SUBRECTS:
+                self._subrects = six.indexbytes(block, offset)
+                self._state = 'subrects'
+            else:
+                self._subrects = 0
+
+            if self._subrects == 0:
+                self._next_tile()
+        else:
+            self._paint_subrects(tile, block)
+            self._next_tile()
+
+        # A header with no fields set is a tile of solid background
+        length = self.next_length()
+        if length == 0 and self._index < len(self._tiles):
+            return self.feed(b'')
+        return length
+
+    def rectangle(self):
+        return Rectangle(self.x, self.y, self.width, self.height, HextileEncoding(self.data))
+
+    def _next_tile(self):
+        self._index += 1
+        self._state = 'subencoding'
+        self._subencoding = None
+
+    def _pixel(self, block, offset):
+        return uint8(block)[offset:offset+3].copy()
+
+    def _paint_subrects(self, tile, block):
+        coloured = self._subencoding & HextileEncoding.SUBRECTS_COLOURED
+        # Indexing a bytearray gives ints, on Python 2 as well
+        block = bytearray(block)
+        offset = 0
+        color = self._foreground
+        for _ in range(self._subrects):
+            if coloured:
+                color = self._pixel(block, offset)
+                offset += self.bytes_per_pixel
+            xy = block[offset]
+            wh = block[offset+1]
+            offset += 2
+
+            x, y = xy >> 4, xy & 15
+            width, height = (wh >> 4) + 1, (wh & 15) + 1
+            tile[y:y+height, x:x+width] = color
+
 class ZlibEncoding(object):
     def __init__(self, data):
         self.data = data
@@ -63,7 +221,7 @@ class ZlibEncoding(object):
         decompressed = client.zlib_decompressor.decompress(data)
         logger.debug('[zlib] Decompressed from %s bytes -> %s bytes', len(data), len(decompressed))
         pyprofile.incr('vncdriver.recv_rectangle.zlib_encoding.decompressed_bytes', len(decompressed), unit=pyprofile.BYTES)
-        data = np.frombuffer(decompressed, np.uint8).reshape((height, width, 4))[:, :, [0, 1, 2]]
+        data = np.frombuffer(decompressed, np.uint8).reshape((height, width, 4))[:, :, :3]
         encoding = cls(data)
         return Rectangle(x, y, width, height, encoding)
 
@@ -73,7 +231,7 @@ class ZRLEEncoding(object):
 
     @classmethod
     def parse_rectangle(cls, client, x, y, width, height, data):
-        decompressed = client.zlib_decompressor.decompress(data)
+        decompressed = client.zrle_decompressor.decompress(data)
         logger.debug('[zrle] Decompressed from %s bytes -> %s bytes', len(data), len(decompressed))
         pyprofile.incr('vncdriver.recv_rectangle.zrle_encoding.decompressed_bytes', len(decompressed), unit=pyprofile.BYTES)
 
@@ -82,14 +240,14 @@ class ZRLEEncoding(object):
         else:
             bytes_per_pixel = client.framebuffer.bypp
 
-        buf = BytesIO(decompressed)
-        data = cls._read(x, y, width, height, buf, bytes_per_pixel)
+        data = cls._read(x, y, width, height, bytearray(decompressed), bytes_per_pixel)
         encoding = cls(data)
         return Rectangle(x, y, width, height, encoding)
 
     @classmethod
     def _read(cls, x, y, width, height, buf, bytes_per_pixel):
         data = np.zeros([height, width, 3], dtype=np.uint8) + 255
+        offset = 0
 
         for tile_y in range(0, height, 64):
             tile_height = min(64, height-tile_y)
@@ -98,11 +256,14 @@ class ZRLEEncoding(object):
                 tile_width = min(64, width-tile_x)
 
                 tile = data[tile_y:tile_y+tile_height, tile_x:tile_x+tile_width]
-                cls._read_tile(tile, buf, tile_width, tile_height, bytes_per_pixel)
+                offset = cls._read_tile(tile, buf, offset, tile_width, tile_height, bytes_per_pixel)
         return data
 
     @classmethod
-    def _read_tile(cls, tile, buf, tile_width, tile_height, bytes_per_pixel):
+    def _read_tile(cls, tile, buf, offset, tile_width, tile_height, bytes_per_pixel):
+        """Decode one tile from the bytearray `buf`, starting at
+        `offset`. Returns the offset just past the tile.
+        """
         assert bytes_per_pixel == 3
 
         # Each tile begins with a subencoding type byte.  The top bit of this
@@ -112,14 +273,16 @@ class ZRLEEncoding(object):
         # indicate a palette of that size.  The special subencoding values 129
         # and 127 indicate that the palette is to be reused from the last tile
         # that had a palette, with and without RLE, respectively.
-        (subencoding,) = struct.unpack('!B', buf.read(1))
+        subencoding = buf[offset]
+        offset += 1
 
         run_length_encoded = bool(subencoding & 128)
         palette_size = subencoding & 127
 
         bytes = palette_size * bytes_per_pixel
-        palette_data = buf.read(bytes)
-        assert len(palette_data) == bytes, "Palette data came up short: {} bytes rather than {}".format(len(palette_data), bytes)
+        assert len(buf) - offset >= bytes, "Palette data came up short: {} bytes rather than {}".format(len(buf) - offset, bytes)
+        palette = np.frombuffer(buf, dtype=np.uint8, count=bytes, offset=offset).reshape((-1, 3))
+        offset += bytes
 
         logger.debug('Handling zrle tile: run_length_encoded=%s palette_size=%s', run_length_encoded, palette_size)
 
@@ -132,10 +295,11 @@ class ZRLEEncoding(object):
             #  +-----------------------------+--------------+-------------+
             #  | width*height*BytesPerCPixel | CPIXEL array | pixels      |
             #  +-----------------------------+--------------+-------------+
-            data = buf.read(bytes_per_pixel * tile_width * tile_height)
-            data = np.frombuffer(data, dtype=np.uint8).reshape((tile_height, tile_width, 3))
+            bytes = bytes_per_pixel * tile_width * tile_height
+            assert len(buf) - offset >= bytes, "Pixel data came up short: {} bytes rather than {}".format(len(buf) - offset, bytes)
+            data = np.frombuffer(buf, dtype=np.uint8, count=bytes, offset=offset).reshape((tile_height, tile_width, 3))
             tile[:, :, :] = data
-            return
+            return offset + bytes
         elif palette_size == 1 and not run_length_encoded:
             # 1: A solid tile consisting of a single color.  The pixel value
             # follows:
@@ -145,9 +309,8 @@ class ZRLEEncoding(object):
             # +----------------+--------------+-------------+
             # | bytesPerCPixel | CPIXEL       | pixelValue  |
             # +----------------+--------------+-------------+
-            color = np.frombuffer(palette_data, dtype=np.uint8).reshape((3, ))
-            tile[:, :, :] = color
-            return
+            tile[:, :, :] = palette[0]
+            return offset
         elif not run_length_encoded:
             # 2 to 16:  Packed palette types.  The paletteSize is the value of the
             # subencoding, which is followed by the palette, consisting of
@@ -172,8 +335,6 @@ class ZRLEEncoding(object):
             #  For paletteSize of 2, this is div(width+7,8)*height; for
             #  paletteSize of 3 or 4, this is div(width+3,4)*height; or for
             #  paletteSize of 5 to 16, this is div(width+1,2)*height.
-            palette = np.frombuffer(palette_data, dtype=np.uint8).reshape((-1, 3))
-
             if palette_size > 16:
                 # No palette reuse in zrle
                 assert palette_size < 127
@@ -185,19 +346,15 @@ class ZRLEEncoding(object):
             else:
                 bits_per_packed_pixel = 1
 
-            for j in range(tile_height):
-                # Discard any leftover bits for each new line
-                b = 0
-                nbits = 0
-
-                for i in range(tile_width):
-                    if nbits == 0:
-                        (b,) = struct.unpack('!B', buf.read(1))
-                        nbits = 8
-                    nbits -= bits_per_packed_pixel
-                    idx = (b >> nbits) & ((1 << bits_per_packed_pixel) - 1) & 127
-                    tile[j, i, :] = palette[idx]
-            return
+            # Each row is padded out to a whole number of bytes
+            row_bytes = (tile_width * bits_per_packed_pixel + 7) // 8
+            bytes = row_bytes * tile_height
+            assert len(buf) - offset >= bytes, "Packed pixel data came up short: {} bytes rather than {}".format(len(buf) - offset, bytes)
+
+            packed = np.frombuffer(buf, dtype=np.uint8, count=bytes, offset=offset).reshape((tile_height, row_bytes))
+            idx = cls._unpack_palette_indexes(packed, bits_per_packed_pixel, tile_width)
+            tile[:, :, :] = palette[idx]
+            return offset + bytes
         elif run_length_encoded and palette_size == 0:
             # 128:  Plain RLE.  The data consists of a number of runs, repeated
             # until the tile is done.  Runs may continue from the end of one row
@@ -217,23 +374,11 @@ class ZRLEEncoding(object):
             # | div(runLength - 1, 255) | U8 array     | 255                   |
             # | 1                       | U8           | (runLength-1) mod 255 |
             # +-------------------------+--------------+-----------------------+
-            i = 0
-            pixels = tile_width * tile_height
-            data = np.zeros((pixels, 3))
-            while i < pixels:
-                pix = buf.read(bytes_per_pixel)
-                pix = np.frombuffer(pix, dtype=np.uint8).reshape((3, ))
-
-                count = 1
-                b = None
-
-                while b == 255 or b is None:
-                    (b,) = struct.unpack('!B', buf.read(1))
-                    count += b
+            starts, counts, offset = cls._scan_runs(buf, offset, tile_width * tile_height, bytes_per_pixel)
 
-                data[i:i+count, :] = pix
-                i += count
-            assert i == pixels
+            # Gather each run's pixel value straight out of the buffer
+            starts = np.array(starts, dtype=np.intp)
+            values = np.frombuffer(buf, dtype=np.uint8)[starts[:, np.newaxis] + np.arange(bytes_per_pixel)]
         elif run_length_encoded and palette_size > 1:
             # 130 to 255:  Palette RLE.  Followed by the palette, consisting of
             # paletteSize = (subencoding - 128) pixel values:
@@ -265,29 +410,288 @@ class ZRLEEncoding(object):
             # | div(runLength - 1, 255) | U8 array     | 255                   |
             # | 1                       | U8           | (runLength-1) mod 255 |
             # +-------------------------+--------------+-----------------------+
-            palette = np.frombuffer(palette_data, dtype=np.uint8).reshape((-1, 3))
+            idx, counts, offset = cls._scan_runs(buf, offset, tile_width * tile_height, None)
+            values = palette[idx]
+        else:
+            assert False, "Unhandled case: run_length_encoded={} palette_size={}".format(run_length_encoded, palette_size)
+
+        tile[:] = np.repeat(values, counts, axis=0).reshape((tile_height, tile_width, 3))
+        return offset
+
+    @classmethod
+    def _scan_runs(cls, buf, offset, pixels, bytes_per_pixel):
+        """Walk the runs of an RLE tile in a single pass.
+
+        For plain RLE (bytes_per_pixel given), returns the offset of
+        each run's pixel value; for palette RLE (bytes_per_pixel is
+        None), returns each run's palette index. Also returns the run
+        lengths and the offset just past the tile.
+        """
+        values = []
+        counts = []
+        i = 0
+        while i < pixels:
+            if bytes_per_pixel is not None:
+                values.append(offset)
+                offset += bytes_per_pixel
+                long_run = True
+            else:
+                idx = buf[offset]
+                offset += 1
+                values.append(idx & 127)
+                # Only runs longer than one carry a length
+                long_run = idx & 128
+
+            count = 1
+            if long_run:
+                b = 255
+                while b == 255:
+                    b = buf[offset]
+                    offset += 1
+                    count += b
 
-            i = 0
-            pixels = tile_width * tile_height
-            data = np.zeros((pixels, 3))
-            while i < pixels:
-                (idx,) = struct.unpack('!B', buf.read(1))
+            counts.append(count)
+            i += count
+        assert i == pixels, "Runs covered {} pixels rather than {}".format(i, pixels)
+        return values, counts, offset
+
+    @classmethod
+    def _unpack_palette_indexes(cls, packed, bits_per_packed_pixel, tile_width):
+        """Turn a (height, row_bytes) array of packed pixel rows into a
+        (height, tile_width) array of palette indexes.
+        """
+        if bits_per_packed_pixel == 1:
+            idx = np.unpackbits(packed, axis=1)
+        elif bits_per_packed_pixel == 8:
+            idx = packed
+        else:
+            # Most significant bits hold the leftmost pixel, so
+            # e.g. for 2-bit fields we shift by 6, 4, 2, 0.
+            shifts = np.arange(8 - bits_per_packed_pixel, -1, -bits_per_packed_pixel, dtype=np.uint8)
+            mask = (1 << bits_per_packed_pixel) - 1
+            idx = (packed[:, :, np.newaxis] >> shifts) & mask
+            idx = idx.reshape((packed.shape[0], -1))
+        # Drop the padding bits at the end of each row
+        return idx[:, :tile_width] & 127
+
+class TightEncoding(object):
+    # Compression control: the top four bits of the first byte
+    FILL = 8
+    JPEG = 9
+    MAX_SUBENCODING = 9
+
+    # Basic compression filters
+    COPY_FILTER = 0
+    PALETTE_FILTER = 1
+    GRADIENT_FILTER = 2
+
+    # Data shorter than this is sent without zlib
+    MIN_TO_COMPRESS = 12
+
+    def __init__(self, data):
+        self.data = data
 
-                count = 1
+class TightDecoder(object):
+    """Like Hextile, Tight rectangles have no length header, so the
+    client feeds us one block at a time and we say how many bytes we
+    want next.
 
-                if idx & 128:
-                    b = None
-                    while b == 255 or b is None:
-                        (b,) = struct.unpack('!B', buf.read(1))
-                        count += b
+    `zlib_streams` is the connection's list of four zlib
+    decompressors, which persist across rectangles. The server tells
+    us when to reset them.
 
-                idx &= 127
-                pix = palette[idx]
+    Pixels in Tight (TPIXELs) are sent as 3 bytes, in red, green, blue
+    order, when the pixel format is 32bpp with depth 24.
+    """
 
-                data[i:i+count, :] = pix
-                i += count
-            assert i == pixels
+    def __init__(self, x, y, width, height, zlib_streams, bytes_per_pixel, depth):
+        assert bytes_per_pixel == 4 and depth == 24, 'Tight is only supported for 32bpp with depth 24, not bpp={} depth={}'.format(8*bytes_per_pixel, depth)
+
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.zlib_streams = zlib_streams
+        self.tpixel_size = 3
+        self.bytes = 0
+        self.data = None
+
+        self._state = 'control'
+        self._stream = None
+        self._filter = None
+        self._palette_size = None
+        self._palette = None
+        # Compact lengths come one byte at a time
+        self._length = 0
+        self._length_bytes = 0
+        self._then = None
+
+    def next_length(self):
+        """Bytes needed to make progress, or 0 once the rectangle is
+        complete."""
+        if self._state in ('control', 'filter', 'palette_size', 'length'):
+            return 1
+        elif self._state == 'fill':
+            return self.tpixel_size
+        elif self._state == 'palette':
+            return self._palette_size * self.tpixel_size
+        elif self._state in ('basic', 'jpeg'):
+            return self._length
         else:
-            assert False, "Unhandled case: run_length_encoded={} palette_size={}".format(run_length_encoded, palette_size)
+            assert self._state == 'done'
+            return 0
+
+    def feed(self, block):
+        """Consume a block of next_length() bytes. Returns the number of
+        bytes needed next."""
+        self.bytes += len(block)
+
+        if self._state == 'control':
+            self._read_control(six.indexbytes(block, 0))
+        elif self._state == 'fill':
+            self.data = np.zeros([self.height, self.width, 3], dtype=np.uint8)
+            self.data[:, :, :] = uint8(block)
+            self._state = 'done'
+        elif self._state == 'filter':
+            self._read_filter(six.indexbytes(block, 0))
+        elif self._state == 'palette_size':
+            self._palette_size = six.indexbytes(block, 0) + 1
+            self._state = 'palette'
+        elif self._state == 'palette':
+            self._palette = uint8(block).reshape((-1, 3)).copy()
+            self._expect_basic_data()
+        elif self._state == 'length':
+            self._read_length(six.indexbytes(block, 0))
+        elif self._state == 'basic':
+            self._decode_basic(block)
+            self._state = 'done'
+        elif self._state == 'jpeg':
+            self._decode_jpeg(block)
+            self._state = 'done'
+        else:
+            assert False, 'Fed {} bytes after the rectangle was complete'.format(len(block))
+
+        return self.next_length()
 
-        tile[:] = data.reshape((tile_height, tile_width, 3))
+    def rectangle(self):
+        return Rectangle(self.x, self.y, self.width, self.height, TightEncoding(self.data))
+
+    def _read_control(self, control):
+        for i in range(4):
+            if control & (1 << i):
+                self.zlib_streams[i] = zlib.decompressobj()
+
+        subencoding = control >> 4
+        if subencoding == TightEncoding.FILL:
+            self._state = 'fill'
+        elif subencoding == TightEncoding.JPEG:
+            self._expect_length('jpeg')
+        elif subencoding > TightEncoding.MAX_SUBENCODING:
+            assert False, 'Unsupported tight compression control: {:#x}'.format(control)
+        else:
+            # Basic compression: bits 4-5 pick the zlib stream, and bit
+            # 6 says an explicit filter follows
+            self._stream = subencoding & 3
+            if subencoding & 4:
+                self._state = 'filter'
+            else:
+                self._filter = TightEncoding.COPY_FILTER
+                self._expect_basic_data()
+
+    def _read_filter(self, filter):
+        self._filter = filter
+        if filter == TightEncoding.PALETTE_FILTER:
+            self._state = 'palette_size'
+        elif filter in (TightEncoding.COPY_FILTER, TightEncoding.GRADIENT_FILTER):
+            self._expect_basic_data()
+        else:
+            assert False, 'Unknown tight filter: {}'.format(filter)
+
+    def _expect_basic_data(self):
+        self._uncompressed_length = self._basic_data_length()
+        if self._uncompressed_length < TightEncoding.MIN_TO_COMPRESS:
+            self._stream = None
+            self._length = self._uncompressed_length
+            self._state = 'basic'
+        else:
+            self._expect_length('basic')
+
+    def _basic_data_length(self):
+        if self._filter != TightEncoding.PALETTE_FILTER:
+            return self.width * self.height * self.tpixel_size
+        elif self._palette_size == 2:
+            # One bit per pixel, with rows padded to a byte boundary
+            return (self.width + 7) // 8 * self.height
+        else:
+            return self.width * self.height
+
+    def _expect_length(self, then):
+        self._then = then
+        self._length = 0
+        self._length_bytes = 0
+        self._state = 'length'
+
+    def _read_length(self, b):
+        # Compact length: 7 bits in each of the first two bytes, with
+        # the top bit saying another byte follows, then 8 bits
+        if self._length_bytes < 2:
+            self._length |= (b & 127) << (7 * self._length_bytes)
+            more = b & 128
+        else:
+            self._length |= b << 14
+            more = False
+        self._length_bytes += 1
+
+        if not more:
+            self._state = self._then
+
+    def _decode_basic(self, block):
+        # Python 2's zlib can't take a memoryview
+        if self._stream is None:
+            buf = block.tobytes()
+        else:
+            buf = self.zlib_streams[self._stream].decompress(block.tobytes())
+            pyprofile.incr('vncdriver.recv_rectangle.tight_encoding.decompressed_bytes', len(buf), unit=pyprofile.BYTES)
+        assert len(buf) == self._uncompressed_length, 'Tight data came up short: {} bytes rather than {}'.format(len(buf), self._uncompressed_length)
+        pixels = np.frombuffer(buf, dtype=np.uint8)
+
+        if self._filter == TightEncoding.COPY_FILTER:
+            self.data = pixels.reshape((self.height, self.width, 3))
+        elif self._filter == TightEncoding.PALETTE_FILTER:
+            if self._palette_size == 2:
+                idx = np.unpackbits(pixels.reshape((self.height, -1)), axis=1)[:, :self.width]
+            else:
+                idx = pixels.reshape((self.height, self.width))
+            self.data = self._palette[idx]
+        else:
+            self.data = self._ungradient(pixels.reshape((self.height, self.width, 3)))
+
+    @classmethod
+    def _ungradient(cls, diffs):
+        """Undo the gradient filter, under which each pixel is sent as
+        its difference from the prediction left + above - above_left,
+        clamped to 0..255 per channel.
+
+        Each pixel depends on its left neighbour, so we can't decode a
+        row all at once. Pixels on the same anti-diagonal are
+        independent though, so we decode one diagonal at a time.
+        """
+        height, width, _ = diffs.shape
+        # Zero border for the top row and left column
+        pixels = np.zeros([height+1, width+1, 3], dtype=np.int16)
+        diffs = diffs.astype(np.int16)
+        for d in range(height + width - 1):
+            ys = np.arange(max(0, d-width+1), min(height, d+1))
+            xs = d - ys
+            prediction = pixels[ys+1, xs] + pixels[ys, xs+1] - pixels[ys, xs]
+            np.clip(prediction, 0, 255, out=prediction)
+            pixels[ys+1, xs+1] = (prediction + diffs[ys, xs]) & 255
+        return pixels[1:, 1:].astype(np.uint8)
+
+    def _decode_jpeg(self, block):
+        # Pillow is only needed if the server actually sends JPEG
+        from PIL import Image
+        image = Image.open(BytesIO(block.tobytes())).convert('RGB')
+        data = np.asarray(image, dtype=np.uint8)
+        assert data.shape == (self.height, self.width, 3), 'JPEG is {}, but the rectangle is {}x{}'.format(data.shape, self.width, self.height)
+        self.data = data
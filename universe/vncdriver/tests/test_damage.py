@@ -0,0 +1,27 @@
+from universe.vncdriver.screen import damage
+
+def test_merge_rectangles():
+    assert damage.merge_rectangles([]) == []
+    # Disjoint rectangles stay apart
+    assert sorted(damage.merge_rectangles([(0, 0, 2, 2), (10, 10, 2, 2)])) == [(0, 0, 2, 2), (10, 10, 2, 2)]
+    # Overlapping and touching rectangles merge into their bounding box
+    assert damage.merge_rectangles([(0, 0, 2, 2), (1, 1, 2, 2)]) == [(0, 0, 3, 3)]
+    assert damage.merge_rectangles([(0, 0, 2, 2), (2, 0, 2, 2)]) == [(0, 0, 4, 2)]
+
+def test_merge_rectangles_cascades():
+    # The last rectangle bridges the first two, whose merged box then
+    # touches the third
+    rectangles = [(0, 0, 2, 2), (4, 0, 2, 2), (0, 5, 6, 1), (1, 0, 4, 2)]
+    assert sorted(damage.merge_rectangles(rectangles)) == [(0, 0, 6, 2), (0, 5, 6, 1)]
+    rectangles.append((2, 2, 1, 3))
+    assert damage.merge_rectangles(rectangles) == [(0, 0, 6, 6)]
+
+def test_merge_rectangles_clips():
+    assert damage.merge_rectangles([(8, 8, 4, 4), (20, 0, 2, 2), (0, 0, 0, 5)], width=10, height=10) == [(8, 8, 2, 2)]
+
+def test_merge_rectangles_clips_near_edges():
+    assert damage.merge_rectangles([(-5, -3, 10, 10)], 100, 100) == [(0, 0, 5, 7)]
+    assert damage.merge_rectangles([(-5, 0, 5, 5), (0, -5, 5, 5)], 100, 100) == []
+    # Same again through the NumPy path
+    rectangles = [(-5, -3, 10, 10)] + [(i*10, 50, 2, 2) for i in range(damage.SMALL)]
+    assert sorted(damage.merge_rectangles(rectangles, 100, 100))[0] == (0, 0, 5, 7)
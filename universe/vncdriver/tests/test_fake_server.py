@@ -0,0 +1,79 @@
+import numpy as np
+from twisted.internet import task
+
+from universe import utils
+from universe.vncdriver import constants, fake_server, vnc_client
+
+class Pipe(object):
+    """Holds one side's writes until pump() delivers them, so neither
+    protocol is re-entered while it's parsing."""
+    def __init__(self):
+        self.pending = []
+        self.closed = False
+
+    def write(self, data):
+        self.pending.append(data)
+
+    def loseConnection(self):
+        self.closed = True
+
+def connect(client_encodings, **kwargs):
+    clock = task.Clock()
+    factory = fake_server.server_factory(width=100, height=70, fps=10, clock=clock, **kwargs)
+    server = factory.buildProtocol(None)
+    server.transport = Pipe()
+
+    error_buffer = utils.ErrorBuffer()
+    client = vnc_client.VNCClient()
+    client.factory = vnc_client.client_factory(None, error_buffer, encodings=vnc_client.parse_encodings(client_encodings))
+    client.factory.label = 'test'
+    client.transport = Pipe()
+
+    server.connectionMade()
+    pump(server, client)
+    error_buffer.check()
+    return clock, server, client, error_buffer
+
+def pump(server, client):
+    while server.transport.pending or client.transport.pending:
+        data, server.transport.pending = b''.join(server.transport.pending), []
+        client.dataReceived(data)
+        data, client.transport.pending = b''.join(client.transport.pending), []
+        server.dataReceived(data)
+
+def test_client_tracks_server_screen():
+    for encodings in ['raw', 'zlib', 'zrle', 'copy_rectangle,zrle,zlib,raw,pseudo_cursor']:
+        clock, server, client, error_buffer = connect(encodings)
+        for step in range(20):
+            clock.advance(0.1)
+            # Let the client fall behind now and then
+            if step % 3 != 0:
+                pump(server, client)
+            error_buffer.check()
+        pump(server, client)
+        error_buffer.check()
+
+        observation, info = client.numpy_screen.flip()
+        assert np.array_equal(observation, server._scene.frame), encodings
+        assert server.updates_sent > 1
+        if 'copy_rectangle' in encodings:
+            assert set(server.rectangles_sent) == set([constants.COPY_RECTANGLE_ENCODING, constants.ZRLE_ENCODING, constants.ZLIB_ENCODING,
+                                                       constants.RAW_ENCODING, constants.PSEUDO_CURSOR_ENCODING])
+        server.connectionLost(None)
+
+def test_sends_only_configured_encodings():
+    clock, server, client, error_buffer = connect('copy_rectangle,zrle,zlib,raw', encodings='zlib', content='scroll')
+    for _ in range(3):
+        clock.advance(0.1)
+        pump(server, client)
+    error_buffer.check()
+    assert server.client_encodings == vnc_client.parse_encodings('copy_rectangle,zrle,zlib,raw')
+    assert set(server.rectangles_sent) == set([constants.ZLIB_ENCODING])
+    observation, info = client.numpy_screen.flip()
+    assert np.array_equal(observation, server._scene.frame)
+    server.connectionLost(None)
+
+def test_checks_password():
+    clock, server, client, error_buffer = connect('raw', password='not the default')
+    assert server.transport.closed
+    assert not client.initialized
@@ -0,0 +1,95 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from universe.vncdriver import constants, fbs_decoder
+
+def write_fbs(path, records, start=1000.0):
+    with open(path, 'wb') as f:
+        f.write(b'FBS 001.002\n')
+        f.write(json.dumps({'start': start}).encode('utf-8') + b'\n')
+        for data, delta in records:
+            f.write(struct.pack('!I', len(data)) + data + struct.pack('!I', delta))
+        f.write(struct.pack('!I', 0) + json.dumps({'stop': start + 60}).encode('utf-8') + b'\n')
+
+def server_init(width, height, shifts=(0, 8, 16)):
+    """An RFB 3.3 server's side of the handshake, with no authentication."""
+    pixel_format = struct.pack('!BBBBHHHBBBxxx', 32, 24, 0, 1, 255, 255, 255, shifts[0], shifts[1], shifts[2])
+    name = b'recording'
+    return b'RFB 003.003\n' + struct.pack('!I', 1) + struct.pack('!HH16sI', width, height, pixel_format, len(name)) + name
+
+def fill(x, y, width, height, pixel):
+    """A framebuffer update of one RAW rectangle of a single color."""
+    return struct.pack('!BxH', 0, 1) + struct.pack('!HHHHi', x, y, width, height, constants.RAW_ENCODING) + \
+        bytes(bytearray(pixel)) * (width * height)
+
+def recording(logfile_dir):
+    os.makedirs(logfile_dir)
+    write_fbs(os.path.join(logfile_dir, 'server.fbs'), [
+        (server_init(8, 6), 0),
+        (fill(0, 0, 8, 6, [255, 0, 0, 0]), 100),
+        (fill(2, 2, 2, 2, [0, 0, 255, 0]), 350),
+        (fill(0, 0, 8, 6, [0, 255, 0, 0]), 1050),
+    ])
+
+def test_frames(tmpdir):
+    logfile_dir = str(tmpdir.join('recording'))
+    recording(logfile_dir)
+
+    decoder = fbs_decoder.FBSDecoder(os.path.join(logfile_dir, 'server.fbs'))
+    frames = [(timestamp, pixels.copy()) for timestamp, pixels in decoder.frames(10)]
+    decoder.close()
+
+    # From the first update to the last record, 100ms apart
+    assert len(frames) == 10
+    assert np.allclose([timestamp for timestamp, _ in frames], 1000.1 + 0.1 * np.arange(10))
+    # The blue square arrives at 350ms, and the green screen after the
+    # last frame
+    for timestamp, pixels in frames[:3]:
+        assert (pixels == [255, 0, 0]).all()
+    for timestamp, pixels in frames[3:]:
+        assert (pixels[2:4, 2:4] == [0, 0, 255]).all()
+        assert (pixels[0] == [255, 0, 0]).all()
+
+def test_recorded_pixel_format(tmpdir):
+    logfile_dir = str(tmpdir.join('recording'))
+    recording(logfile_dir)
+    # The recording client asked for blue in the low byte
+    pixel_format = struct.pack('!BBBBHHHBBBxxx', 32, 24, 0, 1, 255, 255, 255, 16, 8, 0)
+    write_fbs(os.path.join(logfile_dir, 'client.fbs'), [
+        (b'RFB 003.003\n', 0),
+        (b'\x01', 0),
+        (struct.pack('!Bxxx16s', 0, pixel_format), 50),
+        (struct.pack('!BxHi', 2, 1, constants.RAW_ENCODING), 50),
+        (struct.pack('!BBHHHH', 3, 1, 0, 0, 8, 6), 60),
+    ])
+
+    assert fbs_decoder.decode_recording(logfile_dir, 10) == 10
+    timestamps, frames, index = fbs_decoder.load_frames(logfile_dir)
+    # Only the frames where the screen changed are stored
+    assert frames.shape == (2, 6, 8, 3)
+    assert list(index) == [0, 0, 0, 1, 1, 1, 1, 1, 1, 1]
+    assert (frames[index[0]] == [0, 0, 255]).all()
+    assert (frames[index[-1]][2:4, 2:4] == [255, 0, 0]).all()
+    assert (frames[index[-1]][0] == [0, 0, 255]).all()
+    assert np.allclose(timestamps, 1000.1 + 0.1 * np.arange(10))
+
+def test_decode_recordings(tmpdir):
+    logfile_dirs = [str(tmpdir.join('recording-{}'.format(i))) for i in range(3)]
+    for logfile_dir in logfile_dirs:
+        recording(logfile_dir)
+    broken = str(tmpdir.join('broken'))
+    os.makedirs(broken)
+
+    output_root = str(tmpdir.join('frames'))
+    results = {logfile_dir: (frames, error) for logfile_dir, frames, error in
+               fbs_decoder.decode_recordings(logfile_dirs + [broken], 5, output_root, processes=2)}
+    for logfile_dir in logfile_dirs:
+        assert results[logfile_dir] == (5, None)
+        timestamps, frames, index = fbs_decoder.load_frames(os.path.join(output_root, os.path.basename(logfile_dir)))
+        assert len(timestamps) == len(index) == 5
+        assert frames.shape == (2, 6, 8, 3)
+    assert results[broken][0] == 0
+    assert results[broken][1] is not None
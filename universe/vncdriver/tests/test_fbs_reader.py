@@ -0,0 +1,77 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from universe.vncdriver import fbs_reader
+
+def write_fbs(path, records, start=1000.0, trailer=True):
+    """Write (data, delta_ms) records the way FBSWriter does."""
+    with open(path, 'wb') as f:
+        f.write(b'FBS 001.002\n')
+        f.write(json.dumps({'start': start}).encode('utf-8') + b'\n')
+        for data, delta in records:
+            f.write(struct.pack('!I', len(data)) + data + struct.pack('!I', delta))
+        if trailer:
+            f.write(struct.pack('!I', 0) + json.dumps({'stop': start + 60}).encode('utf-8') + b'\n')
+
+def records(n):
+    return [('record {}'.format(i).encode('utf-8') * (i + 1), 100 * i) for i in range(n)]
+
+def test_iterate_and_index(tmpdir):
+    path = str(tmpdir.join('server.fbs'))
+    expected = records(50)
+    write_fbs(path, expected)
+
+    reader = fbs_reader.FBSReader(path)
+    assert [(data.tobytes(), timestamp) for data, timestamp in reader] == [(data, 1000.0 + delta / 1000.) for data, delta in expected]
+    assert reader.stop == 1060.0
+    reader.close()
+    assert os.path.exists(path + '.index')
+
+    # The second reader picks up the saved index rather than scanning
+    reader = fbs_reader.FBSReader(path)
+    assert reader._load_index() is not None
+    assert len(reader) == 50
+    assert reader[-1][0].tobytes() == expected[-1][0]
+    assert [data.tobytes() for data, _ in reader[10:13]] == [data for data, _ in expected[10:13]]
+    reader.close()
+
+def test_seek(tmpdir):
+    path = str(tmpdir.join('server.fbs'))
+    write_fbs(path, records(50))
+    reader = fbs_reader.FBSReader(path)
+
+    # Records are 100ms apart
+    assert reader.seek(1000.0 + 2.05) == 21
+    data, timestamp = next(reader)
+    assert timestamp == 1002.1
+    assert reader.tell() == 22
+    assert reader.seek(1002.1) == 21
+    assert reader.seek(0) == 0
+    assert reader.seek(2000.0) == 50
+    assert list(reader) == []
+    reader.close()
+
+def test_truncated_and_growing(tmpdir):
+    path = str(tmpdir.join('server.fbs'))
+    expected = records(20)
+    write_fbs(path, expected, trailer=False)
+    with open(path, 'rb') as f:
+        contents = f.read()
+
+    # Killed partway through the last record
+    with open(path, 'wb') as f:
+        f.write(contents[:-5])
+    reader = fbs_reader.FBSReader(path)
+    assert len(reader) == 19
+    assert reader.stop is None
+    reader.close()
+
+    # Then the rest arrives, along with more records; the saved index
+    # covers the start
+    write_fbs(path, expected + records(25)[20:])
+    reader = fbs_reader.FBSReader(path)
+    assert [data.tobytes() for data, _ in reader] == [data for data, _ in records(25)]
+    reader.close()
@@ -0,0 +1,55 @@
+import os
+
+from universe.vncdriver import fbs_reader, fbs_writer
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join('server.fbs'))
+    chunks = ['chunk {}'.format(i).encode('utf-8') * (i + 1) for i in range(200)]
+
+    # A small buffer, so the records span several batches
+    writer = fbs_writer.FBSWriter(path, buffer_size=256, max_buffered=1024)
+    for chunk in chunks:
+        writer.write(chunk)
+    writer.write(b'')
+    writer.close()
+
+    reader = fbs_reader.FBSReader(path)
+    # The file's own index block is used, so nothing is scanned or saved
+    assert reader._load_embedded_index(0) is not None
+    assert not os.path.exists(path + '.index')
+    records = list(reader)
+    assert [data.tobytes() for data, _ in records] == chunks
+    assert [timestamp for _, timestamp in records] == sorted(timestamp for _, timestamp in records)
+    assert reader.start == writer.start
+    assert reader.stop == writer.stop
+    reader.close()
+
+def test_readable_before_close(tmpdir):
+    path = str(tmpdir.join('server.fbs'))
+    writer = fbs_writer.FBSWriter(path)
+    for i in range(10):
+        writer.write(b'before')
+    writer.flush()
+
+    # What a process killed now would leave behind: a complete file,
+    # trailer and all
+    reader = fbs_reader.FBSReader(path, write_index=False)
+    assert [data.tobytes() for data, _ in reader] == [b'before'] * 10
+    assert reader.stop is not None
+    reader.close()
+
+    # The next batch goes over the checkpointed trailer
+    for i in range(5):
+        writer.write(b'after')
+    writer.flush()
+    reader = fbs_reader.FBSReader(path, write_index=False)
+    assert [data.tobytes() for data, _ in reader] == [b'before'] * 10 + [b'after'] * 5
+    reader.close()
+    writer.close()
+
+def test_empty(tmpdir):
+    path = str(tmpdir.join('server.fbs'))
+    writer = fbs_writer.FBSWriter(path)
+    writer.close()
+    with open(path, 'rb') as f:
+        assert f.read() == b'FBS 001.002\n'
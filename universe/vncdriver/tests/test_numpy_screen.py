@@ -0,0 +1,156 @@
+import numpy as np
+import threading
+import time
+
+from universe import pyprofile
+from universe.spaces import vnc_event
+from universe.vncdriver import server_messages
+from universe.vncdriver.screen import NumpyScreen, wait_for_frames
+
+def raw_update(x, y, pixels):
+    h, w, _ = pixels.shape
+    rectangle = server_messages.Rectangle(x, y, w, h, server_messages.RAWEncoding(pixels))
+    return server_messages.FramebufferUpdate([rectangle])
+
+def test_flip_sees_every_update():
+    rng = np.random.RandomState(0)
+    width, height = 20, 15
+    screen = NumpyScreen(width, height)
+    expected = np.zeros((height, width, 3), dtype=np.uint8)
+
+    for i in range(200):
+        w, h = rng.randint(1, 6, size=2)
+        x, y = rng.randint(0, width - w), rng.randint(0, height - h)
+        pixels = rng.randint(0, 256, size=(h, w, 3)).astype(np.uint8)
+        screen.apply(raw_update(x, y, pixels))
+        expected[y:y+h, x:x+w] = pixels
+
+        # Flip at irregular intervals, so that frames go stale by
+        # varying amounts
+        if rng.randint(0, 3) == 0:
+            observation, info = screen.flip()
+            assert np.array_equal(observation, expected)
+            assert info['vnc_session.frame_version'] == i + 1
+
+    observation, info = screen.flip()
+    assert np.array_equal(observation, expected)
+    # Nothing new since
+    observation, info = screen.flip()
+    assert np.array_equal(observation, expected)
+    assert info['vnc_session.framebuffer_updates'] == []
+    assert info['vnc_session.damage'] == []
+
+def test_painted_cursor_moves_without_smearing():
+    width, height = 10, 10
+    screen = NumpyScreen(width, height)
+    screen.set_paint_cursor(True)
+    background = np.arange(width * height * 3, dtype=np.uint8).reshape((height, width, 3))
+    screen.apply(raw_update(0, 0, background))
+
+    image = np.full((2, 2, 3), 255, dtype=np.uint8)
+    mask = np.ones((2, 2), dtype=np.uint8)
+    cursor = server_messages.Rectangle(0, 0, 2, 2, server_messages.PseudoCursorEncoding(image, mask))
+    screen.apply_action(vnc_event.PointerEvent(3, 4, 0))
+    screen.apply(server_messages.FramebufferUpdate([cursor]))
+
+    for x, y in [(3, 4), (6, 1), (6, 2), (0, 0)]:
+        screen.apply_action(vnc_event.PointerEvent(x, y, 0))
+        observation, info = screen.flip()
+        expected = background.copy()
+        expected[y:y+2, x:x+2] = 255
+        assert np.array_equal(observation, expected)
+
+def test_cursor_mask_and_edges():
+    width, height = 12, 9
+    screen = NumpyScreen(width, height)
+    screen.set_paint_cursor(True)
+    background = np.arange(width * height * 3, dtype=np.uint8).reshape((height, width, 3))
+    screen.apply(raw_update(0, 0, background))
+
+    rng = np.random.RandomState(0)
+    image = rng.randint(0, 256, size=(4, 5, 3)).astype(np.uint8)
+    mask = (np.indices((4, 5)).sum(axis=0) % 2).astype(np.uint8)
+    cursor = server_messages.Rectangle(0, 0, 5, 4, server_messages.PseudoCursorEncoding(image, mask))
+    screen.apply(server_messages.FramebufferUpdate([cursor]))
+
+    # Inside the screen, then hanging off the right and bottom edges
+    for x, y in [(2, 3), (9, 7), (0, 0)]:
+        screen.apply_action(vnc_event.PointerEvent(x, y, 0))
+        observation, info = screen.flip()
+
+        expected = background.copy()
+        region = expected[y:y+4, x:x+5]
+        visible = mask[:region.shape[0], :region.shape[1]].astype(bool)
+        region[visible] = image[:region.shape[0], :region.shape[1]][visible]
+        assert np.array_equal(observation, expected), 'Mismatch with the cursor at {}'.format((x, y))
+
+def test_lock_timers():
+    screen = NumpyScreen(4, 4)
+    screen.apply(raw_update(0, 0, np.zeros((4, 4, 3), dtype=np.uint8)))
+    screen.flip()
+    timers = pyprofile.export()['timers']
+    for name in ['flip', 'publish']:
+        for kind in ['wait', 'hold']:
+            assert 'vncdriver.numpy_screen.lock.{}.{}'.format(name, kind) in timers
+
+def test_flip_while_applying():
+    # Each update fills the screen with one value, so a torn frame would
+    # show up as a mix of values
+    screen = NumpyScreen(64, 48)
+    updates = 2000
+
+    def apply():
+        for i in range(1, updates+1):
+            screen.apply(raw_update(0, 0, np.full((48, 64, 3), i % 256, dtype=np.uint8)))
+
+    thread = threading.Thread(target=apply)
+    thread.start()
+    while thread.is_alive():
+        observation, info = screen.flip()
+        assert (observation == observation[0, 0]).all()
+        assert observation[0, 0, 0] == info['vnc_session.frame_version'] % 256
+    thread.join()
+
+    observation, info = screen.flip()
+    assert info['vnc_session.frame_version'] == updates
+
+def test_update_from_wire_pixels():
+    rng = np.random.RandomState(0)
+    wire = rng.randint(0, 256, size=(5, 7, 4)).astype(np.uint8)
+    # As RAWEncoding hands them over: a view with the padding dropped
+    pixels = wire[:, :, :3]
+
+    screen = NumpyScreen(10, 10)
+    screen.apply(raw_update(2, 3, pixels))
+    observation, info = screen.flip()
+    assert np.array_equal(observation[3:8, 2:9], wire[:, :, :3])
+
+    screen = NumpyScreen(10, 10)
+    screen.color_cycle = np.array([2, 1, 0])
+    screen.apply(raw_update(2, 3, pixels))
+    observation, info = screen.flip()
+    assert np.array_equal(observation[3:8, 2:9], wire[:, :, 2::-1])
+
+def test_wait_for_frames():
+    frame_ready = threading.Condition()
+    screens = [NumpyScreen(4, 4, frame_ready=frame_ready) for _ in range(2)]
+    pixels = np.ones((2, 2, 3), dtype=np.uint8)
+
+    assert not wait_for_frames(screens, frame_ready, timeout=0.01)
+    thread = threading.Timer(0.05, screens[1].apply, [raw_update(0, 0, pixels)])
+    thread.start()
+    start = time.time()
+    assert wait_for_frames(screens, frame_ready, timeout=10)
+    assert time.time() - start < 5
+    thread.join()
+
+    # Only one has a frame
+    assert not wait_for_frames(screens, frame_ready, timeout=0.01, policy='all')
+    screens[0].apply(raw_update(0, 0, pixels))
+    assert wait_for_frames(screens, frame_ready, timeout=0, policy='all')
+
+    # Until they flip again
+    screens[1].flip()
+    assert screens[0].has_new_frame()
+    assert not screens[1].has_new_frame()
+    assert not screens[1].wait_for_frame(timeout=0.01)
@@ -0,0 +1,52 @@
+import numpy as np
+
+from universe.vncdriver import server_messages
+from universe.vncdriver.screen import NumpyScreen, ObservationBuffer
+
+def raw_update(x, y, pixels):
+    h, w, _ = pixels.shape
+    rectangle = server_messages.Rectangle(x, y, w, h, server_messages.RAWEncoding(pixels))
+    return server_messages.FramebufferUpdate([rectangle])
+
+def flip(screens):
+    observation_n = []
+    damage_n = []
+    for screen in screens:
+        observation, info = screen.flip()
+        observation_n.append(observation)
+        damage_n.append(info['vnc_session.damage'])
+    return observation_n, damage_n
+
+def test_matches_stacked_observations():
+    rng = np.random.RandomState(0)
+    width, height = 20, 15
+    screens = [NumpyScreen(width, height) for _ in range(3)]
+    for count in [1, 2]:
+        buffer = ObservationBuffer(len(screens), count=count)
+        previous = None
+        for step in range(50):
+            for screen in screens:
+                if rng.randint(0, 2):
+                    w, h = rng.randint(1, 6, size=2)
+                    x, y = rng.randint(0, width - w), rng.randint(0, height - h)
+                    screen.apply(raw_update(x, y, rng.randint(0, 256, size=(h, w, 3)).astype(np.uint8)))
+            observation_n, damage_n = flip(screens)
+            expected = np.stack(observation_n)
+
+            array = buffer.update(observation_n, damage_n)
+            assert array.shape == (3, height, width, 3)
+            assert np.array_equal(array, expected)
+            if count == 2 and previous is not None:
+                # Last step's array wasn't touched
+                assert array is not previous[0]
+                assert np.array_equal(previous[0], previous[1])
+            previous = array, expected
+
+def test_rejects_mismatched_screens():
+    buffer = ObservationBuffer(2)
+    try:
+        buffer.update([np.zeros((4, 4, 3), dtype=np.uint8), np.zeros((5, 4, 3), dtype=np.uint8)], [[], []])
+    except Exception:
+        pass
+    else:
+        assert False, 'Expected differently sized screens to be rejected'
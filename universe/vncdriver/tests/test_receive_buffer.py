@@ -0,0 +1,65 @@
+import numpy as np
+import six
+
+from universe import pyprofile
+from universe.vncdriver import framing, receive_buffer
+
+def test_peek_and_consume():
+    buf = receive_buffer.ReceiveBuffer()
+    buf.append(b'abc')
+    buf.append(b'defg')
+    assert len(buf) == 7
+
+    assert buf.peek(4).tobytes() == b'abcd'
+    buf.consume(4)
+    assert len(buf) == 3
+    assert buf.peek(3).tobytes() == b'efg'
+
+    buf.consume(3)
+    buf.append(b'hi')
+    assert buf.peek(2).tobytes() == b'hi'
+    assert buf.read_all() == b'hi'
+    assert len(buf) == 0
+
+def test_held_views_survive_append():
+    buf = receive_buffer.ReceiveBuffer()
+    buf.append(b'\x01\x02\x03\x04')
+    view = buf.peek(4)
+    array = np.asarray(view)
+    buf.consume(4)
+
+    # Forces a compaction while a view is outstanding
+    buf.append(b'\x05' * 100)
+    assert list(array) == [1, 2, 3, 4]
+    assert buf.peek(100).tobytes() == b'\x05' * 100
+
+class Echo(framing.FramedProtocol):
+    profile_prefix = 'test_framing'
+
+    def __init__(self):
+        self.init_framing()
+        self.messages = []
+        self.expect(self.recv_length, 1)
+
+    def handle(self, type, block):
+        self.expected(block, *self.expected_args, **self.expected_kwargs)
+        return True
+
+    def recv_length(self, block):
+        self.expect(self.recv_message, six.indexbytes(block, 0))
+
+    def recv_message(self, block):
+        self.messages.append(block.tobytes())
+        self.expect(self.recv_length, 1)
+
+def test_framed_protocol():
+    echo = Echo()
+    for chunk in [b'\x03ab', b'c\x01', b'd\x02ef']:
+        echo.buf.append(chunk)
+        echo.parse_buffer()
+    assert echo.messages == [b'abc', b'd', b'ef']
+    assert len(echo.buf) == 0
+
+    export = pyprofile.export(log=False)
+    assert export['timers']['test_framing.parse.recv_message']['calls'] == 3
+    assert export['counters']['test_framing.parse.recv_message.bytes']['total'] == 6
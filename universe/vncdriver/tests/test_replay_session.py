@@ -0,0 +1,88 @@
+import json
+import os
+
+import numpy as np
+
+from test_fbs_decoder import recording
+from universe.envs import vnc_env
+from universe.remotes import replay
+from universe.vncdriver import replay_session
+
+def write_rewards(path, messages):
+    with open(path, 'w') as f:
+        f.write(json.dumps({'version': 1}) + '\n')
+        for timestamp, method, body, episode_id in messages:
+            f.write(json.dumps({
+                'timestamp': timestamp,
+                'message': {'method': method, 'body': body, 'headers': {'sent_at': timestamp, 'episode_id': episode_id}},
+                'from_rewarder': True,
+            }) + '\n')
+        # What the recording client sent is ignored
+        f.write(json.dumps({
+            'timestamp': 1000.5,
+            'message': {'method': 'v0.env.reset', 'body': {}, 'headers': {'sent_at': 1000.5}},
+            'from_rewarder': False,
+        }) + '\n')
+
+def describe(env_state):
+    return {'env_id': 'flashgames.DuskDrive-v0', 'env_state': env_state, 'fps': 60}
+
+def test_replay_vnc_session(tmpdir):
+    logfile_dir = str(tmpdir.join('recording'))
+    recording(logfile_dir)
+
+    session = replay_session.ReplayVNCSession()
+    session.connect(name='0', address=replay.format_address(logfile_dir, 'max', 10), encoding='tight')
+    # With speed=max, the next update is always due
+    assert session.wait_for_frame(timeout=0)
+    observations = []
+    for _ in range(12):
+        obs_d, info_d, err_d = session.step({'0': [('KeyEvent', 0x20, True)]})
+        assert err_d == {}
+        observations.append(obs_d['0'] if obs_d['0'] is None else obs_d['0'].copy())
+    # ...until there are none left
+    assert not session.wait_for_frame()
+    session.close()
+
+    # One frame (100ms of the recording) per step, starting before the
+    # first update arrives
+    assert observations[0] is None
+    for observation in observations[1:4]:
+        assert (observation == [255, 0, 0]).all()
+    assert (observations[4][2:4, 2:4] == [0, 0, 255]).all()
+    for observation in observations[11:]:
+        assert (observation == [0, 255, 0]).all()
+    assert info_d['0']['replay.finished']
+    assert np.isclose(info_d['0']['replay.timestamp'], 1001.1)
+
+def test_replay_env(tmpdir):
+    logfile_dir = str(tmpdir.join('recording'))
+    recording(logfile_dir)
+    write_rewards(os.path.join(logfile_dir, 'rewards.demo'), [
+        # From before the recording starts, so only the state counts
+        (999.0, 'v0.env.describe', describe('running'), '1'),
+        (999.5, 'v0.env.reward', {'reward': 5., 'done': False, 'info': {}}, '1'),
+        (1000.25, 'v0.env.reward', {'reward': 1., 'done': False, 'info': {}}, '1'),
+        (1000.35, 'v0.env.reward', {'reward': 2., 'done': True, 'info': {}}, '1'),
+        (1000.35, 'v0.env.describe', describe('running'), '2'),
+        (1000.55, 'v0.env.reward', {'reward': 4., 'done': False, 'info': {}}, '2'),
+    ])
+
+    env = vnc_env.VNCEnv()
+    # As gym.make would leave it for an unregistered env
+    env.spec = None
+    env.configure(remotes='replay://{}?speed=max&fps=10'.format(logfile_dir))
+    try:
+        assert isinstance(env.vnc_session, replay_session.ReplayVNCSession)
+        env.reset()
+        steps = [env.step([[]]) for _ in range(8)]
+    finally:
+        env.close()
+
+    rewards = [reward_n[0] for _, reward_n, _, _ in steps]
+    dones = [done_n[0] for _, _, done_n, _ in steps]
+    assert rewards == [0, 0, 0, 1., 2., 0, 4., 0]
+    assert dones == [False, False, False, False, True, False, False, False]
+    observation_n = steps[1][0]
+    assert (observation_n[0]['vision'] == [255, 0, 0]).all()
+    assert steps[5][3]['n'][0]['env_status.episode_id'] == '2'
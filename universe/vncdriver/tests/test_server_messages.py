@@ -0,0 +1,126 @@
+import numpy as np
+import struct
+
+from universe.vncdriver import server_messages
+
+def pack_palette_tile(idx, palette_size):
+    """Encode a (height, width) array of palette indexes as ZRLE packed
+    pixel rows."""
+    if palette_size > 4:
+        bits = 4
+    elif palette_size > 2:
+        bits = 2
+    else:
+        bits = 1
+
+    packed = []
+    for row in idx:
+        b = 0
+        nbits = 0
+        for value in row:
+            b = (b << bits) | int(value)
+            nbits += bits
+            if nbits == 8:
+                packed.append(b)
+                b = 0
+                nbits = 0
+        if nbits > 0:
+            packed.append(b << (8 - nbits))
+    return struct.pack('!{}B'.format(len(packed)), *packed)
+
+def pack_run_length(count):
+    length = []
+    count -= 1
+    while count >= 255:
+        length.append(255)
+        count -= 255
+    length.append(count)
+    return struct.pack('!{}B'.format(len(length)), *length)
+
+def read_tile(payload, width, height):
+    tile = np.zeros((height, width, 3), dtype=np.uint8)
+    offset = server_messages.ZRLEEncoding._read_tile(tile, bytearray(payload), 0, width, height, 3)
+    # The whole tile should have been consumed
+    assert offset == len(payload)
+    return tile
+
+def test_packed_palette_tiles():
+    rng = np.random.RandomState(0)
+    for palette_size in [2, 3, 4, 5, 16]:
+        for width, height in [(64, 64), (1, 1), (7, 3), (13, 64), (64, 5)]:
+            palette = rng.randint(0, 256, size=(palette_size, 3)).astype(np.uint8)
+            idx = rng.randint(0, palette_size, size=(height, width))
+
+            payload = struct.pack('!B', palette_size) + palette.tobytes() + pack_palette_tile(idx, palette_size)
+            tile = read_tile(payload, width, height)
+            assert np.array_equal(tile, palette[idx]), 'Mismatch for palette_size={} size={}x{}'.format(palette_size, width, height)
+
+def test_packed_palette_short_data():
+    palette = np.array([[0, 0, 0], [255, 255, 255]], dtype=np.uint8)
+    payload = struct.pack('!B', 2) + palette.tobytes() + b'\x00' * 3
+    try:
+        read_tile(payload, 8, 4)
+    except AssertionError:
+        pass
+    else:
+        assert False, 'Expected short packed pixel data to be rejected'
+
+def test_raw_and_solid_tiles():
+    rng = np.random.RandomState(0)
+    expected = rng.randint(0, 256, size=(5, 7, 3)).astype(np.uint8)
+    tile = read_tile(struct.pack('!B', 0) + expected.tobytes(), 7, 5)
+    assert np.array_equal(tile, expected)
+
+    tile = read_tile(struct.pack('!BBBB', 1, 10, 20, 30), 7, 5)
+    assert np.array_equal(tile, np.tile([10, 20, 30], (5, 7, 1)))
+
+def test_plain_rle_tile():
+    rng = np.random.RandomState(0)
+    width, height = 64, 64
+    # Includes runs spanning rows and lengths around the 255 boundary
+    counts = [1, 255, 256, 257, 510, 511, 1, 2, 300]
+    counts.append(width * height - sum(counts))
+    values = rng.randint(0, 256, size=(len(counts), 3)).astype(np.uint8)
+
+    payload = struct.pack('!B', 128)
+    for value, count in zip(values, counts):
+        payload += value.tobytes() + pack_run_length(count)
+
+    tile = read_tile(payload, width, height)
+    assert tile.dtype == np.uint8
+    assert np.array_equal(tile, np.repeat(values, counts, axis=0).reshape((height, width, 3)))
+
+def test_palette_rle_tile():
+    rng = np.random.RandomState(0)
+    width, height = 13, 9
+    palette = rng.randint(0, 256, size=(5, 3)).astype(np.uint8)
+    counts = [1, 1, 20, 1, 60, 2, 1]
+    counts.append(width * height - sum(counts))
+    idx = rng.randint(0, 5, size=len(counts))
+
+    payload = struct.pack('!B', 128 + 5) + palette.tobytes()
+    for i, count in zip(idx, counts):
+        if count == 1:
+            payload += struct.pack('!B', i)
+        else:
+            payload += struct.pack('!B', i | 128) + pack_run_length(count)
+
+    tile = read_tile(payload, width, height)
+    assert np.array_equal(tile, np.repeat(palette[idx], counts, axis=0).reshape((height, width, 3)))
+
+def test_rle_overrun():
+    # A single run longer than the tile
+    payload = struct.pack('!BBBB', 128, 1, 2, 3) + pack_run_length(10)
+    try:
+        read_tile(payload, 3, 3)
+    except AssertionError:
+        pass
+    else:
+        assert False, 'Expected an overlong run to be rejected'
+
+def test_read_multiple_tiles():
+    # A 70x2 rectangle is split into a 64x2 and a 6x2 tile
+    payload = struct.pack('!BBBB', 1, 10, 20, 30) + struct.pack('!BBBB', 1, 40, 50, 60)
+    data = server_messages.ZRLEEncoding._read(0, 0, 70, 2, bytearray(payload), 3)
+    assert np.array_equal(data[:, :64], np.tile([10, 20, 30], (2, 64, 1)))
+    assert np.array_equal(data[:, 64:], np.tile([40, 50, 60], (2, 6, 1)))
@@ -0,0 +1,355 @@
+import numpy as np
+from six import BytesIO
+import struct
+import time
+import zlib
+
+from twisted.python import threadpool
+
+from universe import utils
+from universe.vncdriver import constants, server_messages, vnc_client
+
+def rgbx(pixels):
+    h, w, _ = pixels.shape
+    data = np.zeros((h, w, 4), dtype=np.uint8)
+    data[:, :, :3] = pixels
+    return data.tobytes()
+
+def raw_rectangle(x, y, pixels):
+    h, w, _ = pixels.shape
+    return struct.pack('!HHHHi', x, y, w, h, constants.RAW_ENCODING) + rgbx(pixels)
+
+def copy_rectangle(x, y, width, height, src_x, src_y):
+    return struct.pack('!HHHHiHH', x, y, width, height, constants.COPY_RECTANGLE_ENCODING, src_x, src_y)
+
+def hextile_rectangle(x, y, pixels):
+    """Encode alternate tiles as raw and as a background plus one
+    coloured subrect per pixel that differs from the tile's corner."""
+    h, w, _ = pixels.shape
+    data = struct.pack('!HHHHi', x, y, w, h, constants.HEXTILE_ENCODING)
+    i = 0
+    for tile_y in range(0, h, 16):
+        for tile_x in range(0, w, 16):
+            tile = pixels[tile_y:tile_y+16, tile_x:tile_x+16]
+            if i % 2 == 0:
+                data += struct.pack('!B', server_messages.HextileEncoding.RAW) + rgbx(tile)
+            else:
+                background = tile[0, 0]
+                subrects = [(sx, sy) for sy in range(tile.shape[0]) for sx in range(tile.shape[1])
+                            if not np.array_equal(tile[sy, sx], background)][:255]
+                subencoding = server_messages.HextileEncoding.BACKGROUND_SPECIFIED
+                if subrects:
+                    subencoding |= server_messages.HextileEncoding.ANY_SUBRECTS | server_messages.HextileEncoding.SUBRECTS_COLOURED
+                data += struct.pack('!B', subencoding) + rgbx(background.reshape((1, 1, 3)))
+                if subrects:
+                    data += struct.pack('!B', len(subrects))
+                    for sx, sy in subrects:
+                        data += rgbx(tile[sy:sy+1, sx:sx+1]) + struct.pack('!BB', (sx << 4) | sy, 0)
+            i += 1
+    return data
+
+def zrle_rectangle(x, y, pixels, compressor):
+    """Encode as raw ZRLE tiles, continuing the connection's zlib
+    stream."""
+    h, w, _ = pixels.shape
+    tiles = b''
+    for tile_y in range(0, h, 64):
+        for tile_x in range(0, w, 64):
+            tiles += struct.pack('!B', 0) + pixels[tile_y:tile_y+64, tile_x:tile_x+64].tobytes()
+    data = compressor.compress(tiles) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return struct.pack('!HHHHiI', x, y, w, h, constants.ZRLE_ENCODING, len(data)) + data
+
+def compact_length(length):
+    data = [length & 127]
+    if length > 127:
+        data[0] |= 128
+        data.append((length >> 7) & 127)
+        if length > 16383:
+            data[1] |= 128
+            data.append(length >> 14)
+    return struct.pack('!{}B'.format(len(data)), *data)
+
+def tight_rectangle(x, y, width, height, control, payload=b'', data=None, compressor=None):
+    """A Tight rectangle with the given control byte and header
+    payload, followed by basic compression data (zlib'd with
+    `compressor` if given) or JPEG data."""
+    rectangle = struct.pack('!HHHHiB', x, y, width, height, constants.TIGHT_ENCODING, control) + payload
+    if data is not None:
+        if compressor is not None:
+            data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            rectangle += compact_length(len(data))
+        rectangle += data
+    return rectangle
+
+def gradient_filter(pixels):
+    pixels = pixels.astype(np.int16)
+    padded = np.zeros((pixels.shape[0]+1, pixels.shape[1]+1, 3), dtype=np.int16)
+    padded[1:, 1:] = pixels
+    prediction = np.clip(padded[1:, :-1] + padded[:-1, 1:] - padded[:-1, :-1], 0, 255)
+    return ((pixels - prediction) & 255).astype(np.uint8)
+
+def server_stream(width, height, updates):
+    """Build the bytes an RFB 3.3 server with no authentication would
+    send, followed by framebuffer updates made of the given encoded
+    rectangles."""
+    pixel_format = struct.pack('!BBBBHHHBBBxxx', 32, 24, 0, 1, 255, 255, 255, 0, 8, 16)
+    name = b'test'
+    stream = b'RFB 003.003\n' + struct.pack('!I', 1)
+    stream += struct.pack('!HH16sI', width, height, pixel_format, len(name)) + name
+    for rectangles in updates:
+        stream += struct.pack('!BxH', 0, len(rectangles)) + b''.join(rectangles)
+    return stream
+
+def connect(stream, chunk_size):
+    error_buffer = utils.ErrorBuffer()
+    client = vnc_client.VNCClient()
+    client.factory = vnc_client.client_factory(None, error_buffer)
+    client.factory.label = 'test'
+    client.transport = None
+    for i in range(0, len(stream), chunk_size):
+        client.dataReceived(stream[i:i+chunk_size])
+    error_buffer.check()
+    return client
+
+def test_parse_raw_updates():
+    rng = np.random.RandomState(0)
+    width, height = 32, 16
+    expected = np.zeros((height, width, 3), dtype=np.uint8)
+    updates = []
+    for _ in range(5):
+        rectangles = []
+        for _ in range(10):
+            w, h = rng.randint(1, 8, size=2)
+            x, y = rng.randint(0, width - w), rng.randint(0, height - h)
+            pixels = rng.randint(0, 256, size=(h, w, 3)).astype(np.uint8)
+            rectangles.append(raw_rectangle(x, y, pixels))
+            expected[y:y+h, x:x+w] = pixels
+        updates.append(rectangles)
+
+    stream = server_stream(width, height, updates)
+    for chunk_size in [1, 7, 4096]:
+        client = connect(stream, chunk_size)
+        observation, info = client.numpy_screen.flip()
+        assert np.array_equal(observation, expected)
+        assert len(client.buf) == 0
+
+def test_parse_copy_rectangle_and_hextile():
+    rng = np.random.RandomState(0)
+    width, height = 40, 35
+    initial = rng.randint(0, 4, size=(height, width, 3)).astype(np.uint8)
+
+    expected = initial.copy()
+    # Scroll up by 3 rows; source and destination overlap
+    expected[0:30, 0:40] = initial[3:33, 0:40].copy()
+    patch = rng.randint(0, 4, size=(21, 19, 3)).astype(np.uint8)
+    expected[10:31, 5:24] = patch
+
+    stream = server_stream(width, height, [
+        [hextile_rectangle(0, 0, initial)],
+        [copy_rectangle(0, 0, 40, 30, 0, 3), hextile_rectangle(5, 10, patch)],
+    ])
+    for chunk_size in [1, 4096]:
+        client = connect(stream, chunk_size)
+        observation, info = client.numpy_screen.flip()
+        assert np.array_equal(observation, expected)
+
+def test_flip_reports_damage():
+    rng = np.random.RandomState(0)
+    width, height = 40, 30
+    full = rng.randint(0, 256, size=(height, width, 3)).astype(np.uint8)
+    patch = rng.randint(0, 256, size=(4, 4, 3)).astype(np.uint8)
+
+    stream = server_stream(width, height, [[raw_rectangle(0, 0, full)]])
+    client = connect(stream, 4096)
+    observation, info = client.numpy_screen.flip()
+    assert info['vnc_session.damage'] == [(0, 0, width, height)]
+
+    # Nothing happened since the last flip
+    observation, info = client.numpy_screen.flip()
+    assert info['vnc_session.damage'] == []
+
+    # Two touching patches merge, a third stays apart
+    update = struct.pack('!BxH', 0, 3) + raw_rectangle(2, 2, patch) + raw_rectangle(6, 3, patch) + raw_rectangle(30, 20, patch)
+    client.dataReceived(update)
+    observation, info = client.numpy_screen.flip()
+    assert sorted(info['vnc_session.damage']) == [(2, 2, 8, 5), (30, 20, 4, 4)]
+
+class Transport(object):
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+def update_requests(transport):
+    return [struct.unpack('!BBHHHH', data) for data in transport.written
+            if len(data) == 10 and data[:1] == b'\x03']
+
+def test_region_of_interest():
+    width, height = 40, 30
+    pixels = np.ones((4, 4, 3), dtype=np.uint8)
+    stream = server_stream(width, height, [[raw_rectangle(10, 5, pixels)]])
+
+    error_buffer = utils.ErrorBuffer()
+    client = vnc_client.VNCClient()
+    client.factory = vnc_client.client_factory(None, error_buffer, region=(10, 5, 100, 8))
+    client.factory.label = 'test'
+    client.transport = Transport()
+    client.dataReceived(stream)
+    error_buffer.check()
+
+    # Initial request and the one after the update, both clipped to the screen
+    assert update_requests(client.transport) == [(3, 1, 10, 5, 30, 8)] * 2
+
+    client = vnc_client.VNCClient()
+    client.factory = vnc_client.client_factory(None, error_buffer, region=(50, 0, 10, 10))
+    client.factory.label = 'test'
+    client.transport = None
+    client.dataReceived(stream)
+    try:
+        error_buffer.check()
+    except Exception:
+        pass
+    else:
+        assert False, 'Expected a region off the screen to be rejected'
+
+def test_send_events():
+    client = vnc_client.VNCClient()
+    client.transport = Transport()
+    events = [('KeyEvent', 0xff52, True), ('PointerEvent', 10, 300, 1), ('KeyEvent', 0xff52, False)]
+    client.send_events(events)
+    client.send_events(vnc_client.encode_events(events))
+    client.send_events([])
+    client.send_SetEncodings([constants.ZRLE_ENCODING, constants.RAW_ENCODING])
+
+    # One write per call, with the same bytes as sending each event
+    expected = struct.pack('!BBxxI', 4, 1, 0xff52) + struct.pack('!BBHH', 5, 1, 10, 300) + struct.pack('!BBxxI', 4, 0, 0xff52)
+    assert client.transport.written[:2] == [expected, expected]
+    assert client.transport.written[2:] == [struct.pack('!BxHii', 2, 2, constants.ZRLE_ENCODING, constants.RAW_ENCODING)]
+
+def test_decode_pool():
+    rng = np.random.RandomState(0)
+    width, height = 100, 70
+    compressor = zlib.compressobj()
+    expected = np.zeros((height, width, 3), dtype=np.uint8)
+    updates = []
+    for _ in range(10):
+        rectangles = []
+        for _ in range(3):
+            w, h = rng.randint(1, 66, size=2)
+            x, y = rng.randint(0, width - w), rng.randint(0, height - h)
+            pixels = rng.randint(0, 256, size=(h, w, 3)).astype(np.uint8)
+            rectangles.append(zrle_rectangle(x, y, pixels, compressor))
+            expected[y:y+h, x:x+w] = pixels
+        # Interleave with rectangles decoded on the reactor
+        pixels = rng.randint(0, 256, size=(5, 5, 3)).astype(np.uint8)
+        rectangles.append(raw_rectangle(0, 0, pixels))
+        expected[0:5, 0:5] = pixels
+        updates.append(rectangles)
+    stream = server_stream(width, height, updates)
+
+    pool = threadpool.ThreadPool(minthreads=0, maxthreads=4)
+    pool.start()
+    try:
+        error_buffer = utils.ErrorBuffer()
+        client = vnc_client.VNCClient()
+        client.factory = vnc_client.client_factory(None, error_buffer, decode_pool=pool)
+        client.factory.label = 'test'
+        client.transport = None
+        for i in range(0, len(stream), 1000):
+            client.dataReceived(stream[i:i+1000])
+
+        deadline = time.time() + 10
+        while client._decode_queue.depth() > 0 and time.time() < deadline:
+            time.sleep(0.01)
+        error_buffer.check()
+        observation, info = client.numpy_screen.flip()
+        assert np.array_equal(observation, expected)
+        assert len(info['vnc_session.framebuffer_updates']) == 10
+    finally:
+        pool.stop()
+
+def test_parse_encodings():
+    assert vnc_client.parse_encodings(None) == vnc_client.DEFAULT_ENCODINGS
+    assert vnc_client.parse_encodings('copy_rectangle, zrle,raw') == [
+        constants.COPY_RECTANGLE_ENCODING, constants.ZRLE_ENCODING, constants.RAW_ENCODING]
+    assert vnc_client.parse_encodings([constants.HEXTILE_ENCODING]) == [constants.HEXTILE_ENCODING]
+    for bad in ['bogus', 'rre']:
+        try:
+            vnc_client.parse_encodings(bad)
+        except Exception:
+            pass
+        else:
+            assert False, 'Expected {!r} to be rejected'.format(bad)
+
+def test_parse_tight():
+    from PIL import Image
+
+    rng = np.random.RandomState(0)
+    width, height = 48, 40
+    expected = np.zeros((height, width, 3), dtype=np.uint8)
+    streams = [zlib.compressobj() for _ in range(4)]
+    rectangles = []
+
+    # Fill
+    rectangles.append(tight_rectangle(0, 0, width, height, 0x80, struct.pack('!BBB', 1, 2, 3)))
+    expected[:, :] = [1, 2, 3]
+
+    # Copy filter on stream 0, with a compact length over 127
+    pixels = rng.randint(0, 256, size=(20, 30, 3)).astype(np.uint8)
+    rectangles.append(tight_rectangle(1, 2, 30, 20, 0x00, data=pixels.tobytes(), compressor=streams[0]))
+    expected[2:22, 1:31] = pixels
+
+    # Too short to compress, so sent raw
+    pixels = rng.randint(0, 256, size=(1, 3, 3)).astype(np.uint8)
+    rectangles.append(tight_rectangle(40, 39, 3, 1, 0x00, data=pixels.tobytes()))
+    expected[39:40, 40:43] = pixels
+
+    # Two color palette on stream 1, one bit per pixel
+    palette = rng.randint(0, 256, size=(2, 3)).astype(np.uint8)
+    idx = rng.randint(0, 2, size=(9, 13))
+    packed = np.packbits(idx.astype(np.uint8), axis=1)
+    payload = struct.pack('!BB', 1, 1) + palette.tobytes()
+    rectangles.append(tight_rectangle(30, 25, 13, 9, 0x50, payload, packed.tobytes(), streams[1]))
+    expected[25:34, 30:43] = palette[idx]
+
+    # Larger palette on stream 2
+    palette = rng.randint(0, 256, size=(7, 3)).astype(np.uint8)
+    idx = rng.randint(0, 7, size=(8, 8))
+    payload = struct.pack('!BB', 1, 6) + palette.tobytes()
+    rectangles.append(tight_rectangle(0, 30, 8, 8, 0x60, payload, idx.astype(np.uint8).tobytes(), streams[2]))
+    expected[30:38, 0:8] = palette[idx]
+
+    # Gradient filter on stream 3
+    pixels = rng.randint(0, 256, size=(11, 17, 3)).astype(np.uint8)
+    payload = struct.pack('!B', 2)
+    rectangles.append(tight_rectangle(20, 0, 17, 11, 0x70, payload, gradient_filter(pixels).tobytes(), streams[3]))
+    expected[0:11, 20:37] = pixels
+
+    # Reset stream 0 and start it afresh
+    streams[0] = zlib.compressobj()
+    pixels = rng.randint(0, 256, size=(5, 5, 3)).astype(np.uint8)
+    rectangles.append(tight_rectangle(10, 10, 5, 5, 0x01, data=pixels.tobytes(), compressor=streams[0]))
+    expected[10:15, 10:15] = pixels
+
+    # JPEG
+    jpeg = BytesIO()
+    Image.fromarray(rng.randint(0, 256, size=(16, 24, 3)).astype(np.uint8)).save(jpeg, format='JPEG')
+    jpeg = jpeg.getvalue()
+    rectangles.append(tight_rectangle(24, 24, 24, 16, 0x90, compact_length(len(jpeg)), jpeg))
+    expected[24:40, 24:48] = np.asarray(Image.open(BytesIO(jpeg)).convert('RGB'))
+
+    stream = server_stream(width, height, [rectangles[:4], rectangles[4:]])
+    for chunk_size in [1, 4096]:
+        client = connect(stream, chunk_size)
+        observation, info = client.numpy_screen.flip()
+        assert np.array_equal(observation, expected)
+
+def test_tight_options():
+    assert vnc_client.tight_options() == []
+    assert vnc_client.tight_options(compress_level=1, fine_quality_level=50, subsample_level=2) == [
+        constants.COMPRESS_LEVEL_0_ENCODING + 1,
+        constants.FINE_QUALITY_LEVEL_0_ENCODING + 50,
+        constants.QUALITY_LEVEL_0_ENCODING + 5,
+        constants.SUBSAMPLE_LEVEL_0_ENCODING + 2,
+    ]
@@ -0,0 +1,246 @@
+import socket
+import time
+
+import numpy as np
+
+from gym.envs import registration
+
+from universe import error, spaces
+from universe.envs import diagnostics, vnc_env
+from universe.twisty import reactor
+from universe.vncdriver import fake_server, vnc_session
+from universe.wrappers import CropAtari
+from universe.wrappers.experimental import SoftmaxClickMouse
+
+def step_until(session, done, action_d=None, timeout=10):
+    deadline = time.time() + timeout
+    while True:
+        observation_d, info_d, err_d = session.step(action_d or {})
+        if done(observation_d, info_d, err_d):
+            return observation_d, info_d, err_d
+        assert time.time() < deadline, 'Timed out: {} {}'.format(info_d, err_d)
+        session.wait_for_frame(timeout=0.05)
+
+def connected(observation_d, info_d, err_d):
+    return all(observation is not None for observation in observation_d.values())
+
+def scene_frames(servers):
+    return [factory.connections[0]._scene.frame for factory in servers.factories]
+
+def test_connect_and_step():
+    # So slow that the screens don't change after the first update
+    servers = fake_server.FakeVNCServers(2, width=64, height=48, fps=0.01)
+    session = vnc_session.VNCSession()
+    try:
+        session.connect('a', servers.addresses[0], encoding='zrle')
+        session.connect('b', servers.addresses[1], encoding='raw', region=(0, 0, 32, 48))
+        observation_d, info_d, err_d = step_until(session, connected)
+        assert err_d == {}
+        frame_a, frame_b = scene_frames(servers)
+        assert np.array_equal(observation_d['a'], frame_a)
+        # Only the region was sent
+        assert np.array_equal(observation_d['b'][:, :32], frame_b[:, :32])
+        assert not observation_d['b'][:, 32:].any()
+        assert info_d['a']['stats.vnc.updates.n'] >= 1
+
+        events = [('KeyEvent', 0xff52, True), ('KeyEvent', 0xff52, False)]
+        step_until(session, lambda o, i, e: servers.factories[0].connections[0].key_events == 2, {'a': events})
+        assert servers.factories[1].connections[0].key_events == 0
+
+        session.close('a')
+        observation_d, info_d, err_d = session.step({})
+        assert list(observation_d) == ['b']
+    finally:
+        session.close()
+        servers.close()
+
+def test_connection_failure():
+    # A port with nothing listening
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    session = vnc_session.VNCSession()
+    try:
+        session.connect('a', '127.0.0.1:{}'.format(port), start_timeout=0)
+        observation_d, info_d, err_d = step_until(session, lambda o, i, e: 'a' in e)
+        assert 'Connection failed' in str(err_d['a'])
+    finally:
+        session.close()
+
+def test_observation_buffers():
+    servers = fake_server.FakeVNCServers(2, width=64, height=48, fps=0.01)
+    session = vnc_session.VNCSession(observation_buffers=2, decode_threads=2)
+    try:
+        for i, address in enumerate(servers.addresses):
+            session.connect(str(i), address, encoding='zrle')
+        observation_d, info_d, err_d = step_until(session, connected)
+        # Rows of one array, which is handed out too
+        names, array = session.observation_batch
+        assert names == ['0', '1']
+        assert array.shape == (2, 48, 64, 3)
+        assert np.shares_memory(observation_d['0'], array[0])
+        assert np.shares_memory(observation_d['1'], array[1])
+        for name, frame in zip(['0', '1'], scene_frames(servers)):
+            assert np.array_equal(observation_d[name], frame)
+    finally:
+        session.close()
+        servers.close()
+
+def test_close_stops_decode_pool():
+    servers = fake_server.FakeVNCServers(1, width=64, height=48, fps=0.01)
+    session = vnc_session.VNCSession(decode_threads=2)
+    try:
+        session.connect('a', servers.addresses[0], encoding='zrle')
+        step_until(session, connected)
+        pool = session.decode_pool
+        session.close()
+        assert session.decode_pool is None
+        assert not pool.started
+    finally:
+        session.close()
+        servers.close()
+
+def test_driver_selection(monkeypatch):
+    assert vnc_env.vnc_session('py') is vnc_session.VNCSession
+    monkeypatch.setenv('UNIVERSE_VNCDRIVER', 'py')
+    assert vnc_env.vnc_session() is vnc_session.VNCSession
+    try:
+        vnc_env.vnc_session('nonexistent')
+    except error.Error:
+        pass
+    else:
+        assert False, 'Expected an unknown driver to be rejected'
+
+def test_py_driver_env():
+    servers = fake_server.FakeVNCServers(1, width=64, height=48, fps=30)
+    env = vnc_env.VNCEnv()
+    # As gym.make would leave it for an unregistered env
+    env.spec = None
+    env.configure(remotes=servers.remotes, vnc_driver='py', vnc_kwargs={'encoding': 'zrle', 'decode_threads': 2})
+    try:
+        assert isinstance(env.vnc_session, vnc_session.VNCSession)
+        assert env.vnc_session.decode_pool is not None
+        env.reset()
+        deadline = time.time() + 10
+        while True:
+            observation_n, reward_n, done_n, info = env.step([[spaces.KeyEvent.by_name('a', down=True)]])
+            if observation_n[0] is not None and observation_n[0]['vision'] is not None:
+                break
+            assert time.time() < deadline, info
+            env.wait_for_frame(timeout=0.05)
+        assert observation_n[0]['vision'].shape == (48, 64, 3)
+        while servers.factories[0].connections[0].key_events == 0:
+            assert time.time() < deadline, 'Key events never arrived'
+            env.step([[spaces.KeyEvent.by_name('a', down=True)]])
+            time.sleep(0.01)
+    finally:
+        env.close()
+        servers.close()
+
+def test_py_driver_env_event_arrays():
+    servers = fake_server.FakeVNCServers(1, width=64, height=48, fps=30)
+    env = vnc_env.VNCEnv()
+    env.spec = None
+    env.configure(remotes=servers.remotes, vnc_driver='py', vnc_kwargs={'encoding': 'zrle'})
+    # Clicks in the middle of 10x10 cells
+    env = SoftmaxClickMouse(env, active_region=(0, 0, 40, 40))
+    try:
+        env.reset()
+        connection = None
+        deadline = time.time() + 10
+        while connection is None or connection.pointer_events < 3:
+            assert time.time() < deadline, 'Pointer events never arrived'
+            env.step([0])
+            env.unwrapped.step(spaces.key_events([[0x61, 0x61]], [[True, False]]))
+            time.sleep(0.01)
+            if servers.factories[0].connections:
+                connection = servers.factories[0].connections[0]
+        while connection.key_events < 2:
+            assert time.time() < deadline, 'Key events never arrived'
+            time.sleep(0.01)
+    finally:
+        env.close()
+        servers.close()
+
+def test_py_driver_env_result_arrays():
+    servers = fake_server.FakeVNCServers(2, width=64, height=48, fps=30)
+    env = vnc_env.VNCEnv()
+    env.spec = None
+    env.configure(remotes=servers.remotes, vnc_driver='py', vnc_kwargs={'encoding': 'zrle'}, result_arrays=True)
+    try:
+        env.reset()
+        deadline = time.time() + 10
+        updates = np.zeros(2)
+        while not (updates > 0).all():
+            assert time.time() < deadline, 'Updates never arrived'
+            observation_n, reward_n, done_n, info = env.step([[], []])
+            assert reward_n.dtype == np.float64 and reward_n.shape == (2,)
+            assert done_n.dtype == bool and done_n.shape == (2,)
+            assert all('stats.vnc.updates.n' not in info_i for info_i in info['n'])
+            updates += np.nan_to_num(info['columns']['stats.vnc.updates.n'])
+            time.sleep(0.01)
+    finally:
+        env.close()
+        servers.close()
+
+def test_py_driver_env_vision_batch():
+    servers = fake_server.FakeVNCServers(2, width=64, height=48, fps=30)
+    env = vnc_env.VNCEnv()
+    env.spec = None
+    env.configure(remotes=servers.remotes, vnc_driver='py', vnc_kwargs={'encoding': 'zrle', 'observation_buffers': 2})
+    try:
+        env.reset()
+        deadline = time.time() + 10
+        while True:
+            observation_n, reward_n, done_n, info = env.step([[], []])
+            if all(observation['vision'] is not None for observation in observation_n):
+                break
+            assert time.time() < deadline, 'Observations never arrived'
+            time.sleep(0.01)
+        batch = info['vision.batch']
+        assert batch.shape == (2, 48, 64, 3)
+        for i, observation in enumerate(observation_n):
+            assert np.shares_memory(observation['vision'], batch[i])
+    finally:
+        env.close()
+        servers.close()
+
+def test_crop_keeps_diagnostics_metadata():
+    # The anchor goes below the 160x210 Atari crop box
+    servers = fake_server.FakeVNCServers(1, width=200, height=240, fps=30, content=[])
+    env = vnc_env.VNCEnv()
+    env.spec = registration.EnvSpec('FakeMetadata-v0', tags={'runtime': 'gym-core', 'metadata_encoding': {'type': 'pixels'}})
+    env = CropAtari(env, request_region=True)
+    env.configure(remotes=servers.remotes, vnc_driver='py', vnc_kwargs={'encoding': 'zrle'}, ignore_clock_skew=True)
+
+    def paint_metadata():
+        connection = servers.factories[0].connections[0]
+        y, x = 220, 170
+        connection._scene.frame[y:y+2, x:x+2] = diagnostics.PixelsMetadataDecoder(None).anchor
+        # Timestamps of 1234.567 and 0 seconds
+        connection._scene.frame[y, x+2:x+6] = [(0, 0, 0), (0x12, 0xd6, 0x87), (0, 0, 0), (0, 0, 0)]
+        connection._backlog.append((x, y, 6, 2))
+
+    try:
+        deadline = time.time() + 10
+        while not servers.factories[0].connections or servers.factories[0].connections[0]._scene is None:
+            assert time.time() < deadline, 'Never connected'
+            time.sleep(0.01)
+        reactor.callFromThread(paint_metadata)
+        while True:
+            # CropAtari needs a frame to crop, so read the metadata
+            # underneath it, as Throttle would
+            observation_n, reward_n, done_n, info = env.unwrapped.step([[]])
+            env.unwrapped.diagnostics.add_metadata(observation_n, info['n'], available_at=time.time())
+            if 'diagnostics.image_remote_time' in info['n'][0]:
+                break
+            assert time.time() < deadline, info
+            env.unwrapped.wait_for_frame(timeout=0.05)
+        assert info['n'][0]['diagnostics.image_remote_time'] == 1234.567
+        observation_n, reward_n, done_n, info = env.step([[]])
+        assert observation_n[0]['vision'].shape == (210, 160, 3)
+    finally:
+        env.close()
+        servers.close()
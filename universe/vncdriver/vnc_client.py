@@ -9,6 +9,7 @@ import numpy as np
 import os
 from universe import pyprofile
 import re
+import six
 import struct
 import zlib
 
@@ -16,7 +17,7 @@ from twisted.internet import defer, protocol, threads
 
 from universe import utils
 from universe.twisty import reactor
-from universe.vncdriver import auth, constants, error, screen, server_messages
+from universe.vncdriver import auth, constants, decode_queue, error, framing, screen, server_messages
 
 logger = logging.getLogger(__name__)
 
@@ -26,18 +27,168 @@ logger = logging.getLogger(__name__)
 class UnknownEncoding(Exception):
     pass
 
+# In order of preference. Servers only use CopyRect where it applies
+# (e.g. scrolling), so it's safe to always put it first.
+DEFAULT_ENCODINGS = [
+    constants.COPY_RECTANGLE_ENCODING,
+    constants.ZRLE_ENCODING,
+    constants.HEXTILE_ENCODING,
+    constants.ZLIB_ENCODING,
+    constants.RAW_ENCODING,
+]
+
+SUPPORTED_ENCODINGS = set(DEFAULT_ENCODINGS + [constants.TIGHT_ENCODING, constants.PSEUDO_CURSOR_ENCODING])
+
+def parse_encodings(encoding):
+    """Turn an encoding preference into a list of encoding numbers.
+
+    Accepts a comma-separated string of names (as in vnc_kwargs,
+    e.g. 'copy_rectangle,zrle,raw'), a list of names or numbers, or
+    None for the defaults.
+    """
+    if encoding is None:
+        return list(DEFAULT_ENCODINGS)
+    if isinstance(encoding, six.string_types):
+        encoding = [name.strip() for name in encoding.split(',') if name.strip()]
+
+    encodings = []
+    for enc in encoding:
+        if isinstance(enc, six.string_types):
+            try:
+                enc = getattr(constants, enc.upper() + '_ENCODING')
+            except AttributeError:
+                raise error.Error('Unknown VNC encoding: {!r}'.format(enc))
+        if enc not in SUPPORTED_ENCODINGS:
+            raise error.Error('Encoding {} is not supported by the Python vncdriver. Supported: {}'.format(enc, sorted(SUPPORTED_ENCODINGS)))
+        encodings.append(enc)
+    return encodings
+
+def tight_options(compress_level=None, fine_quality_level=None, subsample_level=None):
+    """Pseudo-encodings which tune Tight, matching the options the Go
+    driver takes.
+
+    compress_level: zlib effort, 0-9.
+    fine_quality_level: JPEG quality, 0-100. Servers without the
+      TurboVNC extensions only understand the coarse 0-9 quality
+      levels, so we send one of those too. Either way, servers only
+      use JPEG once a quality level has been set.
+    subsample_level: JPEG chrominance subsampling, 0 (none) to 3
+      (grayscale).
+    """
+    options = []
+    if compress_level is not None:
+        assert 0 <= compress_level <= 9, 'Bad compress_level: {}'.format(compress_level)
+        options.append(constants.COMPRESS_LEVEL_0_ENCODING + compress_level)
+    if fine_quality_level is not None:
+        assert 0 <= fine_quality_level <= 100, 'Bad fine_quality_level: {}'.format(fine_quality_level)
+        options.append(constants.FINE_QUALITY_LEVEL_0_ENCODING + fine_quality_level)
+        options.append(constants.QUALITY_LEVEL_0_ENCODING + min(fine_quality_level // 10, 9))
+    if subsample_level is not None:
+        assert 0 <= subsample_level <= 3, 'Bad subsample_level: {}'.format(subsample_level)
+        options.append(constants.SUBSAMPLE_LEVEL_0_ENCODING + subsample_level)
+    return options
+
+def clip_region(region, width, height):
+    """Clip an (x, y, width, height) region of interest to the screen.
+    None means the whole screen."""
+    if region is None:
+        return (0, 0, width, height)
+    x, y, w, h = [int(v) for v in region]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, width), min(y + h, height)
+    if x1 <= x0 or y1 <= y0:
+        raise error.Error('Region {} does not overlap the {}x{} screen'.format(region, width, height))
+    return (x0, y0, x1 - x0, y1 - y0)
+
 def peer_address(peer):
     return '{}:{}'.format(peer.host, peer.port)
 
+pack_key_event = struct.Struct('!BBxxI').pack
+pack_pointer_event = struct.Struct('!BBHH').pack
+
+def encode_events(events):
+    """Encode compiled actions (('KeyEvent', key, down) and
+    ('PointerEvent', x, y, buttonmask) tuples) as the client messages
+    for them, all in one string."""
+    messages = []
+    for event in events:
+        if event[0] == 'KeyEvent':
+            messages.append(pack_key_event(4, event[2], event[1]))
+        elif event[0] == 'PointerEvent':
+            messages.append(pack_pointer_event(5, event[3], event[1], event[2]))
+        else:
+            raise error.Error('Bad event type: {}'.format(event[0]))
+    return b''.join(messages)
+
+# Event arrays (see spaces.vnc_event.event_dtype) are encoded with
+# NumPy when they hold more events than this between them; below it,
+# going event by event is quicker
+VECTORIZE_EVENTS = 64
+
+def encode_event_array(events):
+    """Encode an event array (see spaces.vnc_event) like
+    encode_events. Its event types are the client message types."""
+    if events.size > VECTORIZE_EVENTS:
+        return _encode_event_batch(events.reshape(1, -1))[0]
+
+    messages = []
+    for type, key_or_x, y, down_or_buttonmask in events.tolist():
+        if type == 4:
+            messages.append(pack_key_event(4, down_or_buttonmask, key_or_x))
+        elif type == 5:
+            messages.append(pack_pointer_event(5, down_or_buttonmask, key_or_x, y))
+        elif type != 0:
+            raise error.Error('Bad event type: {}'.format(type))
+    return b''.join(messages)
+
+def encode_event_arrays(arrays):
+    """Encode a list of 1-d event arrays, returning a list of strings.
+    Many small arrays (say, one per environment) are encoded
+    together."""
+    sizes = [len(events) for events in arrays]
+    if sum(sizes) <= VECTORIZE_EVENTS:
+        return [encode_event_array(events) for events in arrays]
+
+    length = max(sizes)
+    if min(sizes) == length:
+        batch = np.stack(arrays)
+    else:
+        # Pad them into one batch, with no-event rows
+        batch = np.zeros((len(arrays), length), dtype=arrays[0].dtype)
+        for i, events in enumerate(arrays):
+            batch[i, :len(events)] = events
+    return _encode_event_batch(batch)
+
+def _encode_event_batch(batch):
+    types = batch['type']
+    keys = types == 4
+    pointers = types == 5
+    if not np.all(keys | pointers | (types == 0)):
+        raise error.Error('Bad event type: {}'.format(types[~(keys | pointers | (types == 0))][0]))
+
+    # Write every event into 8 bytes, of which KeyEvents use all and
+    # PointerEvents the first 6
+    messages = np.zeros(batch.shape + (8,), dtype=np.uint8)
+    messages[..., 0] = types
+    messages[..., 1] = batch['down_or_buttonmask']
+    messages[keys, 4:8] = batch['key_or_x'][keys].astype('>u4').view(np.uint8).reshape(-1, 4)
+    messages[pointers, 2:4] = batch['key_or_x'][pointers].astype('>u2').view(np.uint8).reshape(-1, 2)
+    messages[pointers, 4:6] = batch['y'][pointers].astype('>u2').view(np.uint8).reshape(-1, 2)
+    lengths = np.where(keys, 8, np.where(pointers, 6, 0))
+
+    data = messages[np.arange(8) < lengths[..., np.newaxis]].tobytes()
+    ends = np.cumsum(lengths.sum(axis=1)).tolist()
+    return [data[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
 class Framebuffer(object):
-    def __init__(self, width, height, server_pixel_format, name):
+    def __init__(self, width, height, server_pixel_format, name, frame_ready=None):
         # self.observer = observer
 
         self.width = width
         self.height = height
         self.name = name
 
-        self.numpy_screen = screen.NumpyScreen(width, height)
+        self.numpy_screen = screen.NumpyScreen(width, height, frame_ready=frame_ready)
         self.apply_format(server_pixel_format)
 
     def apply_format(self, server_pixel_format):
@@ -65,12 +216,11 @@ class Framebuffer(object):
 
         self.numpy_screen.color_cycle = self.color_cycle
 
-class VNCClient(protocol.Protocol, object):
+class VNCClient(protocol.Protocol, framing.FramedProtocol):
     def __init__(self):
         self.numpy_screen = None
 
-        self.buf = []
-        self.buf_len = 0
+        self.init_framing()
 
         self.initialized = False
 
@@ -85,7 +235,12 @@ class VNCClient(protocol.Protocol, object):
         self.expect(self.recv_ProtocolVersion_Handshake, 12)
 
         self._close = False
+        # Zlib and ZRLE rectangles each continue their own zlib stream
         self.zlib_decompressor = zlib.decompressobj()
+        self.zrle_decompressor = zlib.decompressobj()
+        self.tight_zlib_decompressors = [zlib.decompressobj() for _ in range(4)]
+        # Set up once we're connected, if the factory has a decode pool
+        self._decode_queue = None
 
         self._pointer_x = None
         self._pointer_y = None
@@ -106,13 +261,12 @@ class VNCClient(protocol.Protocol, object):
         pyprofile.incr('vnc_client.data.received.bytes', len(data), unit=pyprofile.BYTES)
 
         self.buf.append(data)
-        self.buf_len += len(data)
-        logger.debug('Received data: %s bytes (brings us to %s total)', len(data), self.buf_len)
+        logger.debug('Received data: %s bytes (brings us to %s total)', len(data), len(self.buf))
 
         self.flush()
 
     def flush(self):
-        if self.buf_len < self.expected_len:
+        if len(self.buf) < self.expected_len:
             return
         elif self._pause:
             # Not strictly needed, but short circuits in case we're
@@ -121,20 +275,13 @@ class VNCClient(protocol.Protocol, object):
         elif self._close:
             return
 
-        buffer = b''.join(self.buf)
-        while len(buffer) >= self.expected_len:
-            logger.debug('Remaining in buffer: %s bytes', len(buffer))
-            if self._pause:
-                logger.debug('Pausing with %s bytes left in the buffer', len(buffer))
-                break
-            block, buffer = buffer[:self.expected_len], buffer[self.expected_len:]
-            if not self.handle(self.expected, block):
-                logger.debug('Stopping due to error in handle()')
-                buffer = block + buffer
-                break
-
-        self.buf[:] = [buffer]
-        self.buf_len = len(buffer)
+        self.parse_buffer()
+
+    def can_parse(self):
+        if self._pause:
+            logger.debug('Pausing with %s bytes left in the buffer', len(self.buf))
+            return False
+        return True
 
     def handle(self, type, block):
         logger.debug('Handling server event: type=%s', type.__name__)
@@ -146,6 +293,8 @@ class VNCClient(protocol.Protocol, object):
             return False
 
     def recv_ProtocolVersion_Handshake(self, block):
+        # Blocks are memoryviews, which Python 2's re can't search
+        block = block.tobytes()
         match = re.search(b'^RFB (\d{3}).(\d{3})\n$', block)
         assert match, 'Expected RFB line, but got: {!r}'.format(block)
         major = int(match.group(1))
@@ -182,10 +331,10 @@ class VNCClient(protocol.Protocol, object):
         self.expect(self.recv_SecurityResult_Handshake_failed_reason, length)
 
     def recv_SecurityResult_Handshake_failed_reason(self, block):
-        logger.info('Connection to server failed: %s', block)
+        logger.info('Connection to server failed: %s', block.tobytes())
 
     def recv_VNC_Authentication(self, block):
-        response = auth.challenge_response(block)
+        response = auth.challenge_response(block.tobytes(), getattr(self.factory, 'password', None))
         self.sendMessage(response)
         self.expect(self.recv_SecurityResult_Handshake, 4)
 
@@ -200,17 +349,19 @@ class VNCClient(protocol.Protocol, object):
         self.expect(self.recv_ServerInit_name, namelen, width, height, server_pixel_format)
 
     def recv_ServerInit_name(self, block, width, height, server_pixel_format):
-        self.framebuffer = Framebuffer(width, height, server_pixel_format, block)
+        self.framebuffer = Framebuffer(width, height, server_pixel_format, block.tobytes(), frame_ready=self.factory.frame_ready)
         self.numpy_screen = self.framebuffer.numpy_screen
+        if self.factory.decode_pool is not None:
+            self._decode_queue = decode_queue.DecodeQueue(self.factory.decode_pool, self.factory.label, self._decode_error)
+
+        # Only ask for (and so only decode) the part of the screen
+        # the agent looks at
+        self.region = clip_region(self.factory.region, width, height)
 
         self.initialized = True
         self.send_PixelFormat()
-        self.send_SetEncodings([
-            constants.ZRLE_ENCODING,
-            constants.ZLIB_ENCODING,
-            constants.RAW_ENCODING,
-        ])
-        self.send_FramebufferUpdateRequest(incremental=1)
+        self.send_SetEncodings(self.factory.encodings)
+        self._request_update()
 
         if self.factory.deferred:
             self.factory.deferred.callback(self)
@@ -250,8 +401,10 @@ class VNCClient(protocol.Protocol, object):
         if self._remaining_rectangles > 0:
             self.expect(self.recv_Rectangle, 12)
         else:
-            framebuffer_update = server_messages.FramebufferUpdate(self._rectangles)
-            self.numpy_screen.apply(framebuffer_update)
+            if self._decode_queue is None:
+                self._apply_rectangles(self._rectangles)
+            else:
+                self._decode_queue.submit(self._apply_rectangles, self._rectangles)
             self._remaining_rectangles = None
             self._rectangles = None
 
@@ -260,9 +413,38 @@ class VNCClient(protocol.Protocol, object):
             # Empirically, after a few framebufferUpdateRequest's without
             # any changes, Xvnc will hold off on sending another
             # framebuffer update until the display data changes.
-            self.send_FramebufferUpdateRequest(incremental=1)
+            self._request_update()
             self.expect(self.recv_ServerToClient, 1)
 
+    def _apply_rectangles(self, rectangles):
+        # Rectangles decoded on the pool come wrapped in a list (see
+        # _decode_rectangle)
+        rectangles = [rectangle[0] if isinstance(rectangle, list) else rectangle for rectangle in rectangles]
+        framebuffer_update = server_messages.FramebufferUpdate(rectangles)
+        self.numpy_screen.apply(framebuffer_update)
+
+    def _decode_rectangle(self, encoding, x, y, width, height, block):
+        """Decode a compressed rectangle, on the decode pool if we have
+        one. Its place in the update is held by a list, which the
+        decode job fills in."""
+        # Python 2's zlib can't take a memoryview, and the block is
+        # only valid until the next dataReceived anyway
+        block = block.tobytes()
+        if self._decode_queue is None:
+            self._rectangles.append(encoding.parse_rectangle(self, x, y, width, height, block))
+        else:
+            slot = []
+            self._rectangles.append(slot)
+            self._decode_queue.submit(self._decode_into, slot, encoding, x, y, width, height, block)
+
+    def _decode_into(self, slot, encoding, x, y, width, height, block):
+        if self._close:
+            return
+        slot.append(encoding.parse_rectangle(self, x, y, width, height, block))
+
+    def _decode_error(self, e):
+        reactor.callFromThread(self._error, e)
+
     def recv_Rectangle(self, block):
         self._remaining_rectangles -= 1
 
@@ -274,6 +456,16 @@ class VNCClient(protocol.Protocol, object):
             self.expect(self.recv_DecodeZRLE, 4, x, y, width, height)
         elif encoding == constants.ZLIB_ENCODING:
             self.expect(self.recv_DecodeZlib, 4, x, y, width, height)
+        elif encoding == constants.COPY_RECTANGLE_ENCODING:
+            self.expect(self.recv_DecodeCopyRect, 4, x, y, width, height)
+        elif encoding == constants.HEXTILE_ENCODING:
+            pyprofile.incr('vncdriver.recv_rectangle.hextile_encoding')
+            decoder = server_messages.HextileDecoder(x, y, width, height, self.framebuffer.bypp)
+            self._handle_Hextile(decoder, decoder.next_length())
+        elif encoding == constants.TIGHT_ENCODING:
+            pyprofile.incr('vncdriver.recv_rectangle.tight_encoding')
+            decoder = server_messages.TightDecoder(x, y, width, height, self.tight_zlib_decompressors, self.framebuffer.bypp, self.framebuffer.depth)
+            self._handle_Tight(decoder, decoder.next_length())
         elif encoding == constants.PSEUDO_CURSOR_ENCODING:
             length = width * height * self.framebuffer.bypp
             length += int(math.floor((width + 7.0) / 8)) * height
@@ -285,6 +477,8 @@ class VNCClient(protocol.Protocol, object):
 
     def recv_DecodePseudoCursor(self, block, x, y, width, height):
         # cf https://github.com/sibson/vncdotool/blob/master/vncdotool/rfb.py
+        pyprofile.incr('vncdriver.recv_rectangle.pseudo_cursor_encoding')
+        pyprofile.incr('vncdriver.recv_rectangle.pseudo_cursor_encoding.bytes', len(block), unit=pyprofile.BYTES)
         rectangle = server_messages.PseudoCursorEncoding.parse_rectangle(self, x, y, width, height, block)
         self._rectangles.append(rectangle)
         self._process_rectangles()
@@ -296,6 +490,35 @@ class VNCClient(protocol.Protocol, object):
         self._rectangles.append(rectangle)
         self._process_rectangles()
 
+    def recv_DecodeCopyRect(self, block, x, y, width, height):
+        pyprofile.incr('vncdriver.recv_rectangle.copy_rectangle_encoding')
+        pyprofile.incr('vncdriver.recv_rectangle.copy_rectangle_encoding.bytes', len(block), unit=pyprofile.BYTES)
+        rectangle = server_messages.CopyRectEncoding.parse_rectangle(self, x, y, width, height, block)
+        self._rectangles.append(rectangle)
+        self._process_rectangles()
+
+    def _handle_Hextile(self, decoder, length):
+        if length > 0:
+            self.expect(self.recv_DecodeHextile, length, decoder)
+        else:
+            pyprofile.incr('vncdriver.recv_rectangle.hextile_encoding.bytes', decoder.bytes, unit=pyprofile.BYTES)
+            self._rectangles.append(decoder.rectangle())
+            self._process_rectangles()
+
+    def recv_DecodeHextile(self, block, decoder):
+        self._handle_Hextile(decoder, decoder.feed(block))
+
+    def _handle_Tight(self, decoder, length):
+        if length > 0:
+            self.expect(self.recv_DecodeTight, length, decoder)
+        else:
+            pyprofile.incr('vncdriver.recv_rectangle.tight_encoding.bytes', decoder.bytes, unit=pyprofile.BYTES)
+            self._rectangles.append(decoder.rectangle())
+            self._process_rectangles()
+
+    def recv_DecodeTight(self, block, decoder):
+        self._handle_Tight(decoder, decoder.feed(block))
+
     def recv_DecodeZRLE(self, block, x, y, width, height):
         pyprofile.incr('vncdriver.recv_rectangle.zrle_encoding')
         pyprofile.incr('vncdriver.recv_rectangle.zrle_encoding.bytes', len(block), unit=pyprofile.BYTES)
@@ -305,8 +528,7 @@ class VNCClient(protocol.Protocol, object):
 
     def recv_DecodeZRLE_value(self, block, x, y, width, height):
         pyprofile.incr('vncdriver.recv_rectangle.zrle_encoding.bytes', len(block), unit=pyprofile.BYTES)
-        rectangle = server_messages.ZRLEEncoding.parse_rectangle(self, x, y, width, height, block)
-        self._rectangles.append(rectangle)
+        self._decode_rectangle(server_messages.ZRLEEncoding, x, y, width, height, block)
         self._process_rectangles()
 
     def recv_DecodeZlib(self, block, x, y, width, height):
@@ -318,8 +540,7 @@ class VNCClient(protocol.Protocol, object):
 
     def recv_DecodeZlib_value(self, block, x, y, width, height):
         pyprofile.incr('vncdriver.recv_rectangle.zlib_encoding.bytes', len(block), unit=pyprofile.BYTES)
-        rectangle = server_messages.ZlibEncoding.parse_rectangle(self, x, y, width, height, block)
-        self._rectangles.append(rectangle)
+        self._decode_rectangle(server_messages.ZlibEncoding, x, y, width, height, block)
         self._process_rectangles()
 
     def recv_SetColorMapEntries(self, block):
@@ -353,11 +574,12 @@ class VNCClient(protocol.Protocol, object):
         self.expect(self.recv_ServerToClient, 1)
 
     def send_SetEncodings(self, encodings):
-        self.sendMessage(struct.pack("!BxH", 2, len(encodings)))
-        for encoding in encodings:
-            self.sendMessage(struct.pack("!i", encoding))
+        self.sendMessage(struct.pack("!BxH{}i".format(len(encodings)), 2, len(encodings), *encodings))
 
     def send_PixelFormat(self, bpp=32, depth=24, bigendian=0, truecolor=1, redmax=255, greenmax=255, bluemax=255, redshift=0, greenshift=8, blueshift=16):
+        """The defaults put pixels on the wire as R, G, B, X bytes, which
+        is the screen's own layout. RAW and Zlib rectangles can then
+        be copied straight into the screen."""
         if not self.initialized:
             # Not too bad to add, but no need right now. (We'd need to
             # make sure the framebuffer settings don't get
@@ -379,12 +601,16 @@ class VNCClient(protocol.Protocol, object):
             height = self.framebuffer.height - y
         self.sendMessage(struct.pack("!BBHHHH", 3, incremental, x, y, width, height))
 
+    def _request_update(self):
+        x, y, width, height = self.region
+        self.send_FramebufferUpdateRequest(x=x, y=y, width=width, height=height, incremental=1)
+
     def send_KeyEvent(self, key, down):
         """For most ordinary keys, the "keysym" is the same as the
         corresponding ASCII value.  Other common keys are shown in the
         KEY_ constants.
         """
-        self.sendMessage(struct.pack('!BBxxI', 4, down, key))
+        self.sendMessage(pack_key_event(4, down, key))
 
     def send_PointerEvent(self, x, y, buttonmask=0):
         """Indicates either pointer movement or a pointer button press or
@@ -393,22 +619,20 @@ class VNCClient(protocol.Protocol, object):
            bits 0 to 7 of button-mask respectively, 0 meaning up, 1
            meaning down (pressed).
         """
-        self.sendMessage(struct.pack('!BBHH', 5, buttonmask, x, y))
+        self.sendMessage(pack_pointer_event(5, buttonmask, x, y))
+
+    def send_events(self, events):
+        """Send a step's worth of compiled actions in one write. `events`
+        may also be a string already made by encode_events."""
+        if not isinstance(events, bytes):
+            events = encode_events(events)
+        if events:
+            self.sendMessage(events)
 
     def send_ClientCutText(self, message):
         """The client has new text in its clipboard.
         """
-        self.sendMessage(struct.pack("!BxxxI", 6, len(message)))
-        self.sendMessage(message)
-
-    def expect(self, type, length, *args, **kwargs):
-        logger.debug('Expecting: %s (length=%s)', type.__name__, length)
-        assert isinstance(length, int), "Bad length (not an int): {}".format(length)
-
-        self.expected = type
-        self.expected_len = length
-        self.expected_args = args
-        self.expected_kwargs = kwargs
+        self.sendMessage(struct.pack("!BxxxI", 6, len(message)) + message)
 
     def close(self):
         self._close = True
@@ -424,9 +648,31 @@ class VNCClient(protocol.Protocol, object):
             except defer.AlreadyCalledError:
                 pass
 
-def client_factory(deferred, error_buffer):
+def client_factory(deferred, error_buffer, encodings=None, region=None, decode_pool=None, frame_ready=None, password=None):
+    """encodings: the list of encoding numbers to send in
+    SetEncodings (see parse_encodings and tight_options).
+
+    region: (x, y, width, height) of the screen to request updates
+    for, or None for all of it. The rest of the screen is left as is.
+
+    decode_pool: a started twisted ThreadPool to decompress and decode
+    ZRLE and Zlib rectangles on, rather than the reactor thread.
+
+    frame_ready: a threading.Condition for the screen to notify as
+    frames arrive (see NumpyScreen).
+
+    password: for VNC authentication. Defaults to
+    utils.default_password().
+    """
     factory = protocol.ClientFactory()
     factory.deferred = deferred
     factory.error_buffer = error_buffer
+    if encodings is None:
+        encodings = parse_encodings(None)
+    factory.encodings = encodings
+    factory.region = region
+    factory.decode_pool = decode_pool
+    factory.frame_ready = frame_ready
+    factory.password = password
     factory.protocol = VNCClient
     return factory
@@ -7,7 +7,7 @@ import time
 import traceback
 
 from universe import pyprofile
-from universe.vncdriver import auth, constants, fbs_writer
+from universe.vncdriver import auth, constants, fbs_writer, framing
 from twisted.internet import defer, endpoints, protocol, reactor
 
 logger = logging.getLogger(__name__)
@@ -89,11 +89,12 @@ class LogManager(object):
             shutil.copystat(self.logfile_dir, dest)
 
 
-class VNCProxyServer(protocol.Protocol, object):
+class VNCProxyServer(protocol.Protocol, framing.FramedProtocol):
     """Bytes received from the end user. (So received data are mostly
     actions.)"""
 
     _next_id = 0
+    profile_prefix = 'vnc_proxy_server'
 
     SUPPORTED_ENCODINGS = {
         # Maybe we can do copy-rect at some point. May not help with
@@ -137,8 +138,7 @@ class VNCProxyServer(protocol.Protocol, object):
         self.vnc_client = None
         self.log_manager = None
 
-        self.buf = []
-        self.buf_len = 0
+        self.init_framing()
 
         self.queued_data = []
         self.initialized = False
@@ -192,7 +192,6 @@ class VNCProxyServer(protocol.Protocol, object):
         pyprofile.incr('vnc_proxy_server.data.sent.bytes', len(data))
 
         self.buf.append(data)
-        self.buf_len += len(data)
         self.flush()
 
     def sendData(self, data):
@@ -203,31 +202,32 @@ class VNCProxyServer(protocol.Protocol, object):
         self.transport.write(data)
 
     def flush(self):
-        if self.buf_len < self.expected_len:
+        if len(self.buf) < self.expected_len:
             return
         elif self.vnc_client is None and self.action_queue is None:
             return
 
-        buffer = b''.join(self.buf)
-        while not self._broken and len(buffer) >= self.expected_len:
-            block, buffer = buffer[:self.expected_len], buffer[self.expected_len:]
-            self.handle(self.expected, block)
+        self.parse_buffer()
 
-        self.buf[:] = [buffer]
-        self.buf_len = len(buffer)
+    def can_parse(self):
+        return not self._broken
 
     def handle(self, type, block):
         logger.debug('[%s] Handling: type=%s', self.id, type)
         try:
             self.expected(block, *self.expected_args, **self.expected_kwargs)
+            return True
         except Exception as e:
             self._error(e)
+            return False
 
     def send_ProtocolVersion_Handshake(self):
         self.sendData(b'RFB 003.003\n')
 
     def recv_ProtocolVersion_Handshake(self, block):
-        # Client chooses RFB version
+        # Client chooses RFB version. (Blocks are memoryviews, which
+        # Python 2's re can't search.)
+        block = block.tobytes()
         match = re.search(b'^RFB (\d{3}).(\d{3})\n$', block)
         assert match, 'Block does not match: {!r}'.format(block)
         major = int(match.group(1))
@@ -405,15 +405,11 @@ class VNCProxyServer(protocol.Protocol, object):
 
         self.expect(self.recv_ClientToServer, 1)
 
-    def expect(self, type, length, *args, **kwargs):
-        self.expected = type
-        self.expected_len = length
-        self.expected_args = args
-        self.expected_kwargs = kwargs
-
     def proxyData(self, data):
         if self.vnc_client:
-            self.vnc_client.recvProxyData(data)
+            # Blocks are views into our receive buffer, so copy
+            # before they get queued or written out.
+            self.vnc_client.recvProxyData(data.tobytes())
 
     def recvProxyData(self, data):
         """Write data to server"""
@@ -439,7 +435,9 @@ class VNCProxyServer(protocol.Protocol, object):
             self.error_buffer.record(e)
         self.close()
 
-class VNCProxyClient(protocol.Protocol, object):
+class VNCProxyClient(protocol.Protocol, framing.FramedProtocol):
+    profile_prefix = 'vnc_proxy_client'
+
     def __init__(self):
         self.id = None
         self.vnc_server = None
@@ -447,8 +445,7 @@ class VNCProxyClient(protocol.Protocol, object):
         # Messages heading for the server, which haven't been written
         # to disk.
         self.client_log_buffer = []
-        self.buf = []
-        self.buf_len = 0
+        self.init_framing()
         self._broken = False
 
         self.queued_data = []
@@ -501,35 +498,34 @@ class VNCProxyClient(protocol.Protocol, object):
         pyprofile.incr('vnc_proxy_server.data.sent.bytes', len(data))
 
         self.buf.append(data)
-        self.buf_len += len(data)
         self.flush()
 
     def flush(self):
-        if self.buf_len < self.expected_len:
+        if len(self.buf) < self.expected_len:
             return
 
-        buffer = b''.join(self.buf)
-        while self.expected is not None and not self._broken and len(buffer) >= self.expected_len:
-            block, buffer = buffer[:self.expected_len], buffer[self.expected_len:]
-            self.handle(self.expected, block)
-
-        self.buf[:] = [buffer]
-        self.buf_len = len(buffer)
+        self.parse_buffer()
 
         if self.expected is None:
-            data = b''.join(self.buf)
-            if data != '':
+            data = self.buf.read_all()
+            if data:
                 self.proxyData(data)
-            self.buf = []
+
+    def can_parse(self):
+        return not self._broken
 
     def handle(self, type, block):
         logger.debug('[%s] Handling: type=%s', self.id, type)
         try:
             self.expected(block, *self.expected_args, **self.expected_kwargs)
+            return True
         except Exception as e:
             self._error(e)
+            return False
 
     def recv_ProtocolVersion_Handshake(self, block):
+        # Blocks are memoryviews, which Python 2's re can't search
+        block = block.tobytes()
         match = re.search(b'^RFB (\d{3}).(\d{3})\n$', block)
         assert match, 'Expected RFB line, but got: {!r}'.format(block)
         major = int(match.group(1))
@@ -550,7 +546,7 @@ class VNCProxyClient(protocol.Protocol, object):
             assert False, 'Bad auth: {}'.format(auth)
 
     def recv_VNC_Authentication(self, block):
-        response = auth.challenge_response(block)
+        response = auth.challenge_response(block.tobytes())
         self.sendData(response)
         self.expect(self.recv_SecurityResult_Handshake, 4)
 
@@ -571,7 +567,7 @@ class VNCProxyClient(protocol.Protocol, object):
         self.expect(self.recv_SecurityResult_Handshake_failed_reason, length)
 
     def recv_SecurityResult_Handshake_failed_reason(self, block):
-        logger.info('Connection to server failed: %s', block)
+        logger.info('Connection to server failed: %s', block.tobytes())
 
     def send_ClientInit(self):
         shared = True
@@ -593,16 +589,6 @@ class VNCProxyClient(protocol.Protocol, object):
         # And from now on just do a straight proxy
         self.expect(None, None)
 
-    def expect(self, type, length, *args, **kwargs):
-        if type is not None:
-            logger.debug('Expecting: %s (length=%s)', type.__name__, length)
-            assert isinstance(length, int), "Bad length: {}".format(length)
-
-        self.expected = type
-        self.expected_len = length
-        self.expected_args = args
-        self.expected_kwargs = kwargs
-
     def close(self):
         logger.info('[%s] Closing', self.id)
         self._broken = True
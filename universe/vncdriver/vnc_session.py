@@ -1,105 +1,265 @@
 import logging
+import threading
+import time
 
 from twisted.internet import defer, endpoints
+from twisted.python import threadpool
 
-from universe import error, utils
+from universe import error, twisty, utils
 from universe.twisty import reactor
 from universe.vncdriver import screen, vnc_client
 
 logger = logging.getLogger(__name__)
 
+# How many distinct event sequences to keep encodings for
+ENCODED_CACHE_SIZE = 1024
+
 class VNCSession(object):
-    def __init__(self, remotes, error_buffer):
-        self.remotes = remotes
-        self.error_buffer = error_buffer
+    """The pure-Python VNC driver, with the same interface as the Go
+    driver (go_vncdriver.VNCSession): connections are added and
+    removed by name, and step() takes actions and returns
+    observations, infos and errors as dicts keyed by name.
+    """
+
+    # VNCEnv passes a region of interest through to drivers which
+    # support one
+    supports_region = True
+    # vnc_kwargs which VNCEnv should pass to the constructor rather
+    # than to connect()
+    session_kwargs = ('decode_threads', 'observation_buffers')
+    # step() also takes each connection's events already encoded as
+    # client messages (see vnc_client.encode_events), which VNCEnv
+    # caches per action
+    accepts_encoded_actions = True
+
+    def __init__(self, decode_threads=None, observation_buffers=None):
+        """decode_threads: if set, decompress and decode ZRLE and Zlib
+        rectangles on a pool of this many threads, rather than on the
+        reactor thread. zlib and NumPy release the GIL, so with many
+        remotes one busy screen no longer holds up the others.
+
+        observation_buffers: if set, step() gathers the observations
+        into one preallocated (n, height, width, 3) array, alternating
+        between this many of them (see screen.ObservationBuffer), and
+        returns its rows. With 2, the previous step's observations
+        stay intact while the next are written. The array itself is
+        left in observation_batch, as (names, array), so callers can
+        use it without stacking the rows again.
+        """
+        twisty.start_once()
+
+        if decode_threads:
+            self.decode_pool = threadpool.ThreadPool(minthreads=0, maxthreads=decode_threads, name='vncdriver-decode')
+            self.decode_pool.start()
+        else:
+            self.decode_pool = None
+        self.observation_buffers = observation_buffers
+        self._observation_buffer = None
+        self._observation_names = None
+        self.observation_batch = None
+
+        # Shared by our screens, so we can wait on any of them
+        self.frame_ready = threading.Condition()
+        # Client factories by name, in the order they were connected.
+        # Each has a `client` once its connection is up.
+        self._factories = {}
+        self._names = []
+        self._encoded = utils.LRUCache(ENCODED_CACHE_SIZE)
         self._pyglet_screen = None
-        self.connect()
-
-    def connect(self):
-        utils.blockingCallFromThread(self._connect)
-
-    def _connect(self):
-        deferreds = []
-
-        for i, remote in enumerate(self.remotes):
-            d = defer.Deferred()
-            deferreds.append(d)
-
-            factory = vnc_client.client_factory(d, self.error_buffer)
-            factory.rewarder_session = self
-            factory.label = 'vnc:{}:{}'.format(i, remote)
-            endpoint = endpoints.clientFromString(reactor, 'tcp:'+remote)
-
-            def success(i):
-                logger.info('[%s] VNC connection established', factory.label)
-
-            def fail(reason):
-                reason = error.Error('[{}] Connection failed: {}'.format(factory.label, reason.value))
-                try:
-                    d.errback(utils.format_error(reason))
-                except defer.AlreadyCalledError:
-                    pass
-            endpoint.connect(factory).addCallback(success).addErrback(fail)
-
-        d = defer.DeferredList(deferreds, fireOnOneErrback=True)
-
-        def success(results):
-            # Store the _clients list when connected
-            self._clients = [client for success, client in results]
-        d.addCallback(success)
-        return d
-
-    def flip(self):
-        observation_n = []
-        info_n = []
-        for i, client in enumerate(self._clients):
-            observation, info = client.numpy_screen.flip()
-            updates = info['vnc_session.framebuffer_updates']
+        self._pyglet_name = None
+
+    def connect(self, name, address, password=None, encoding=None, compress_level=None, fine_quality_level=None, subsample_level=None, start_timeout=None, region=None):
+        """Start connecting to the VNC server at `address` (host:port).
+        Until the connection is up and has a first frame, step()
+        returns None as its observation.
+
+        encoding: preferred encodings, e.g. 'copy_rectangle,zrle,raw'
+        (see vnc_client.parse_encodings). Defaults to
+        vnc_client.DEFAULT_ENCODINGS.
+
+        compress_level, fine_quality_level, subsample_level: Tight
+        tuning, as for the Go driver (see vnc_client.tight_options).
+
+        start_timeout: how many seconds to keep retrying while the
+        server isn't up yet.
+
+        region: (x, y, width, height) to request updates for, if the
+        agent only looks at part of the screen. Observations keep the
+        full screen's shape.
+        """
+        if name in self._factories:
+            self.close(name)
+
+        encodings = vnc_client.parse_encodings(encoding) + \
+            vnc_client.tight_options(compress_level=compress_level, fine_quality_level=fine_quality_level, subsample_level=subsample_level)
+        d = defer.Deferred()
+        factory = vnc_client.client_factory(d, utils.ErrorBuffer(), encodings, region, self.decode_pool, self.frame_ready, password)
+        factory.label = 'vnc:{}:{}'.format(name, address)
+        factory.client = None
+
+        def success(client):
+            if self._factories.get(name) is not factory:
+                # Closed while we were connecting
+                client.close()
+                return
+            logger.info('[%s] VNC connection established', factory.label)
+            factory.client = client
+        # Failures go to the error buffer
+        d.addCallbacks(success, lambda reason: None)
 
-            # Keep the pyglet screen fed, but don't flip it until the user calls render
-            if i == 0 and self._pyglet_screen:
-                for update in updates:
-                    self._pyglet_screen.apply(update)
+        self._factories[name] = factory
+        self._names.append(name)
+        deadline = time.time() + (start_timeout or 0)
+        reactor.callFromThread(self._connect, name, address, factory, deadline)
 
-            observation_n.append(observation)
-            info_n.append({'vnc.updates.n': len(updates)})
+    def _connect(self, name, address, factory, deadline, attempt=0):
+        endpoint = endpoints.clientFromString(reactor, 'tcp:'+address)
 
-        return observation_n, info_n
+        def fail(reason):
+            if self._factories.get(name) is not factory:
+                # Closed while we were connecting
+                return
+            elapsed = deadline - time.time()
+            if elapsed > 0:
+                delay = min(2*attempt + 1, 10, elapsed)
+                logger.info('[%s] Waiting on VNC server: %s. Retry in %.0fs', factory.label, reason.value, delay)
+                reactor.callLater(delay, self._connect, name, address, factory, deadline, attempt+1)
+            else:
+                factory.error_buffer.record(error.Error('[{}] Connection failed: {}'.format(factory.label, reason.value)))
+        endpoint.connect(factory).addErrback(fail)
 
-    def peek(self):
-        observations = [client.numpy_screen.peek() for client in self._clients]
-        return observations
+    def wait_for_frame(self, timeout=None, policy='any'):
+        """Block until any (or with policy='all', every) connection has a
+        frame newer than it last returned, or `timeout` seconds pass.
+        Returns whether the frames arrived."""
+        screens = [client.numpy_screen for client in self._connected()]
+        if not screens:
+            if timeout is None:
+                raise error.Error('No VNC connections are up to wait for, so a timeout is required')
+            time.sleep(timeout)
+            return False
+        return screen.wait_for_frames(screens, self.frame_ready, timeout=timeout, policy=policy)
 
-    def step(self, action):
-        reactor.callFromThread(self._step, action)
+    def step(self, action_d):
+        """Send each connection's events from action_d, then return the
+        latest (observation_d, info_d, err_d)."""
+        if action_d:
+            reactor.callFromThread(self._step, action_d)
         return self.flip()
 
-    def _step(self, action):
+    def flip(self, wait=False, timeout=None, policy='any'):
+        """Return the latest (observation_d, info_d, err_d) without
+        sending anything. wait: first wait_for_frame(timeout, policy)."""
+        if wait:
+            self.wait_for_frame(timeout=timeout, policy=policy)
+
+        observation_d = {}
+        info_d = {}
+        err_d = {}
+        damage_d = {}
+        for name in self._names:
+            factory = self._factories[name]
+            try:
+                factory.error_buffer.check()
+            except Exception as e:
+                err_d[name] = e
+                continue
+
+            client = factory.client
+            if client is not None:
+                observation, info = client.numpy_screen.flip()
+            if client is None or info['vnc_session.frame_version'] == 0:
+                # No first frame yet
+                observation_d[name] = None
+                info_d[name] = {}
+                continue
+
+            updates = info['vnc_session.framebuffer_updates']
+            rectangles = [rectangle for update in updates for rectangle in update.rectangles]
+            observation_d[name] = observation
+            damage_d[name] = info['vnc_session.damage']
+            info_d[name] = {
+                'stats.vnc.updates.n': len(updates),
+                'stats.vnc.updates.rectangles': len(rectangles),
+                'stats.vnc.updates.pixels': sum(rectangle.width * rectangle.height for rectangle in rectangles),
+                'vnc.damage': info['vnc_session.damage'],
+            }
+
+        self.observation_batch = None
+        if self.observation_buffers and damage_d:
+            self._gather(observation_d, damage_d)
+        return observation_d, info_d, err_d
+
+    def _gather(self, observation_d, damage_d):
+        # Replace the observations with rows of the observation buffer
+        names = [name for name in self._names if name in damage_d]
+        if names != self._observation_names:
+            # Connections came or went, so the rows no longer line up
+            self._observation_buffer = screen.ObservationBuffer(len(names), count=self.observation_buffers)
+            self._observation_names = names
+        array = self._observation_buffer.update([observation_d[name] for name in names], [damage_d[name] for name in names])
+        for i, name in enumerate(names):
+            observation_d[name] = array[i]
+        self.observation_batch = names, array
+
+    def _step(self, action_d):
+        for name, events in action_d.items():
+            factory = self._factories.get(name)
+            if not events or factory is None or factory.client is None:
+                continue
+            try:
+                if not isinstance(events, bytes):
+                    events = self._encode(events)
+                factory.client.send_events(events)
+            except Exception as e:
+                factory.error_buffer.record(e)
+
+    def _encode(self, events):
+        # Agents tend to repeat a few event sequences (one per discrete
+        # action), so keep their encodings rather than packing them
+        # each step
         try:
-            for a, client in zip(action, self._clients):
-                for event in a:
-                    if event[0] == 'KeyEvent':
-                        key, down = event[1:]
-                        client.send_KeyEvent(key, down)
-                    elif event[0] == 'PointerEvent':
-                        x, y, buttomask = event[1:]
-                        client.send_PointerEvent(x, y, buttomask)
-                    else:
-                        raise error.Error('Bad event type: {}'.format(type))
-        except Exception as e:
-            self.error_buffer.record(e)
-
-    def render(self):
-        if not self._pyglet_screen:
-            start = self.peek()[0]
-            self._pyglet_screen = screen.PygletScreen(start)
+            key = tuple(events)
+            encoded = self._encoded.get(key)
+        except TypeError:
+            # Unhashable, e.g. events which came in as lists
+            return vnc_client.encode_events(events)
+
+        if encoded is None:
+            encoded = self._encoded[key] = vnc_client.encode_events(events)
+        return encoded
+
+    def _connected(self):
+        clients = [self._factories[name].client for name in self._names]
+        return [client for client in clients if client is not None and client.numpy_screen is not None]
+
+    def render(self, name):
+        factory = self._factories[name]
+        if factory.client is None or not factory.client.numpy_screen._has_initial_framebuffer_update:
+            return
+        pixels = factory.client.numpy_screen.peek()
+        if self._pyglet_screen is None or self._pyglet_name != name:
+            self._pyglet_screen = screen.PygletScreen(pixels)
+            self._pyglet_name = name
+        else:
+            height, width, _ = pixels.shape
+            self._pyglet_screen.update_rectangle(0, 0, width, height, pixels)
         self._pyglet_screen.flip()
 
-    def close(self):
-        utils.blockingCallFromThread(self._close)
+    def close(self, name=None):
+        if name is None:
+            names = list(self._names)
+        else:
+            names = [name]
 
-    def _close(self):
-        if getattr(self, '_clients', None) is not None:
-            for client in self._clients:
-                client.close()
-            self._clients = None
+        for n in names:
+            factory = self._factories.pop(n, None)
+            if factory is None:
+                continue
+            self._names.remove(n)
+            if factory.client is not None:
+                reactor.callFromThread(factory.client.close)
+
+        if name is None and self.decode_pool is not None:
+            self.decode_pool.stop()
+            self.decode_pool = None
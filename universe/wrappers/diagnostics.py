@@ -1,6 +1,7 @@
 import logging
 import six
 from universe import pyprofile, vectorized
+from universe.vectorized import columns
 
 logger = logging.getLogger(__name__)
 
@@ -14,4 +15,6 @@ class Diagnostics(vectorized.Wrapper):
         if self.unwrapped.diagnostics:
             with pyprofile.push('vnc_env.diagnostics.add_metadata'):
                 self.unwrapped.diagnostics.add_metadata(observation_n, info['n'])
+                if 'columns' in info:
+                    columns.pop(info['n'], columns.DIAGNOSTICS_STATS, info['columns'])
         return observation_n, reward_n, done_n, info
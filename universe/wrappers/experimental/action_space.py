@@ -67,7 +67,9 @@ class SoftmaxClickMouse(vectorized.ActionWrapper):
     Creates a Discrete action space of mouse clicks.
 
     This wrapper divides the active region into cells and creates an action for
-    each which clicks in the middle of the cell.
+    each which clicks in the middle of the cell. Actions are passed on as an
+    (n, 3) event array (see spaces.vnc_event), rather than as new PointerEvents
+    each step.
     """
     def __init__(self, env, active_region=(10, 75 + 50, 10 + 160, 75 + 210), discrete_mouse_step=10, noclick_regions=[]):
         super(SoftmaxClickMouse, self).__init__(env)
@@ -90,9 +92,11 @@ class SoftmaxClickMouse(vectorized.ActionWrapper):
                 self._points.append((xc, yc))
         logger.info('SoftmaxClickMouse noclick regions removed {} of {} actions'.format(removed, removed + len(self._points)))
         self.action_space = gym.spaces.Discrete(len(self._points))
+        self._action_array = spaces.event_batch([self._discrete_to_action(i) for i in range(len(self._points))])
 
     def _action(self, action_n):
-        return [self._discrete_to_action(int(i)) for i in action_n]
+        # Each action might be a length-1 np.array
+        return self._action_array[np.asarray(action_n, dtype=int).reshape(len(action_n))]
 
     def _discrete_to_action(self, i):
         xc, yc = self._points[i]
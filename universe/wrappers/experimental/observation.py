@@ -21,16 +21,24 @@ def CropObservations(env):
         return env
 
 class _CropObservations(vectorized.ObservationWrapper):
-    def __init__(self, env, height, width, x=0, y=0):
+    def __init__(self, env, height, width, x=0, y=0, request_region=False):
         super(_CropObservations, self).__init__(env)
         self.x = x
         self.y = y
         self.height = height
         self.width = width
+        self.request_region = request_region
 
         # modify observation_space? (if so, how to know depth and channels before we have seen the first frame?)
         # self.observation_space = Box(0, 255, shape=(height, width, 3))
 
+    def configure(self, vnc_kwargs=None, **kwargs):
+        if self.request_region:
+            # Don't have the VNC driver fetch pixels we'll throw away
+            vnc_kwargs = dict(vnc_kwargs or {})
+            vnc_kwargs.setdefault('region', (self.x, self.y, self.width, self.height))
+        self.env.configure(vnc_kwargs=vnc_kwargs, **kwargs)
+
     def _observation(self, observation_n):
         return [self._crop_frame(observation) for observation in observation_n]
 
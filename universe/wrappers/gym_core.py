@@ -47,9 +47,19 @@ class CropAtari(vectorized.ObservationWrapper):
 Crop the relevant portion of the monitor where an Atari enviroment resides.
 """
 
-    def __init__(self, env):
+    def __init__(self, env, request_region=False):
         super(CropAtari, self).__init__(env)
         self.observation_space = gym_spaces.Box(0, 255, shape=(ATARI_HEIGHT, ATARI_WIDTH, 3))
+        self.request_region = request_region
+
+    def configure(self, vnc_kwargs=None, **kwargs):
+        if self.request_region:
+            # Don't have the VNC driver fetch pixels we'll throw
+            # away. Off by default: renders, recordings and the
+            # diagnostics metadata all want the rest of the screen.
+            vnc_kwargs = dict(vnc_kwargs or {})
+            vnc_kwargs.setdefault('region', (0, 0, ATARI_WIDTH, ATARI_HEIGHT))
+        self.env.configure(vnc_kwargs=vnc_kwargs, **kwargs)
 
     def _observation(self, observation_n):
         return [{'vision': ob['vision'][:ATARI_HEIGHT, :ATARI_WIDTH, :]} for ob in observation_n]
@@ -1,5 +1,6 @@
 import gym
 import logging
+import numpy as np
 from universe import rewarder, spaces, vectorized
 
 logger = logging.getLogger(__name__)
@@ -36,10 +37,12 @@ class GymCoreSync(vectorized.Wrapper):
     def _step(self, action_n):
         # Add C keypress in order to "commit" the action, as
         # interpreted by the remote.
-        action_n = [action + [
+        commit = [
             spaces.KeyEvent.by_name('c', down=True),
             spaces.KeyEvent.by_name('c', down=False)
-        ] for action in action_n]
+        ]
+        action_n = [np.concatenate([action, spaces.event_array(commit)]) if isinstance(action, np.ndarray) else action + commit
+                    for action in action_n]
 
         observation_n, reward_n, done_n, info = self.env.step(action_n)
         if self.reward_n is not None:
@@ -6,6 +6,7 @@ import six
 import time
 
 from universe import vectorized
+from universe.vectorized import columns
 from universe.utils import display
 
 logger = logging.getLogger(__name__)
@@ -165,7 +166,8 @@ class Logger(vectorized.Wrapper):
             self.thinking_lag.append(action_available_at - last_step_time)
 
         # Saving of lags
-        for i, info_i in enumerate(info['n']):
+        for i in range(len(info['n'])):
+            info_i = columns.row(info, i)
             observation_lag = info_i.get('stats.gauges.diagnostics.lag.observation')
             if observation_lag is not None:
                 self.observation_lag_n[i].append(observation_lag)
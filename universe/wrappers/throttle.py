@@ -1,6 +1,7 @@
 import logging
 import time
 from universe import pyprofile, rewarder, spaces, vectorized
+from universe.vectorized import columns
 
 logger = logging.getLogger(__name__)
 
@@ -98,9 +99,9 @@ class Throttle(vectorized.Wrapper):
                 # best to present frames as they're ready to the
                 # diagnostics.)
                 delta = min(delta, 0.016)
-                pyprofile.timing('vnc_env.Throttle.sleep', delta)
-                accum_info['stats.throttle.sleep'] += delta
-                time.sleep(delta)
+                slept = self._sleep(delta)
+                pyprofile.timing('vnc_env.Throttle.sleep', slept)
+                accum_info['stats.throttle.sleep'] += slept
 
                 # We want to merge in the latest reward/done/info so that our
                 # agent has the most up-to-date info post-sleep, but also want
@@ -137,8 +138,21 @@ class Throttle(vectorized.Wrapper):
             if not self.skip_metadata and self.diagnostics is not None:
                 # Run (slow) diagnostics
                 self.diagnostics.add_metadata(observation_n, info['n'], available_at=available_at)
+                if 'columns' in info:
+                    columns.pop(info['n'], columns.DIAGNOSTICS_STATS, info['columns'])
             return observation_n, reward_n, done_n, info
 
+    def _sleep(self, delta):
+        """Sleep for up to delta seconds, waking early if a new frame
+        arrives (when the env can tell us). Returns the time slept."""
+        start = time.time()
+        wait_for_frame = getattr(self.unwrapped, 'wait_for_frame', None)
+        if wait_for_frame is not None:
+            wait_for_frame(timeout=delta)
+        else:
+            time.sleep(delta)
+        return time.time() - start
+
     def _start_timer(self):
         self._start = time.time()
         self._steps = 0